@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Per-folder account index from user.json and message_feedback.json
+
+Each CSN folder is the export of one survey account (uksurveycsnNN@gmail.com).
+The index reads every folder's user.json once and maps folder, account id
+and email to each other, so attributing a conversation, comparison or
+feedback record to its account is a dict lookup instead of a text scan.
+Feedback records are keyed by (conversation_id, message_id); a record's id
+is the id of the rated message.
+"""
+import json
+from collections import defaultdict, namedtuple
+
+from chatgpt_export import iter_json_records
+from export_sources import list_folders, open_file
+from ingest import find_files
+
+Account = namedtuple('Account', ['csn_folder', 'user_id', 'email', 'chatgpt_plus_user', 'birth_year', 'path'])
+Feedback = namedtuple('Feedback', ['message_id', 'conversation_id', 'user_id', 'csn_folder', 'rating', 'create_time'])
+
+
+class AccountIndex:
+    """Accounts by folder, account id and email, plus message feedback"""
+
+    def __init__(self, data_dir='data'):
+        self.by_folder = dict.fromkeys(folder for folder, _ in list_folders(data_dir))
+        self.by_user_id = {}
+        self.by_email = {}
+        self.feedback = {}                                   # (conversation_id, message_id) -> Feedback
+        self.feedback_by_conversation = defaultdict(list)    # conversation_id -> [Feedback]
+
+        # Nested copies (CSN1/csn1/) repeat the folder's files; the first wins
+        for csn_folder, path in find_files('user.json', data_dir):
+            if self.by_folder.get(csn_folder) is None:
+                self._add_account(csn_folder, path)
+
+        for csn_folder, path in find_files('message_feedback.json', data_dir):
+            for record in iter_json_records(path):
+                self._add_feedback(csn_folder, record)
+
+    def _add_account(self, csn_folder, path):
+        try:
+            with open_file(path, 'r') as f:
+                user = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"  Error reading {path}: {e}")
+            return
+
+        email = (user.get('email') or '').lower() or None
+        account = Account(csn_folder, user.get('id'), email, user.get('chatgpt_plus_user'),
+                          user.get('birth_year'), path)
+        self.by_folder[csn_folder] = account
+        if account.user_id:
+            self.by_user_id[account.user_id] = account
+        if email:
+            self.by_email[email] = account
+
+    def _add_feedback(self, csn_folder, record):
+        key = (record.get('conversation_id'), record.get('id'))
+        if key in self.feedback:
+            return
+        feedback = Feedback(record.get('id'), record.get('conversation_id'), record.get('user_id'),
+                            csn_folder, record.get('rating'), record.get('create_time'))
+        self.feedback[key] = feedback
+        self.feedback_by_conversation[feedback.conversation_id].append(feedback)
+
+    def account(self, csn_folder):
+        """Account of a CSN folder, or None if it has no readable user.json"""
+        return self.by_folder.get(csn_folder)
+
+    def folder_of_user(self, user_id):
+        account = self.by_user_id.get(user_id)
+        return account.csn_folder if account else None
+
+    def folder_of_email(self, email):
+        account = self.by_email.get(email.lower()) if email else None
+        return account.csn_folder if account else None
+
+    def feedback_for(self, conversation_id, message_id=None):
+        """Feedback on one message, or every feedback record of a conversation"""
+        if message_id is not None:
+            return self.feedback.get((conversation_id, message_id))
+        return self.feedback_by_conversation.get(conversation_id, [])
@@ -2,115 +2,174 @@
 """
 Analyze participant ID date patterns to identify missing data
 """
-import json
+import argparse
 from datetime import datetime
-from collections import defaultdict
-import re
-
-def parse_participant_id(pid):
-    """Parse participant ID to extract date, time, and sequence"""
-    match = re.match(r'(\d{2})(\d{2})(\d{4})_(\d{3,4})_(\d+)', pid)
-    if match:
-        day, month, year, time, seq = match.groups()
-        try:
-            # Parse the date
-            date_str = f"{year}-{month}-{day}"
-            date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-
-            # Parse time (handle both HHMM and HMM formats)
-            if len(time) == 3:
-                hour = int(time[0])
-                minute = int(time[1:])
-            else:
-                hour = int(time[:2])
-                minute = int(time[2:])
-
-            return {
-                'date': date_obj,
-                'day': int(day),
-                'month': int(month),
-                'year': int(year),
-                'hour': hour,
-                'minute': minute,
-                'sequence': int(seq),
-                'date_str': date_str,
-                'time_str': f"{hour:02d}:{minute:02d}"
-            }
-        except Exception as e:
-            print(f"Error parsing ID {pid}: {e}")
-            return None
-    return None
-
-def main():
-    # Load participant data
-    with open('all_participants.json', 'r') as f:
-        data = json.load(f)
-
-    participants = data['participants']
+
+import numpy as np
+
+import export_index
+import metrics
+from output_files import find_output, iter_records
+
+# Packed columns produced by parse_participant_ids, one row per ID
+ID_DTYPE = np.dtype([
+    ('day', 'u1'), ('month', 'u1'), ('year', 'u2'),
+    ('hour', 'u1'), ('minute', 'u1'), ('sequence', 'u4'),
+    ('date', 'M8[D]'),
+    ('malformed', '?'),   # 3-digit HMM time instead of HHMM
+    ('valid', '?'),
+])
+
+# Missing sequences are listed one by one up to this many per date, as ranges beyond
+MAX_LISTED_GAPS = 1000
+
+def parse_participant_ids(pids):
+    """Parse DDMMYYYY_HHMM_N IDs into a structured array in one pass
+
+    The IDs are laid out as a byte matrix and every field is decoded with
+    column arithmetic, so no per-ID regex or strptime is needed. Rows that
+    do not match the pattern or name an impossible date have valid=False.
+    """
+    pids = list(pids)
+    parsed = np.zeros(len(pids), dtype=ID_DTYPE)
+    if not pids:
+        return parsed
+
+    raw = np.array([pid.encode('ascii', 'replace') for pid in pids])
+    width = max(raw.dtype.itemsize, 16)
+    chars = raw.astype(f'S{width}').view(np.uint8).reshape(len(pids), width).astype(np.int64)
+    is_digit = (chars >= ord('0')) & (chars <= ord('9'))
+    digits = chars - ord('0')
+
+    def number(first, last):
+        value = np.zeros(len(pids), dtype=np.int64)
+        for col in range(first, last):
+            value = value * 10 + digits[:, col]
+        return value
+
+    # DDMMYYYY_ then a 3- or 4-digit time and another underscore
+    malformed = chars[:, 12] == ord('_')
+    time_end = np.where(malformed, 12, 13)
+    valid = is_digit[:, :8].all(axis=1) & (chars[:, 8] == ord('_')) & is_digit[:, 9:12].all(axis=1)
+    valid &= malformed | (is_digit[:, 12] & (chars[:, 13] == ord('_')))
+
+    # The sequence is the run of digits after the second underscore
+    cols = np.arange(width)
+    after = cols >= (time_end + 1)[:, None]
+    run = np.logical_and.accumulate(np.where(after, is_digit, True), axis=1) & after
+    seq_len = run.sum(axis=1)
+    place = np.where(run, time_end[:, None] + seq_len[:, None] - cols, 0)
+    sequence = (np.where(run, digits, 0) * 10 ** np.minimum(place, 18)).sum(axis=1)
+    valid &= (seq_len > 0) & (seq_len <= 9)
+
+    day, month, year = number(0, 2), number(2, 4), number(4, 8)
+    hour = np.where(malformed, digits[:, 9], number(9, 11))
+    minute = np.where(malformed, number(10, 12), number(11, 13))
+
+    # Reject impossible calendar dates (e.g. 31st of a 30-day month)
+    months = ((year - 1970) * 12 + np.clip(month, 1, 12) - 1).astype('M8[M]')
+    date = months.astype('M8[D]') + (day - 1)
+    valid &= (month >= 1) & (month <= 12) & (day >= 1) & (date.astype('M8[M]') == months)
+
+    parsed['day'], parsed['month'], parsed['year'] = day, month, year
+    parsed['hour'], parsed['minute'], parsed['sequence'] = hour, minute, sequence
+    parsed['date'] = np.where(valid, date, np.datetime64('NaT'))
+    parsed['malformed'] = malformed & valid
+    parsed['valid'] = valid
+    return parsed
+
+def format_gaps(starts, sizes, limit=MAX_LISTED_GAPS):
+    """List the numbers in the gaps, or their ranges if there are too many"""
+    starts, sizes = starts[sizes > 0], sizes[sizes > 0]
+    if sizes.sum() <= limit:
+        return np.concatenate([np.arange(start, start + size) for start, size in zip(starts, sizes)]).tolist()
+    return ', '.join(f"{start}-{start + size - 1}" if size > 1 else f"{start}"
+                     for start, size in zip(starts, sizes))
+
+def main(db_path=None, input_path=None):
+    # Load participant IDs and folders, from the SQLite export index when given
+    if db_path:
+        participants = export_index.load_participants(export_index.connect(db_path))
+        pids = list(participants.keys())
+        csn_folders = [participants[pid]['csn_folder'] for pid in pids]
+    else:
+        # Records are read one at a time and only the ID and folder are kept
+        pids, csn_folders = [], []
+        for record in iter_records(input_path or find_output('all_participants'),
+                                   'participants', key='participant_id'):
+            pids.append(record['participant_id'])
+            csn_folders.append(record['csn_folder'])
+    metrics.checkpoint('load')
 
     print("="*80)
     print("PARTICIPANT ID DATE ANALYSIS")
     print("="*80)
 
-    # Analyze date distributions
-    dates = defaultdict(list)
-    date_csn = defaultdict(lambda: defaultdict(list))
-    sequences_by_date = defaultdict(set)
-
-    for pid in participants.keys():
-        parsed = parse_participant_id(pid)
-        if parsed:
-            date_str = parsed['date_str']
-            dates[date_str].append(pid)
-            date_csn[date_str][participants[pid]['csn_folder']].append(pid)
-            sequences_by_date[date_str].add(parsed['sequence'])
+    parsed = parse_participant_ids(pids)
+    metrics.count('ids_parsed', len(pids))
+    metrics.count('ids_invalid', int((~parsed['valid']).sum()))
+    metrics.checkpoint('parse')
+    for pid in np.array(pids, dtype=object)[~parsed['valid']]:
+        print(f"Error parsing ID {pid}: not a valid DDMMYYYY_HHMM_N ID")
+
+    valid = parsed[parsed['valid']]
+    csn = np.array(csn_folders, dtype=str)[parsed['valid']]
+
+    # Group by date: dates are sorted, date_idx maps each ID to its date
+    dates, date_idx, date_counts = np.unique(valid['date'], return_inverse=True, return_counts=True)
+    sequences = valid['sequence'].astype(np.int64)
+    max_seq = np.zeros(len(dates), dtype=np.int64)
+    np.maximum.at(max_seq, date_idx, sequences)
+
+    # Distinct (date, sequence) pairs in order; a gap is the run of numbers
+    # between a sequence and the previous one on the same date (or 0)
+    stride = int(max_seq.max(initial=0)) + 1
+    pairs = np.unique(date_idx * stride + sequences)
+    pair_date, pair_seq = pairs // stride, pairs % stride
+    first_of_date = np.diff(pair_date, prepend=-1) != 0
+    gap_start = np.where(first_of_date, 1, np.r_[0, pair_seq[:-1]] + 1)
+    gap_size = np.maximum(pair_seq - gap_start, 0)
+    present_count = np.bincount(pair_date, minlength=len(dates))
+    missing_count = np.bincount(pair_date, weights=gap_size, minlength=len(dates)).astype(np.int64)
+    date_bounds = np.flatnonzero(first_of_date)[1:]
+
+    csn_names, csn_idx = np.unique(csn, return_inverse=True)
+    csn_counts = np.bincount(date_idx * len(csn_names) + csn_idx,
+                             minlength=len(dates) * len(csn_names)).reshape(len(dates), len(csn_names))
+
+    date_strs = np.datetime_as_string(dates, unit='D')
 
     print(f"\nParticipants by date:")
-    for date_str in sorted(dates.keys()):
-        count = len(dates[date_str])
-        seqs = sorted(sequences_by_date[date_str])
-        max_seq = max(seqs) if seqs else 0
-        print(f"  {date_str}: {count:3d} participants (seq 1-{max_seq})")
+    for i, date_str in enumerate(date_strs):
+        print(f"  {date_str}: {date_counts[i]:3d} participants (seq 1-{max_seq[i]})")
 
         # Show CSN distribution for this date
-        csn_dist = date_csn[date_str]
-        csn_summary = ", ".join([f"{csn}:{len(pids)}" for csn, pids in sorted(csn_dist.items())])
+        csn_summary = ", ".join([f"{csn_names[j]}:{csn_counts[i, j]}" for j in np.flatnonzero(csn_counts[i])])
         print(f"    CSN distribution: {csn_summary}")
 
     # Analyze sequence numbers
     print(f"\nSequence number analysis:")
-    all_sequences = defaultdict(lambda: defaultdict(list))
-
-    for pid in participants.keys():
-        parsed = parse_participant_id(pid)
-        if parsed:
-            key = f"{parsed['date_str']}"
-            all_sequences[key][parsed['sequence']].append(pid)
-
-    for date_str in sorted(all_sequences.keys()):
-        seqs = all_sequences[date_str]
-        max_seq = max(seqs.keys())
-        missing_seqs = [s for s in range(1, max_seq + 1) if s not in seqs]
-
+    for i, (date_str, seqs, starts, sizes) in enumerate(zip(
+            date_strs, np.split(pair_seq, date_bounds),
+            np.split(gap_start, date_bounds), np.split(gap_size, date_bounds))):
         print(f"\n  {date_str}:")
-        print(f"    Sequences present: {sorted(seqs.keys())}")
-        if missing_seqs:
-            print(f"    Missing sequences: {missing_seqs}")
-            print(f"    Missing count: {len(missing_seqs)}")
+        print(f"    Sequences present: {seqs.tolist()}")
+        if missing_count[i]:
+            print(f"    Missing sequences: {format_gaps(starts, sizes)}")
+            print(f"    Missing count: {missing_count[i]}")
 
     # Estimate total expected participants
     print(f"\n{'='*80}")
     print(f"MISSING DATA ANALYSIS")
     print(f"{'='*80}")
 
-    total_present = len(participants)
+    total_present = len(pids)
     print(f"Participants found: {total_present}")
 
     # Check for date gaps
-    if dates:
-        all_dates = sorted(dates.keys())
-        first_date = datetime.strptime(all_dates[0], "%Y-%m-%d")
-        last_date = datetime.strptime(all_dates[-1], "%Y-%m-%d")
+    if len(dates):
+        first_date = dates[0].astype(datetime)
+        last_date = dates[-1].astype(datetime)
 
         print(f"\nDate range in data:")
         print(f"  First: {first_date.strftime('%Y-%m-%d %A')}")
@@ -118,40 +177,27 @@ def main():
         print(f"  Duration: {(last_date - first_date).days + 1} days")
 
         # Check for missing dates
-        current_date = first_date
-        all_dates_set = set(all_dates)
-        missing_dates = []
-
-        while current_date <= last_date:
-            date_str = current_date.strftime("%Y-%m-%d")
-            if date_str not in all_dates_set:
-                missing_dates.append(date_str)
-            current_date += timedelta(days=1)
+        missing_dates = np.setdiff1d(np.arange(dates[0], dates[-1] + 1), dates)
 
-        if missing_dates:
+        if len(missing_dates):
             print(f"\nMissing dates within range:")
-            for md in missing_dates:
+            for md in np.datetime_as_string(missing_dates, unit='D'):
                 print(f"  - {md}")
 
     # Analyze maximum sequence numbers to estimate total participants per date
+    # If sequences go to N, we expect N participants
     print(f"\nEstimated missing participants:")
-    estimated_total = 0
-
-    for date_str in sorted(all_sequences.keys()):
-        seqs = all_sequences[date_str]
-        max_seq = max(seqs.keys())
-        present_count = len(seqs)
-        estimated_for_date = max_seq  # If sequences go to N, we expect N participants
-
-        missing_for_date = estimated_for_date - present_count
-        estimated_total += estimated_for_date
+    missing_for_date = max_seq - present_count
+    estimated_total = int(max_seq.sum())
 
-        if missing_for_date > 0:
-            print(f"  {date_str}: {present_count}/{estimated_for_date} participants (missing: {missing_for_date})")
+    for i in np.flatnonzero(missing_for_date > 0):
+        print(f"  {date_strs[i]}: {present_count[i]}/{max_seq[i]} participants (missing: {missing_for_date[i]})")
 
     print(f"\nEstimated total participants (based on sequence numbers): {estimated_total}")
     print(f"Actual participants found: {total_present}")
     print(f"Missing participants: {estimated_total - total_present}")
+    if parsed['malformed'].any():
+        print(f"IDs with a 3-digit time (HMM): {int(parsed['malformed'].sum())}")
 
     print(f"\n{'='*80}")
     print(f"LIKELY CAUSE OF DATA LOSS")
@@ -165,7 +211,17 @@ def main():
     print(f"  - Incomplete data collection")
     print(f"  - Data corruption or partial file")
     print(f"  - Missing CSN folders or files")
+    metrics.checkpoint('report')
 
 if __name__ == '__main__':
-    from datetime import timedelta
-    main()
+    parser = argparse.ArgumentParser(description='Analyze participant ID date patterns')
+    parser.add_argument('--db', help='read participants from this SQLite export index '
+                                     'instead of all_participants.json')
+    parser.add_argument('--input', help='participants file to read (default: the newest '
+                                        'all_participants.* result file)')
+    metrics.add_argument(parser, 'analyze_date_patterns')
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable(args.metrics)
+
+    main(db_path=args.db, input_path=args.input)
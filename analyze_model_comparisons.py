@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Analyze model comparisons: which of two completions participants preferred
+
+Every CSN folder's model_comparisons.json holds the side-by-side ratings
+collected in its conversations. The records are streamed once into an
+index by conversation_id, which is then hash-joined to the export's
+conversation ids (from the shared corpus, or the all_conversations_detailed.*
+file of deep_analysis_all_conversations) and to the participants of
+all_participants.* (by the conversation ids in their records), so every
+input is read in a single linear pass. Counts are reported per participant and per CSN folder,
+together with the side (left/right) of the completion that was chosen.
+"""
+import argparse
+import json
+from collections import defaultdict
+from datetime import datetime
+
+import metrics
+import participant_records
+from chatgpt_export import iter_json_records
+from ingest import find_files
+from output_files import find_output, iter_records, read_records
+from participant_key import sort_key
+
+# completion_comparison_rating values: 'new' and 'original' name the
+# preferred completion, 'skip' means no preference was given
+RATINGS = ['new', 'original', 'skip']
+
+def chosen_side(rating, new_placement):
+    """Side of the preferred completion; None when skipped or unknown"""
+    if rating == 'new':
+        return new_placement
+    if rating == 'original':
+        return {'left': 'right', 'right': 'left'}.get(new_placement)
+    return None
+
+def iter_comparisons(data_dir='data'):
+    """Yield (csn_folder, record) for every comparison, streamed file by file"""
+    for csn_folder, path in find_files('model_comparisons.json', data_dir):
+        for record in iter_json_records(path):
+            yield csn_folder, record
+
+def index_comparisons(data_dir='data'):
+    """Return ({conversation_id: [comparison]}, duplicate copies skipped)
+
+    Nested folder copies (CSN1/csn1/) repeat records; they are kept once by
+    comparison id.
+    """
+    by_conversation = defaultdict(list)
+    seen = set()
+    duplicates = 0
+
+    for csn_folder, record in iter_comparisons(data_dir):
+        comparison_id = record.get('id')
+        if comparison_id is not None:
+            if comparison_id in seen:
+                duplicates += 1
+                continue
+            seen.add(comparison_id)
+
+        feedback = ((record.get('content') or {}).get('output') or {}).get('feedback_step_2') or {}
+        rating = feedback.get('completion_comparison_rating')
+        placement = feedback.get('new_completion_placement')
+        by_conversation[record.get('conversation_id')].append({
+            'csn_folder': csn_folder,
+            'rating': rating,
+            'side': chosen_side(rating, placement)
+        })
+        metrics.count('comparisons_read')
+
+    return by_conversation, duplicates
+
+def exported_conversation_ids(corpus=None, path=None):
+    """Ids of every conversation in the export
+
+    Taken from the shared corpus when given, otherwise from the
+    all_conversations_detailed.* file of deep_analysis_all_conversations, so
+    the export is not parsed again just to test membership.
+    """
+    if corpus is not None:
+        return {item.key for item in corpus}
+    return {record['conversation_id'] for record in iter_records(path, 'conversations')}
+
+def index_participants(path):
+    """Return {conversation_id: [participant_id]} from a participants file"""
+    schema, records = read_records(path, 'participants', key='participant_id')
+    if participant_records.schema_version(schema) < 3:
+        print(f"  {path} has no conversation ids; re-run extract_all_participants.py "
+              f"to attribute comparisons to participants")
+        return {}
+
+    by_conversation = defaultdict(list)
+    for record in records:
+        for conv in record['conversations']:
+            by_conversation[conv['id']].append(record['participant_id'])
+    return by_conversation
+
+def new_stats():
+    return {'comparisons': 0, 'new': 0, 'original': 0, 'skip': 0, 'chose_left': 0, 'chose_right': 0}
+
+def add_comparison(stats, comparison):
+    """Count one comparison into a stats dict"""
+    stats['comparisons'] += 1
+    if comparison['rating'] in RATINGS:
+        stats[comparison['rating']] += 1
+    if comparison['side'] in ('left', 'right'):
+        stats['chose_' + comparison['side']] += 1
+
+def describe(stats):
+    decided = stats['chose_left'] + stats['chose_right']
+    left_share = f"{stats['chose_left'] / decided:.0%}" if decided else 'n/a'
+    return (f"{stats['comparisons']:3d} comparisons (new {stats['new']}, original {stats['original']}, "
+            f"skip {stats['skip']}; chose left {left_share})")
+
+def main(corpus=None, input_path=None, conversations_path=None):
+    print("="*80)
+    print("MODEL COMPARISON ANALYSIS")
+    print("="*80)
+
+    data_dir = 'data'
+
+    # Pass 1: stream every comparison into the conversation_id index
+    comparisons, duplicates = index_comparisons(data_dir)
+    total = sum(len(c) for c in comparisons.values())
+    print(f"\nRead {total} comparisons on {len(comparisons)} conversations "
+          f"({duplicates} duplicate copies skipped)")
+
+    # Pass 2: the ids of the export's conversations, already loaded or extracted
+    if corpus is None:
+        conversations_path = conversations_path or find_output('all_conversations_detailed')
+    exported = exported_conversation_ids(corpus, conversations_path)
+
+    # Pass 3: participants by conversation id, from the extraction step
+    input_path = input_path or find_output('all_participants')
+    participants_by_conversation = index_participants(input_path)
+    metrics.checkpoint('load')
+
+    # Hash join: one dict lookup per side for every indexed conversation
+    overall = new_stats()
+    by_csn = defaultdict(new_stats)
+    by_participant = defaultdict(new_stats)
+    participants_by_csn = defaultdict(set)
+    not_in_export = []
+    without_participant = 0
+
+    for conv_id, conv_comparisons in comparisons.items():
+        if conv_id not in exported:
+            not_in_export.append(conv_id)
+        pids = participants_by_conversation.get(conv_id, ())
+        if not pids:
+            without_participant += len(conv_comparisons)
+
+        for comparison in conv_comparisons:
+            add_comparison(overall, comparison)
+            add_comparison(by_csn[comparison['csn_folder']], comparison)
+            participants_by_csn[comparison['csn_folder']].update(pids)
+            for pid in pids:
+                add_comparison(by_participant[pid], comparison)
+    metrics.checkpoint('join')
+
+    print(f"\n{'='*80}")
+    print(f"RESULTS")
+    print(f"{'='*80}")
+    print(f"Overall: {describe(overall)}")
+    print(f"Comparisons on conversations not in the export: "
+          f"{sum(len(comparisons[c]) for c in not_in_export)}")
+    print(f"Comparisons without a participant ID: {without_participant}")
+    print(f"Participants with comparisons: {len(by_participant)}")
+
+    print(f"\nComparisons by CSN folder:")
+    for csn in sorted(by_csn.keys()):
+        print(f"  {csn}: {describe(by_csn[csn])}, {len(participants_by_csn[csn])} participants")
+
+    print(f"\nComparisons by participant:")
+    for pid in sorted(by_participant.keys(), key=sort_key):
+        print(f"  {pid:25s} {describe(by_participant[pid])}")
+    metrics.checkpoint('report')
+
+    output = {
+        'analysis_date': datetime.now().isoformat(),
+        'participants_file': input_path,
+        'total_comparisons': total,
+        'duplicate_copies': duplicates,
+        'conversations_with_comparisons': len(comparisons),
+        'conversations_not_in_export': sorted(not_in_export, key=str),
+        'comparisons_without_participant': without_participant,
+        'overall': overall,
+        'by_csn': {
+            csn: dict(by_csn[csn], participants=len(participants_by_csn[csn]))
+            for csn in sorted(by_csn.keys())
+        },
+        'by_participant': {pid: by_participant[pid] for pid in sorted(by_participant.keys(), key=sort_key)}
+    }
+
+    output_file = 'model_comparisons_analysis.json'
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(output, f, indent=2, ensure_ascii=False)
+    metrics.checkpoint('write')
+
+    print(f"\nDetailed analysis saved to: {output_file}")
+    return output
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Join model comparisons to participants and CSN folders')
+    parser.add_argument('--input', help='participants file to join with (default: the newest '
+                                        'all_participants.* result file)')
+    parser.add_argument('--conversations', help='conversations of the export (default: the newest '
+                                                'all_conversations_detailed.* result file)')
+    metrics.add_argument(parser, 'analyze_model_comparisons')
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable(args.metrics)
+
+    main(input_path=args.input, conversations_path=args.conversations)
@@ -2,109 +2,90 @@
 """
 Analyze participant data from ChatGPT conversations
 """
+import argparse
 import json
-import os
 from collections import defaultdict
 from datetime import datetime
-import re
+
+import metrics
+from conversation_thread import ThreadCache
+from ingest import ConversationIngest
+from participant_id_scanner import first_participant_id
+from participant_key import sort_key
 
 def extract_participant_id(text):
     """Extract participant ID from conversation text"""
-    patterns = [
-        r'my id is (\d{8}_\d{4}_\d+)',
-        r'My ID is (\d{8}_\d{4}_\d+)',
-        r'ID is (\d{8}_\d{4}_\d+)',
-        r'(\d{8}_\d{4}_\d+)',
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            return match.group(1)
+    return first_participant_id(text)
+
+def first_id_in_thread(parts):
+    for part in parts:
+        participant_id = extract_participant_id(part.text)
+        if participant_id:
+            return participant_id
     return None
 
-def analyze_conversations():
-    """Analyze all conversation files"""
+def analyze_conversations(corpus=None):
+    """Analyze all conversations"""
     participants = {}
     conversations_by_id = defaultdict(list)
     all_timestamps = []
 
     data_dir = 'data'
 
-    # Find all conversations.json files
-    for root, dirs, files in os.walk(data_dir):
-        if 'conversations.json' in files:
-            filepath = os.path.join(root, 'conversations.json')
-            csn_folder = os.path.basename(os.path.dirname(filepath))
-
-            print(f"Processing: {filepath}")
-
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    if not content.strip():
-                        print(f"  Empty file: {filepath}")
-                        continue
-
-                    conversations = json.loads(content)
-
-                    for conv in conversations:
-                        create_time = conv.get('create_time', 0)
-                        update_time = conv.get('update_time', 0)
-                        title = conv.get('title', '')
-                        conv_id = conv.get('conversation_id', conv.get('id', ''))
-
-                        all_timestamps.append(create_time)
-
-                        # Extract participant ID from conversation
-                        participant_id = None
-                        mapping = conv.get('mapping', {})
-
-                        for node_id, node_data in mapping.items():
-                            message = node_data.get('message')
-                            if message:
-                                content_obj = message.get('content', {})
-                                parts = content_obj.get('parts', [])
-
-                                for part in parts:
-                                    if isinstance(part, str):
-                                        pid = extract_participant_id(part)
-                                        if pid:
-                                            participant_id = pid
-                                            break
-
-                                if participant_id:
-                                    break
-
-                        if participant_id:
-                            if participant_id not in participants:
-                                participants[participant_id] = {
-                                    'csn_folder': csn_folder,
-                                    'first_seen': create_time,
-                                    'conversations': []
-                                }
-
-                            participants[participant_id]['conversations'].append({
-                                'title': title,
-                                'create_time': create_time,
-                                'update_time': update_time,
-                                'id': conv_id
-                            })
-                            conversations_by_id[participant_id].append(conv)
-
-            except json.JSONDecodeError as e:
-                print(f"  JSON error in {filepath}: {e}")
-            except Exception as e:
-                print(f"  Error processing {filepath}: {e}")
+    # Every unique conversation, from the shared corpus when given
+    conversations = corpus if corpus is not None else ConversationIngest(data_dir)
+    threads = corpus.threads if corpus is not None else ThreadCache()
+    current_path = None
+
+    for item in conversations:
+        if item.path != current_path:
+            current_path = item.path
+            print(f"Processing: {current_path}")
+
+        conv = item.conversation
+        csn_folder = item.csn_folder
+        create_time = conv.get('create_time', 0)
+        update_time = conv.get('update_time', 0)
+        title = conv.get('title', '')
+        conv_id = conv.get('conversation_id', conv.get('id', ''))
+
+        all_timestamps.append(create_time)
+
+        # First ID in message order on the thread the participant ended
+        # on; an ID only typed on an edited-away branch still counts
+        with metrics.stage('scan'):
+            participant_id = first_id_in_thread(threads.thread(conv))
+            if not participant_id:
+                for branch in threads.branches(conv):
+                    participant_id = first_id_in_thread(branch)
+                    if participant_id:
+                        break
+
+        if participant_id:
+            if participant_id not in participants:
+                participants[participant_id] = {
+                    'csn_folder': csn_folder,
+                    'first_seen': create_time,
+                    'conversations': []
+                }
+
+            participants[participant_id]['conversations'].append({
+                'title': title,
+                'create_time': create_time,
+                'update_time': update_time,
+                'id': conv_id
+            })
+            conversations_by_id[participant_id].append(conv)
 
     return participants, all_timestamps, conversations_by_id
 
-def main():
+def main(corpus=None):
     print("="*80)
     print("ANALYZING PARTICIPANT DATA")
     print("="*80)
 
-    participants, all_timestamps, conversations_by_id = analyze_conversations()
+    participants, all_timestamps, conversations_by_id = analyze_conversations(corpus)
+    metrics.checkpoint('extract')
 
     print(f"\n{'='*80}")
     print(f"SUMMARY")
@@ -131,13 +112,15 @@ def main():
     for csn in sorted(csn_groups.keys()):
         print(f"  {csn}: {len(csn_groups[csn])} participants")
 
+    metrics.checkpoint('report')
+
     # Save detailed participant data
     output = {
         'total_participants': len(participants),
         'participants': {}
     }
 
-    for pid, pdata in sorted(participants.items()):
+    for pid, pdata in sorted(participants.items(), key=lambda item: sort_key(item[0])):
         output['participants'][pid] = {
             'csn_folder': pdata['csn_folder'],
             'num_conversations': len(pdata['conversations']),
@@ -153,14 +136,21 @@ def main():
 
     with open('participant_analysis.json', 'w', encoding='utf-8') as f:
         json.dump(output, f, indent=2, ensure_ascii=False)
+    metrics.checkpoint('write')
 
     print(f"\nDetailed analysis saved to: participant_analysis.json")
 
     # List first 20 participants
     print(f"\nFirst 20 participant IDs:")
-    for i, pid in enumerate(sorted(participants.keys())[:20], 1):
+    for i, pid in enumerate(sorted(participants.keys(), key=sort_key)[:20], 1):
         pdata = participants[pid]
         print(f"  {i}. {pid} ({pdata['csn_folder']}, {len(pdata['conversations'])} conversations)")
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Find the first stated participant ID in every conversation')
+    metrics.add_argument(parser, 'analyze_participants')
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable(args.metrics)
+
     main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Benchmark the extraction stages and scripts against an export
+
+Two kinds of measurement go into one JSON report:
+
+- stages: the extraction broken into walk (find sources), parse (decode and
+  deduplicate every conversation), scan (participant-ID regex over message
+  text), merge (participant records) and write (JSON output), timed in this
+  process with peak RSS after each stage; parse, scan and merge stream
+  through the export together and are timed cumulatively
+- scripts: each analysis script run end to end in its own process, in
+  pipeline order, with wall time, CPU time and peak RSS of that process,
+  plus the stage timings and counters the script records with --metrics
+
+Scripts run in a scratch directory whose data/ points at --data-dir, with
+--no-cache where supported (build for the search index) so every run
+parses from scratch. Reports from
+different commits or export sizes can be compared with --compare.
+
+Usage:
+    python benchmark.py [--data-dir data] [--output benchmark_report.json]
+    python benchmark.py --generate 100000         # synthetic export in a temp dir
+    python benchmark.py --compare old_report.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import metrics
+from chatgpt_export import iter_message_parts
+from extract_all_participants import extract_participant_ids_from_text
+from ingest import ConversationIngest, find_sources
+from participant_key import sort_key
+from participant_records import ParticipantStore
+from synthetic_export import generate_export
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Scripts in pipeline order, with the arguments for a cold run
+SCRIPTS = [
+    ('extract_all_participants', ['--no-cache']),
+    ('extract_all_possible_participants', ['--no-cache']),
+    ('deep_analysis_all_conversations', ['--no-cache']),
+    ('analyze_participants', []),
+    ('analyze_date_patterns', []),
+    ('create_final_dataset', []),
+    ('analyze_model_comparisons', []),
+    ('near_duplicates', ['--no-cache']),
+    ('session_slots', []),
+    ('session_timeline', ['--no-cache']),
+    ('message_columns', []),
+    ('search_index', ['build']),
+]
+
+
+def benchmark_stages(data_dir):
+    """Time the extraction stages in this process; returns (stages, corpus stats)
+
+    Stages are timed with the metrics module, exactly like the scripts'
+    --metrics stages. Like the scripts, parse, scan and merge stream through
+    the export one conversation at a time, so only the participant store is
+    held in memory; their times are summed over all conversations and their
+    peak RSS is taken once the stream is done.
+    """
+    metrics.enable()
+    peaks = {}
+
+    with metrics.stage('walk'):
+        sources = find_sources(data_dir)
+    peaks['walk'] = metrics.peak_rss_kb()
+
+    ingest = ConversationIngest(data_dir)
+    conversations = iter(ingest)
+    store = ParticipantStore()
+    count = 0
+    while True:
+        with metrics.stage('parse'):
+            item = next(conversations, None)
+        if item is None:
+            break
+        count += 1
+
+        with metrics.stage('scan'):
+            ids = set()
+            for part in iter_message_parts(item.conversation):
+                ids |= extract_participant_ids_from_text(part.text)
+
+        with metrics.stage('merge'):
+            conv = item.conversation
+            for pid in ids:
+                store.add_conversation(pid, item.key, conv.get('title', ''), conv.get('create_time') or 0,
+                                       conv.get('update_time') or 0, item.path, item.csn_folder)
+    peaks['parse'] = peaks['scan'] = peaks['merge'] = metrics.peak_rss_kb()
+
+    def write():
+        output = {
+            pid: {'csn_folder': store[pid].csn_folder, 'conversations': store.conversations_of(pid)}
+            for pid in sorted(store.keys(), key=sort_key)
+        }
+        with tempfile.TemporaryFile('w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2, ensure_ascii=False)
+    with metrics.stage('write'):
+        write()
+    peaks['write'] = metrics.peak_rss_kb()
+
+    corpus = {
+        'sources': len(sources),
+        'source_bytes': sum(source.size for source in sources),
+        'conversations': count,
+        'duplicates': ingest.duplicates,
+        'participants': len(store)
+    }
+    stages = {
+        name: {'wall_s': round(stats['wall_s'], 4), 'cpu_s': round(stats['cpu_s'], 4), 'max_rss_kb': peaks[name]}
+        for name, stats in metrics.report()['stages'].items() if name in peaks
+    }
+    return stages, corpus
+
+
+def run_script(name, args, work_dir):
+    """Run one script in work_dir; returns wall/CPU time, peak RSS, exit code
+    and the stage timings and counters the script recorded with --metrics"""
+    metrics_file = os.path.join(work_dir, name + '_metrics.json')
+    # --metrics goes first: it belongs to the top-level parser of scripts with subcommands
+    command = [sys.executable, os.path.join(SCRIPT_DIR, name + '.py'), '--metrics', metrics_file] + args
+
+    with open(os.path.join(work_dir, name + '.log'), 'w') as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, cwd=work_dir, stdout=log, stderr=subprocess.STDOUT)
+        # wait4 reports the CPU time of this child alone
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    try:
+        with open(metrics_file, 'r', encoding='utf-8') as f:
+            script_metrics = json.load(f)
+    except (OSError, ValueError):
+        script_metrics = {}
+
+    # The script's own peak (VmHWM on Linux); ru_maxrss from wait4 also
+    # covers this process's memory from before the child's exec
+    rss = script_metrics.get('max_rss_kb')
+    if rss is None:
+        rss = metrics.max_rss_kb(usage)
+
+    return {
+        'wall_s': round(wall, 4),
+        'cpu_s': round(usage.ru_utime + usage.ru_stime, 4),
+        'max_rss_kb': rss,
+        'exit_code': process.returncode,
+        'stages': script_metrics.get('stages', {}),
+        'counters': script_metrics.get('counters', {})
+    }
+
+
+def benchmark_scripts(data_dir, names):
+    """Run the selected scripts in pipeline order in a scratch directory"""
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix='benchmark_')
+    os.symlink(os.path.abspath(data_dir), os.path.join(work_dir, 'data'))
+    for name, args in SCRIPTS:
+        if name in names:
+            print(f"  running {name}...")
+            results[name] = run_script(name, args, work_dir)
+            if results[name]['exit_code'] != 0:
+                # Later scripts depend on this one's output; keep the log
+                print(f"    exited with {results[name]['exit_code']}; "
+                      f"see {os.path.join(work_dir, name + '.log')}")
+                return results
+
+    shutil.rmtree(work_dir)
+    return results
+
+
+def compare_reports(old, new):
+    """Print new/old ratios for every stage and script present in both reports"""
+    print(f"\nCompared with {old.get('created')} ({old.get('corpus', {}).get('conversations')} conversations):")
+    for section in ('stages', 'scripts'):
+        for name, result in new.get(section, {}).items():
+            before = old.get(section, {}).get(name)
+            if not before:
+                continue
+            ratios = []
+            for metric in ('wall_s', 'max_rss_kb'):
+                if before.get(metric):
+                    ratios.append(f"{metric} {result[metric] / before[metric]:.2f}x")
+            print(f"  {section[:-1]} {name:36s} {', '.join(ratios)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark extraction stages and analysis scripts')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--generate', type=int, metavar='N',
+                        help='benchmark a synthetic export of N conversations instead of --data-dir')
+    parser.add_argument('--seed', type=int, default=0, help='seed for --generate')
+    parser.add_argument('--scripts', nargs='*', default=[name for name, _ in SCRIPTS],
+                        help='scripts to run end to end (default: all; none with no names)')
+    parser.add_argument('--output', default='benchmark_report.json')
+    parser.add_argument('--compare', help='earlier report to compare against')
+    args = parser.parse_args()
+
+    data_dir = args.data_dir
+    generated = None
+    if args.generate:
+        generated = data_dir = tempfile.mkdtemp(prefix='synthetic_export_')
+        start = time.perf_counter()
+        generate_export(data_dir, args.generate, seed=args.seed)
+        print(f"Generated {args.generate} conversations in {time.perf_counter() - start:.1f}s")
+
+    try:
+        print(f"Timing stages on {data_dir}...")
+        stages, corpus = benchmark_stages(data_dir)
+        for name, result in stages.items():
+            print(f"  {name:6s} {result['wall_s']:9.3f}s wall {result['cpu_s']:9.3f}s cpu "
+                  f"{result['max_rss_kb'] / 1024:8.1f} MB peak")
+
+        print(f"Running scripts...")
+        scripts = benchmark_scripts(data_dir, args.scripts)
+        for name, result in scripts.items():
+            print(f"  {name:36s} {result['wall_s']:9.3f}s wall {result['cpu_s']:9.3f}s cpu "
+                  f"{result['max_rss_kb'] / 1024:8.1f} MB peak")
+    finally:
+        if generated:
+            shutil.rmtree(generated)
+
+    report = {
+        'created': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'data_dir': 'synthetic' if generated else data_dir,
+        'generated': {'conversations': args.generate, 'seed': args.seed} if generated else None,
+        'corpus': corpus,
+        'stages': stages,
+        'scripts': scripts
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport saved to: {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare_reports(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Helpers for reading ChatGPT data exports (conversations.json / chat.html)
+
+Paths may point into a zipped export (see export_sources); such files are
+streamed out of the archive instead of memory-mapped.
+"""
+import io
+import json
+import mmap
+import os
+import re
+from collections import namedtuple
+
+from export_sources import open_file, split_archive
+
+# Characters read per refill of the streaming array reader
+CHUNK_SIZE = 1 << 16
+
+# chat.html embeds the export as `var jsonData = [...]` in a script tag
+JSON_DATA_MARKER = b'var jsonData = '
+
+_WHITESPACE = re.compile(r'\s*')
+
+# Characters that may continue a number (12 -> 12.5, 1e -> 1e-3)
+_NUMBER_CHARS = re.compile(r'[0-9.eE+-]*')
+
+MessagePart = namedtuple('MessagePart', ['role', 'create_time', 'text', 'message_id'])
+HtmlJsonData = namedtuple('HtmlJsonData', ['conversations', 'identical'])
+
+
+def iter_message_parts(conversation, node_ids=None):
+    """Yield a MessagePart for every non-empty text part in a conversation
+
+    Walks the parsed mapping tree directly, so only what participants and
+    the model actually wrote is returned - no ids or metadata fields. Nodes
+    come in mapping order, or only those in node_ids (e.g. one thread of the
+    tree, see conversation_thread) in that order.
+    """
+    mapping = conversation.get('mapping') or {}
+    nodes = mapping.values() if node_ids is None else (mapping[node_id] for node_id in node_ids)
+    for node in nodes:
+        message = node.get('message')
+        if not message:
+            continue
+
+        content = message.get('content') or {}
+        parts = content.get('parts') or []
+        role = (message.get('author') or {}).get('role')
+        create_time = message.get('create_time')
+
+        for part in parts:
+            if isinstance(part, str) and part:
+                yield MessagePart(role, create_time, part, message.get('id'))
+
+
+def iter_json_array(f, chunk_size=CHUNK_SIZE):
+    """Yield the elements of a top-level JSON array from a text file
+
+    Only a window around the element currently being decoded is kept in
+    memory, so peak memory is bounded by the largest single element rather
+    than the whole file. An empty (or whitespace-only) file yields nothing.
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+    state = 'start'
+
+    while True:
+        pos = _WHITESPACE.match(buf, pos).end()
+        if pos == len(buf):
+            if eof:
+                if state == 'start':
+                    return
+                raise json.JSONDecodeError("Unterminated array", buf, pos)
+            buf, pos, eof = _refill(f, buf, pos, chunk_size)
+            continue
+
+        char = buf[pos]
+        if state == 'start':
+            if char != '[':
+                raise json.JSONDecodeError("Expecting '['", buf, pos)
+            pos += 1
+            state = 'first'
+        elif state == 'separator':
+            if char == ']':
+                return
+            if char != ',':
+                raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos)
+            pos += 1
+            state = 'value'
+        elif state == 'first' and char == ']':
+            return
+        else:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                end = None
+            if end is None or (not eof and (end == len(buf) or _cut_number(value, buf, end))):
+                # Element runs past the window; grow it and decode again
+                buf, pos, eof = _refill(f, buf, pos, max(chunk_size, len(buf) - pos))
+                continue
+            yield value
+            pos = end
+            state = 'separator'
+
+
+def _cut_number(value, buf, end):
+    """True if a decoded number may go on past the window (e.g. 12 of 12.5)"""
+    return type(value) in (int, float) and _NUMBER_CHARS.match(buf, end).end() == len(buf)
+
+
+def _refill(f, buf, pos, size):
+    """Drop consumed text from buf and append up to size more characters"""
+    chunk = f.read(size)
+    return buf[pos:] + chunk, 0, not chunk
+
+
+def iter_conversations(filepath, chunk_size=CHUNK_SIZE):
+    """Yield conversation dicts from a conversations.json file one at a time"""
+    with open_file(filepath, 'r') as f:
+        yield from iter_json_array(f, chunk_size)
+
+
+def iter_json_records(path):
+    """Yield the records of a JSON array file, e.g. model_comparisons.json
+
+    A file that cannot be read or decoded is reported and ends the records
+    early instead of raising, so one damaged export file does not stop a
+    whole run.
+    """
+    try:
+        with open_file(path, 'r') as f:
+            yield from iter_json_array(f)
+    except (OSError, ValueError) as e:
+        print(f"  Error reading {path}: {e}")
+
+
+def read_html_json_data(filepath, sibling_json=None):
+    """Extract the conversations embedded in a chat.html export
+
+    Memory-maps the file, finds the `var jsonData =` marker and decodes
+    exactly one JSON value from there. If sibling_json (the folder's
+    conversations.json) is given and the embedded payload is byte-identical
+    to it, decoding is skipped: identical is True and conversations is None.
+    Otherwise conversations is a list of every conversation, fully decoded
+    and with the file already closed. Returns None if the file has no
+    embedded data.
+
+    Pages inside an archive cannot be memory-mapped; they are decoded from
+    the member stream instead, into the same list.
+    """
+    if split_archive(filepath)[1] is not None:
+        return _read_archived_html(filepath, sibling_json)
+
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = mm.find(JSON_DATA_MARKER)
+            if start < 0:
+                return None
+            start += len(JSON_DATA_MARKER)
+
+            if sibling_json and _payload_matches(mm, start, sibling_json):
+                return HtmlJsonData(None, True)
+
+            text = mm[start:].decode('utf-8')
+
+    conversations, _ = json.JSONDecoder().raw_decode(text)
+    return HtmlJsonData(conversations, False)
+
+
+def _payload_matches(mm, start, json_path, block_size=1 << 20):
+    """Check whether mm[start:] begins with the exact bytes of json_path"""
+    size = os.path.getsize(json_path)
+    if size == 0 or start + size > len(mm):
+        return False
+
+    with open(json_path, 'rb') as f:
+        offset = start
+        while True:
+            block = f.read(block_size)
+            if not block:
+                return True
+            if mm[offset:offset + len(block)] != block:
+                return False
+            offset += len(block)
+
+
+def _read_archived_html(filepath, sibling_json=None):
+    """read_html_json_data for a chat.html streamed out of an archive"""
+    with open_file(filepath) as f:
+        start = _find_marker(f)
+        if start is None:
+            return None
+        f.seek(start)
+        if sibling_json and _stream_matches(f, sibling_json):
+            return HtmlJsonData(None, True)
+
+        f.seek(start)
+        conversations = list(iter_json_array(io.TextIOWrapper(f, encoding='utf-8')))
+    return HtmlJsonData(conversations, False)
+
+
+def _find_marker(f, block_size=CHUNK_SIZE):
+    """Return the offset just past JSON_DATA_MARKER in a binary stream, or None"""
+    offset = 0
+    tail = b''
+    while True:
+        block = f.read(block_size)
+        if not block:
+            return None
+        data = tail + block
+        found = data.find(JSON_DATA_MARKER)
+        if found >= 0:
+            return offset - len(tail) + found + len(JSON_DATA_MARKER)
+        tail = data[1 - len(JSON_DATA_MARKER):]
+        offset += len(block)
+
+
+def _stream_matches(f, json_path, block_size=1 << 20):
+    """Check whether the rest of stream f begins with the exact bytes of json_path"""
+    with open_file(json_path) as sibling:
+        empty = True
+        while True:
+            block = sibling.read(block_size)
+            if not block:
+                return not empty
+            if f.read(len(block)) != block:
+                return False
+            empty = False
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Conversation threads: the mapping tree of an export in message order
+
+A conversation's mapping is a tree of nodes linked by parent and children;
+editing a message or regenerating a reply starts a new branch, and
+current_node is the last message of the branch the participant saw last.
+Walking mapping.values() mixes all branches in insertion order. Here the
+active thread is found by walking parent links back from current_node and
+reversing, and all branches by a depth-first walk from the root; both are
+iterative, so deep conversations cannot hit the recursion limit.
+
+Threads are tuples of chatgpt_export.MessagePart, one per text part, in
+order, read with chatgpt_export.iter_message_parts along the thread's
+nodes. A ThreadCache keeps them per conversation key (the same key as the
+ingest layer's) so stages sharing a corpus walk each tree once.
+"""
+from chatgpt_export import iter_message_parts
+from ingest import conversation_key
+
+
+def _roots(mapping):
+    return [node_id for node_id, node in mapping.items() if node.get('parent') not in mapping]
+
+
+def active_path(conversation):
+    """Node ids from the root to current_node
+
+    Without a usable current_node, the path follows the last child from the
+    root, which is where the export appends the newest branch.
+    """
+    mapping = conversation.get('mapping') or {}
+    node_id = conversation.get('current_node')
+
+    if node_id in mapping:
+        path = []
+        seen = set()
+        while node_id in mapping and node_id not in seen:
+            seen.add(node_id)
+            path.append(node_id)
+            node_id = mapping[node_id].get('parent')
+        path.reverse()
+        return path
+
+    roots = _roots(mapping)
+    if not roots:
+        return []
+    path = [roots[0]]
+    seen = set(path)
+    children = [c for c in mapping[roots[0]].get('children') or () if c in mapping]
+    while children and children[-1] not in seen:
+        path.append(children[-1])
+        seen.add(children[-1])
+        children = [c for c in mapping[children[-1]].get('children') or () if c in mapping]
+    return path
+
+
+def branch_paths(conversation):
+    """Node ids of every root-to-leaf branch, in children order"""
+    mapping = conversation.get('mapping') or {}
+    paths = []
+    stack = [(root, ()) for root in reversed(_roots(mapping))]
+    seen = set()
+
+    while stack:
+        node_id, prefix = stack.pop()
+        if node_id in seen:
+            continue
+        seen.add(node_id)
+        path = prefix + (node_id,)
+        children = [c for c in mapping[node_id].get('children') or () if c in mapping and c not in seen]
+        if not children:
+            paths.append(list(path))
+        for child in reversed(children):
+            stack.append((child, path))
+    return paths
+
+
+def tree_order(conversation):
+    """Every node id once, parents before children and branches in children order"""
+    mapping = conversation.get('mapping') or {}
+    order = []
+    stack = list(reversed(_roots(mapping)))
+    seen = set()
+
+    while stack:
+        node_id = stack.pop()
+        if node_id in seen:
+            continue
+        seen.add(node_id)
+        order.append(node_id)
+        stack.extend(reversed([c for c in mapping[node_id].get('children') or () if c in mapping]))
+    return order
+
+
+def linearize(conversation):
+    """The active thread of a conversation as a tuple of MessageParts"""
+    return tuple(iter_message_parts(conversation, active_path(conversation)))
+
+
+def branches(conversation):
+    """Every branch of a conversation, each a tuple of MessageParts"""
+    return [tuple(iter_message_parts(conversation, path)) for path in branch_paths(conversation)]
+
+
+class ThreadCache:
+    """Active threads and branches per conversation id, computed once"""
+
+    def __init__(self):
+        self._threads = {}
+        self._branches = {}
+
+    def thread(self, conversation):
+        key = conversation_key(conversation)
+        if key not in self._threads:
+            self._threads[key] = linearize(conversation)
+        return self._threads[key]
+
+    def branches(self, conversation):
+        key = conversation_key(conversation)
+        if key not in self._branches:
+            self._branches[key] = branches(conversation)
+        return self._branches[key]
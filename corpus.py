@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Shared loader: parse the whole export once into an in-memory corpus
+
+The corpus offers the same interface as ingest.ConversationIngest
+(iteration, iter_summaries, provenance, sources_for, unparsed, duplicates),
+so each analysis script can run as a stage against it instead of walking
+and parsing data/ again.
+"""
+from accounts import AccountIndex
+from conversation_thread import ThreadCache
+from ingest import ConversationIngest
+
+
+class Corpus:
+    """All unique conversations of an export, parsed once and kept in memory"""
+
+    def __init__(self, data_dir='data'):
+        ingest = ConversationIngest(data_dir)
+        self.data_dir = data_dir
+        self.items = list(ingest)
+        self.sources = ingest.sources
+        self.provenance = ingest.provenance
+        self.unparsed = ingest.unparsed
+        self.duplicates = ingest.duplicates
+        self.accounts = AccountIndex(data_dir)
+        self.threads = ThreadCache()      # linearized threads, shared by every stage
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def iter_summaries(self, summarize, workers=1, cache=None):
+        """Yield items with conversation replaced by summarize(conversation)
+
+        workers and cache are accepted for interface compatibility with
+        ConversationIngest; the corpus is already parsed.
+        """
+        for item in self.items:
+            yield item._replace(conversation=summarize(item.conversation))
+
+    def sources_for(self, key):
+        """Return the sorted, distinct files a conversation appeared in"""
+        return sorted(set(self.provenance.get(key, ())))
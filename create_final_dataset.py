@@ -2,17 +2,54 @@
 """
 Create final consolidated dataset for paper analysis
 """
-import json
+import argparse
 import csv
 from datetime import datetime
 from collections import defaultdict
 
-def main():
-    # Load participant data
-    with open('all_participants.json', 'r', encoding='utf-8') as f:
-        data = json.load(f)
-
-    participants = data['participants']
+import export_index
+import metrics
+import participant_key
+import participant_records
+from output_files import find_output, is_jsonl, read_records
+
+# Participants the study recruited
+EXPECTED_PARTICIPANTS = 600
+
+def iter_participants(conn=None, input_path=None):
+    """Yield participant records (participant_id plus its fields) in key order
+
+    Records follow participant_records.SCHEMA; files written in an older
+    schema are upgraded on the way. JSON Lines input is streamed as is,
+    since extract_all_participants writes it in key order; the index and
+    JSON documents are sorted.
+    """
+    if conn:
+        participants = export_index.load_participants(conn)
+        records = ({'participant_id': pid, **pdata} for pid, pdata in participants.items())
+    else:
+        input_path = input_path or find_output('all_participants')
+        schema, records = read_records(input_path, 'participants', key='participant_id')
+        version = participant_records.schema_version(schema)
+        if version < participant_records.SCHEMA['version']:
+            records = (participant_records.upgrade_record(record, version) for record in records)
+        if is_jsonl(input_path):
+            return records
+
+    return sorted(records, key=lambda record: participant_key.sort_key(record['participant_id']))
+
+def main(db_path=None, input_path=None):
+    # Load participant data, from the SQLite export index when given
+    conn = export_index.connect(db_path) if db_path else None
+    participants = iter_participants(conn, input_path)
+    metrics.checkpoint('load')
+
+    # Summary counts are gathered while the rows are written
+    total = 0
+    total_conversations = 0
+    by_csn = defaultdict(int)
+    by_date = defaultdict(int)
+    sequences = defaultdict(int)
 
     # Create CSV dataset
     csv_file = 'final_participant_dataset.csv'
@@ -34,36 +71,36 @@ def main():
             'data_sources'
         ])
 
-        # Data rows
-        for pid in sorted(participants.keys()):
-            pdata = participants[pid]
+        # Data rows, in chronological participant-key order
+        for pdata in participants:
+            pid = pdata['participant_id']
+
+            # Date, time and sequence exactly as the ID was written; the
+            # packed key only counts IDs that name a real study date
+            fields = pid.split('_')
+            date_part, time_part, seq_part = (fields + ['', '', ''])[:3]
+            key = participant_key.encode_or_none(pid)
+            if key is not None:
+                by_date[participant_key.study_date(key)] += 1
+            if seq_part.isdigit():
+                sequences[int(seq_part)] += 1
 
-            # Parse participant ID
-            parts = pid.split('_')
-            date_part = parts[0] if len(parts) > 0 else ''
-            time_part = parts[1] if len(parts) > 1 else ''
-            seq_part = parts[2] if len(parts) > 2 else ''
+            total += 1
+            total_conversations += pdata['num_conversations']
+            by_csn[pdata['csn_folder']] += 1
 
             # Extract CSN number
             csn_folder = pdata['csn_folder']
             csn_number = csn_folder.replace('CSN', '').replace('csn', '')
 
-            # Get first seen datetime
-            first_seen_dt = pdata['first_seen'] if pdata['first_seen'] else ''
+            # First seen, shown in local time
+            first_seen = pdata['first_seen']
+            first_seen_dt = datetime.fromtimestamp(first_seen).isoformat() if first_seen is not None else ''
 
-            # Get unix timestamp from first conversation
+            # Unix timestamp of the first conversation, straight from its epoch
             first_seen_unix = ''
-            if len(pdata['conversations']) > 0:
-                first_conv = pdata['conversations'][0]
-                if 'create_time' in first_conv:
-                    try:
-                        # Parse ISO datetime back to unix
-                        dt_str = first_conv['create_time']
-                        if dt_str:
-                            dt = datetime.fromisoformat(dt_str.replace('Z', '+00:00'))
-                            first_seen_unix = int(dt.timestamp())
-                    except:
-                        pass
+            if pdata['conversations'] and pdata['conversations'][0]['create_time'] is not None:
+                first_seen_unix = int(pdata['conversations'][0]['create_time'])
 
             # Data sources
             sources = ', '.join(pdata['sources'])
@@ -82,45 +119,32 @@ def main():
             ])
 
     print(f"✓ Created {csv_file}")
+    metrics.checkpoint('write')
 
     # Generate summary statistics
     print("\n" + "="*80)
     print("FINAL DATASET SUMMARY STATISTICS")
     print("="*80)
 
-    total = len(participants)
     print(f"\nTotal participants: {total}")
 
     # By CSN
-    by_csn = defaultdict(int)
-    for pid, pdata in participants.items():
-        by_csn[pdata['csn_folder']] += 1
+    if conn:
+        by_csn = export_index.participants_by_csn(conn)
 
     print(f"\nParticipants by CSN folder:")
     for csn in sorted(by_csn.keys()):
         print(f"  {csn}: {by_csn[csn]}")
 
     # By date
-    by_date = defaultdict(int)
-    for pid in participants.keys():
-        date_part = pid.split('_')[0]
-        # Parse date
-        if len(date_part) == 8:
-            try:
-                day = date_part[:2]
-                month = date_part[2:4]
-                year = date_part[4:8]
-                date_str = f"{year}-{month}-{day}"
-                by_date[date_str] += 1
-            except:
-                pass
+    if conn:
+        by_date = export_index.participants_by_date(conn)
 
     print(f"\nParticipants by study date:")
     for date in sorted(by_date.keys()):
         print(f"  {date}: {by_date[date]}")
 
     # Conversation statistics
-    total_conversations = sum(p['num_conversations'] for p in participants.values())
     avg_conversations = total_conversations / total if total > 0 else 0
 
     print(f"\nConversation statistics:")
@@ -128,14 +152,6 @@ def main():
     print(f"  Average conversations per participant: {avg_conversations:.2f}")
 
     # Sequence number distribution
-    sequences = defaultdict(int)
-    for pid in participants.keys():
-        seq = pid.split('_')[-1] if '_' in pid else '0'
-        try:
-            sequences[int(seq)] += 1
-        except:
-            pass
-
     if sequences:
         print(f"\nSequence number distribution:")
         print(f"  Range: {min(sequences.keys())} to {max(sequences.keys())}")
@@ -153,11 +169,23 @@ def main():
     print("STATUS: DATASET CONSOLIDATION COMPLETE")
     print(f"{'='*80}")
     print(f"\n⚠️  IMPORTANT:")
-    print(f"   Recovered: 216 participants")
-    print(f"   Expected: 600 participants")
-    print(f"   Missing: 384 participants (64% data loss)")
+    missing = max(EXPECTED_PARTICIPANTS - total, 0)
+    print(f"   Recovered: {total} participants")
+    print(f"   Expected: {EXPECTED_PARTICIPANTS} participants")
+    print(f"   Missing: {missing} participants ({missing / EXPECTED_PARTICIPANTS:.0%} data loss)")
     print(f"\n   This is a PARTIAL dataset. See DATA_RECOVERY_REPORT.md for details.")
     print(f"\n   Recommendation: Contact study authors for complete dataset.")
+    metrics.checkpoint('report')
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Create the final participant CSV dataset')
+    parser.add_argument('--db', help='read participants from this SQLite export index '
+                                     'instead of all_participants.json')
+    parser.add_argument('--input', help='participants file to read (default: the newest '
+                                        'all_participants.* result file)')
+    metrics.add_argument(parser, 'create_final_dataset')
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable(args.metrics)
+
+    main(db_path=args.db, input_path=args.input)
@@ -3,16 +3,37 @@
 Deep analysis: Count ALL conversations as potential participants
 Each conversation might represent a separate participant
 """
-import json
-import os
+import argparse
 from datetime import datetime
 from collections import defaultdict
 
-def analyze_all_conversations():
+import metrics
+from extraction_cache import ExtractionCache
+from ingest import ConversationIngest
+from output_files import FORMATS, RecordWriter, output_path
+
+# Bump when summarize_conversation changes, so cached per-source results
+# are recomputed
+EXTRACTOR_VERSION = 1
+
+def summarize_conversation(conv):
+    """Reduce a conversation to the metadata this analysis reports"""
+    return {
+        'title': conv.get('title', ''),
+        'create_time': conv.get('create_time', 0),
+        'update_time': conv.get('update_time', 0),
+        'conversation_id': conv.get('conversation_id', conv.get('id', '')),
+        'is_archived': conv.get('is_archived', False)
+    }
+
+def analyze_all_conversations(use_cache=True, corpus=None, output_format='json'):
     """Analyze ALL conversations across all CSN folders"""
 
-    all_conversations = []
-    conversations_by_csn = defaultdict(list)
+    # Only counters are kept: the conversations themselves go straight to the output
+    count_by_csn = defaultdict(int)
+    by_date = defaultdict(int)
+    title_counts = defaultdict(int)
+    archived_count = 0
     total_conversations = 0
 
     data_dir = 'data'
@@ -21,46 +42,44 @@ def analyze_all_conversations():
     print("DEEP ANALYSIS: ALL CONVERSATIONS AS PARTICIPANTS")
     print("="*80)
 
-    # Process all CSN folders
-    for csn_folder in sorted(os.listdir(data_dir)):
-        csn_path = os.path.join(data_dir, csn_folder)
-        if not os.path.isdir(csn_path):
-            continue
-
-        print(f"\nAnalyzing {csn_folder}...")
-
-        # Find all conversations.json files recursively
-        for root, dirs, files in os.walk(csn_path):
-            if 'conversations.json' in files:
-                filepath = os.path.join(root, 'conversations.json')
-
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        if not content.strip():
-                            continue
-
-                        conversations = json.loads(content)
-
-                        print(f"  Found {len(conversations)} conversations in {filepath}")
-
-                        for conv in conversations:
-                            conv_data = {
-                                'csn_folder': csn_folder,
-                                'title': conv.get('title', ''),
-                                'create_time': conv.get('create_time', 0),
-                                'update_time': conv.get('update_time', 0),
-                                'conversation_id': conv.get('conversation_id', conv.get('id', '')),
-                                'is_archived': conv.get('is_archived', False),
-                                'filepath': filepath
-                            }
-
-                            all_conversations.append(conv_data)
-                            conversations_by_csn[csn_folder].append(conv_data)
-                            total_conversations += 1
-
-                except Exception as e:
-                    print(f"  Error: {e}")
+    # Process every unique conversation once, in sorted CSN folder order
+    # Reuse the shared corpus when running inside the pipeline
+    ingest = corpus if corpus is not None else ConversationIngest(data_dir)
+    cache = ExtractionCache('deep_analysis_all_conversations', EXTRACTOR_VERSION) if use_cache and corpus is None else None
+    counts_by_file = defaultdict(int)
+    current_folder = None
+
+    # Conversations are written out as they are read; the total follows at the end
+    output_file = output_path('all_conversations_detailed', output_format)
+    output = RecordWriter(output_file, 'conversations', ensure_ascii=False)
+    analysis_date = datetime.now().isoformat()
+
+    for item in ingest.iter_summaries(summarize_conversation, cache=cache):
+        if item.csn_folder != current_folder:
+            current_folder = item.csn_folder
+            print(f"\nAnalyzing {current_folder}...")
+
+        conv_data = dict(csn_folder=item.csn_folder, **item.conversation)
+        conv_data['filepath'] = item.path
+
+        output.write(conv_data)
+        count_by_csn[item.csn_folder] += 1
+        counts_by_file[item.path] += 1
+        total_conversations += 1
+
+        if conv_data['create_time'] > 0:
+            by_date[datetime.fromtimestamp(conv_data['create_time']).strftime('%Y-%m-%d')] += 1
+        if conv_data.get('is_archived', False):
+            archived_count += 1
+        if conv_data['title']:
+            title_counts[conv_data['title']] += 1
+
+    print()
+    for filepath, file_count in counts_by_file.items():
+        print(f"  Found {file_count} conversations in {filepath}")
+    if cache:
+        print(cache.summary())
+    metrics.checkpoint('extract')
 
     print(f"\n{'='*80}")
     print(f"TOTAL CONVERSATIONS FOUND: {total_conversations}")
@@ -68,25 +87,15 @@ def analyze_all_conversations():
 
     # Analyze by CSN
     print(f"\nConversations by CSN folder:")
-    for csn in sorted(conversations_by_csn.keys()):
-        count = len(conversations_by_csn[csn])
-        print(f"  {csn}: {count} conversations")
+    for csn in sorted(count_by_csn.keys()):
+        print(f"  {csn}: {count_by_csn[csn]} conversations")
 
     # Analyze by date
     print(f"\nConversations by creation date:")
-    by_date = defaultdict(int)
-
-    for conv in all_conversations:
-        if conv['create_time'] > 0:
-            dt = datetime.fromtimestamp(conv['create_time'])
-            date_str = dt.strftime('%Y-%m-%d')
-            by_date[date_str] += 1
-
     for date in sorted(by_date.keys()):
         print(f"  {date}: {by_date[date]} conversations")
 
     # Check for archived vs active
-    archived_count = sum(1 for c in all_conversations if c.get('is_archived', False))
     active_count = total_conversations - archived_count
 
     print(f"\nArchive status:")
@@ -95,24 +104,14 @@ def analyze_all_conversations():
 
     # Analyze conversation titles
     print(f"\nMost common conversation titles:")
-    title_counts = defaultdict(int)
-    for conv in all_conversations:
-        title = conv['title']
-        if title:
-            title_counts[title] += 1
-
     for title, count in sorted(title_counts.items(), key=lambda x: x[1], reverse=True)[:20]:
         print(f"  '{title}': {count}")
 
-    # Save detailed conversation list
-    output = {
-        'total_conversations': total_conversations,
-        'analysis_date': datetime.now().isoformat(),
-        'conversations': all_conversations
-    }
+    metrics.checkpoint('report')
 
-    with open('all_conversations_detailed.json', 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
+    # Save detailed conversation list
+    output.close(total_conversations=total_conversations, analysis_date=analysis_date)
+    metrics.checkpoint('write')
 
     print(f"\n{'='*80}")
     print(f"HYPOTHESIS: If each conversation = 1 participant")
@@ -124,7 +123,18 @@ def analyze_all_conversations():
     else:
         print(f"\n✗ Still short: {600 - total_conversations} participants missing")
 
-    return all_conversations
+    return total_conversations
 
 if __name__ == '__main__':
-    conversations = analyze_all_conversations()
+    parser = argparse.ArgumentParser(description='Count every conversation as a potential participant')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='re-parse every source instead of reusing .cache/ results')
+    parser.add_argument('--format', choices=FORMATS, default='json',
+                        help='all_conversations_detailed file format: pretty-printed JSON or '
+                             'streamed JSON Lines, optionally compressed (default: json)')
+    metrics.add_argument(parser, 'deep_analysis_all_conversations')
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable(args.metrics)
+
+    analyze_all_conversations(use_cache=not args.no_cache, output_format=args.format)
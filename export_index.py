@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+SQLite index of the whole export, built once and queried by every report
+
+Loads every unique conversation, message part, participant-ID mention,
+model comparison and feedback record into one SQLite file with indexes on
+participant_id, csn_folder, create_time and conversation_id. The
+participants view applies the same ID rules as extract_all_participants.
+
+Usage:
+    python export_index.py build [--db export_index.sqlite]
+    python export_index.py counts [--db export_index.sqlite]
+    python export_index.py query "SELECT ..." [--db export_index.sqlite]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import time
+
+import participant_id_scanner as scanner
+import participant_key
+from chatgpt_export import iter_json_records, iter_message_parts
+from export_sources import open_file
+from ingest import ConversationIngest, find_files
+
+DEFAULT_DB = 'export_index.sqlite'
+
+SCHEMA = """
+CREATE TABLE folders (
+    csn_folder TEXT PRIMARY KEY,
+    user_id TEXT,
+    email TEXT,
+    user_json TEXT
+);
+CREATE TABLE conversations (
+    conversation_id TEXT PRIMARY KEY,
+    ordinal INTEGER NOT NULL,
+    csn_folder TEXT NOT NULL,
+    title TEXT,
+    create_time REAL,
+    update_time REAL,
+    is_archived INTEGER
+);
+CREATE TABLE sources (
+    conversation_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (conversation_id, path)
+);
+CREATE TABLE messages (
+    message_id TEXT,
+    conversation_id TEXT NOT NULL,
+    role TEXT,
+    create_time REAL,
+    text TEXT
+);
+CREATE TABLE mentions (
+    participant_id TEXT NOT NULL,
+    participant_key INTEGER,
+    conversation_id TEXT NOT NULL,
+    message_id TEXT,
+    kind TEXT NOT NULL,
+    malformed INTEGER NOT NULL
+);
+CREATE TABLE model_comparisons (
+    id TEXT,
+    csn_folder TEXT NOT NULL,
+    conversation_id TEXT,
+    user_id TEXT,
+    create_time TEXT,
+    content TEXT
+);
+CREATE TABLE message_feedback (
+    id TEXT,
+    csn_folder TEXT NOT NULL,
+    conversation_id TEXT,
+    user_id TEXT,
+    rating TEXT,
+    create_time TEXT,
+    content TEXT
+);
+
+-- Conversations that count towards a participant (extract_all_participants rules)
+CREATE VIEW participant_conversations AS
+SELECT DISTINCT participant_id, participant_key, conversation_id
+FROM mentions
+WHERE kind IN ('explicit_id', 'stated_id') OR (kind = 'mentioned_id' AND malformed = 0);
+
+-- One row per participant; csn_folder is the folder it was first seen in
+CREATE VIEW participants AS
+SELECT pc.participant_id,
+       pc.participant_key,
+       (SELECT c2.csn_folder
+          FROM participant_conversations p2
+          JOIN conversations c2 ON c2.conversation_id = p2.conversation_id
+         WHERE p2.participant_id = pc.participant_id
+         ORDER BY c2.ordinal LIMIT 1) AS csn_folder,
+       COUNT(*) AS num_conversations,
+       MIN(CASE WHEN c.create_time > 0 THEN c.create_time END) AS first_seen
+FROM participant_conversations pc
+JOIN conversations c ON c.conversation_id = pc.conversation_id
+GROUP BY pc.participant_id;
+"""
+
+INDEXES = """
+CREATE INDEX idx_conversations_folder ON conversations (csn_folder);
+CREATE INDEX idx_conversations_time ON conversations (create_time);
+CREATE INDEX idx_messages_conversation ON messages (conversation_id);
+CREATE INDEX idx_messages_time ON messages (create_time);
+CREATE INDEX idx_mentions_participant ON mentions (participant_id);
+CREATE INDEX idx_mentions_key ON mentions (participant_key);
+CREATE INDEX idx_mentions_conversation ON mentions (conversation_id);
+CREATE INDEX idx_comparisons_conversation ON model_comparisons (conversation_id);
+CREATE INDEX idx_comparisons_folder ON model_comparisons (csn_folder);
+CREATE INDEX idx_feedback_conversation ON message_feedback (conversation_id);
+CREATE INDEX idx_feedback_folder ON message_feedback (csn_folder);
+"""
+
+
+def build_index(db_path=DEFAULT_DB, data_dir='data', conversations=None):
+    """(Re)build the index at db_path
+
+    conversations is an iterable of ingested conversations (e.g. a shared
+    corpus); by default the export is read through the ingest layer.
+    """
+    if conversations is None:
+        conversations = ConversationIngest(data_dir)
+
+    tmp_path = db_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    conn.executescript(SCHEMA)
+
+    with conn:
+        for ordinal, item in enumerate(conversations):
+            _insert_conversation(conn, ordinal, item)
+
+        conn.executemany(
+            "INSERT OR IGNORE INTO sources VALUES (?, ?)",
+            ((key, path) for key, paths in conversations.provenance.items() for path in paths)
+        )
+
+        for csn_folder, path in find_files('user.json', data_dir):
+            user = _load_json(path) or {}
+            conn.execute(
+                "INSERT OR IGNORE INTO folders VALUES (?, ?, ?, ?)",
+                (csn_folder, user.get('id'), user.get('email'), json.dumps(user))
+            )
+
+        for csn_folder, path in find_files('model_comparisons.json', data_dir):
+            conn.executemany(
+                "INSERT INTO model_comparisons VALUES (?, ?, ?, ?, ?, ?)",
+                ((r.get('id'), csn_folder, r.get('conversation_id'), r.get('user_id'),
+                  r.get('create_time'), json.dumps(r.get('content')))
+                 for r in iter_json_records(path))
+            )
+
+        for csn_folder, path in find_files('message_feedback.json', data_dir):
+            conn.executemany(
+                "INSERT INTO message_feedback VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((r.get('id'), csn_folder, r.get('conversation_id'), r.get('user_id'),
+                  r.get('rating'), r.get('create_time'), r.get('content'))
+                 for r in iter_json_records(path))
+            )
+
+    conn.executescript(INDEXES)
+    conn.execute("ANALYZE")
+    conn.close()
+    os.replace(tmp_path, db_path)
+
+
+def _insert_conversation(conn, ordinal, item):
+    conv = item.conversation
+    conn.execute(
+        "INSERT OR IGNORE INTO conversations VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (item.key, ordinal, item.csn_folder, conv.get('title', ''), conv.get('create_time'),
+         conv.get('update_time'), int(bool(conv.get('is_archived', False))))
+    )
+
+    for part in iter_message_parts(conv):
+        conn.execute(
+            "INSERT INTO messages VALUES (?, ?, ?, ?, ?)",
+            (part.message_id, item.key, part.role, part.create_time, part.text)
+        )
+        for m in scanner.iter_matches(part.text):
+            if m.kind in scanner.ID_KINDS:
+                conn.execute(
+                    "INSERT INTO mentions VALUES (?, ?, ?, ?, ?, ?)",
+                    (m.value, participant_key.encode_or_none(m.value), item.key,
+                     part.message_id, m.kind, int(m.malformed))
+                )
+
+
+def _load_json(path):
+    try:
+        with open_file(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"  Error reading {path}: {e}")
+        return None
+
+
+def connect(db_path=DEFAULT_DB):
+    """Open an existing index read-only"""
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"{db_path} not found; run 'python export_index.py build' first")
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def load_participants(conn):
+    """Return participants in the shape of all_participants.json's 'participants'
+
+    Records follow participant_records.SCHEMA, with float epoch timestamps.
+    """
+    participants = {}
+    for row in conn.execute("SELECT * FROM participants ORDER BY participant_key, participant_id"):
+        participants[row['participant_id']] = {
+            'csn_folder': row['csn_folder'],
+            'num_conversations': row['num_conversations'],
+            'first_seen': _epoch(row['first_seen']),
+            'sources': [],
+            'conversations': []
+        }
+
+    for row in conn.execute(
+        "SELECT pc.participant_id, c.conversation_id, c.title, c.create_time "
+        "FROM participant_conversations pc "
+        "JOIN conversations c ON c.conversation_id = pc.conversation_id "
+        "ORDER BY pc.participant_id, c.ordinal"
+    ):
+        participants[row['participant_id']]['conversations'].append({
+            'id': row['conversation_id'],
+            'title': row['title'],
+            'create_time': _epoch(row['create_time'])
+        })
+
+    for row in conn.execute(
+        "SELECT DISTINCT pc.participant_id, s.path "
+        "FROM participant_conversations pc "
+        "JOIN sources s ON s.conversation_id = pc.conversation_id "
+        "ORDER BY pc.participant_id, s.path"
+    ):
+        participants[row['participant_id']]['sources'].append(row['path'])
+
+    return participants
+
+
+def participants_by_csn(conn):
+    """Return {csn_folder: participant count}"""
+    return dict(conn.execute(
+        "SELECT csn_folder, COUNT(*) FROM participants GROUP BY csn_folder ORDER BY csn_folder"
+    ).fetchall())
+
+
+def participants_by_date(conn):
+    """Return {YYYY-MM-DD study date from the ID: participant count}"""
+    return {
+        participant_key.study_date(date << participant_key.DATE_SHIFT): count
+        for date, count in conn.execute(
+            "SELECT participant_key >> ? AS date, COUNT(*) FROM participants "
+            "WHERE participant_key IS NOT NULL GROUP BY date ORDER BY date",
+            (participant_key.DATE_SHIFT,)
+        )
+    }
+
+
+def _epoch(timestamp):
+    return timestamp if timestamp and timestamp > 0 else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the SQLite export index')
+    parser.add_argument('--db', default=DEFAULT_DB)
+    parser.add_argument('--data-dir', default='data')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('build', help='(re)build the index from the export')
+    subparsers.add_parser('counts', help='table sizes and participants per CSN folder')
+    query_parser = subparsers.add_parser('query', help='run an ad-hoc SQL query')
+    query_parser.add_argument('sql')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        build_index(args.db, args.data_dir)
+        print(f"Built {args.db} in {time.perf_counter() - start:.2f}s")
+        return
+
+    conn = connect(args.db)
+    if args.command == 'counts':
+        for table in ('conversations', 'messages', 'mentions', 'model_comparisons',
+                      'message_feedback', 'participants'):
+            print(f"  {table}: {conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]}")
+        print(f"\nParticipants by CSN folder:")
+        for csn, count in participants_by_csn(conn).items():
+            print(f"  {csn}: {count}")
+    else:
+        cursor = conn.execute(args.sql)
+        print("\t".join(d[0] for d in cursor.description))
+        for row in cursor:
+            print("\t".join(str(v) for v in row))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Export files as sources: CSN folders on disk or zipped ChatGPT exports
+
+Every entry under data_dir is one CSN folder: either a directory holding an
+unzipped export or a .zip archive of one. Files inside an archive are
+addressed by the archive path joined with the member name, e.g.
+data/CSN5.zip/conversations.json, and are read straight out of the archive
+as streams - nothing is extracted to disk. All functions here accept both
+kinds of path, so the rest of the code only deals in path strings.
+
+An archive's folder identity is its name when that is a CSN name
+(CSN5.zip), otherwise the uksurveycsnNN account in its user.json.
+"""
+import io
+import json
+import os
+import re
+import zipfile
+from collections import namedtuple
+from functools import lru_cache
+
+ARCHIVE_SUFFIX = '.zip'
+
+FileStat = namedtuple('FileStat', ['size', 'mtime_ns'])
+
+_CSN_NAME = re.compile(r'csn0*(\d+)', re.IGNORECASE)
+_CSN_EMAIL = re.compile(r'uksurveycsn0*(\d+)@', re.IGNORECASE)
+
+
+def is_archive(path):
+    return path.lower().endswith(ARCHIVE_SUFFIX) and os.path.isfile(path)
+
+
+@lru_cache(maxsize=4096)
+def split_archive(path):
+    """Return (archive, member) for a path inside an archive, else (path, None)"""
+    if os.path.exists(path):
+        return path, None
+
+    parts = path.split(os.sep)
+    for i in range(1, len(parts)):
+        prefix = os.sep.join(parts[:i])
+        if is_archive(prefix):
+            return prefix, '/'.join(parts[i:])
+    return path, None
+
+
+def open_file(path, mode='rb'):
+    """Open a file or archive member for reading ('rb', or 'r' for UTF-8 text)"""
+    archive, member = split_archive(path)
+    if member is None:
+        return open(path, mode, encoding=None if 'b' in mode else 'utf-8')
+
+    # The member stream keeps the archive file open after the ZipFile closes
+    with zipfile.ZipFile(archive) as zf:
+        f = zf.open(member)
+    return f if 'b' in mode else io.TextIOWrapper(f, encoding='utf-8')
+
+
+def file_stat(path):
+    """Size and mtime of a file; an archive member has the archive's mtime"""
+    archive, member = split_archive(path)
+    if member is None:
+        stat = os.stat(path)
+        return FileStat(stat.st_size, stat.st_mtime_ns)
+
+    with zipfile.ZipFile(archive) as zf:
+        size = zf.getinfo(member).file_size
+    return FileStat(size, os.stat(archive).st_mtime_ns)
+
+
+def file_size(path):
+    return file_stat(path).size
+
+
+def file_exists(path):
+    archive, member = split_archive(path)
+    if member is None:
+        return os.path.exists(path)
+    with zipfile.ZipFile(archive) as zf:
+        return member in zf.NameToInfo
+
+
+def list_folders(data_dir='data'):
+    """List (csn_folder, path) for every CSN directory and archive
+
+    Sorted by folder name, so an export reads in the same order whether its
+    folders are unzipped, zipped as CSN5.zip or zipped under another name.
+    """
+    folders = []
+    for name in os.listdir(data_dir):
+        path = os.path.join(data_dir, name)
+        if os.path.isdir(path):
+            folders.append((name, path))
+        elif is_archive(path):
+            folders.append((archive_folder_name(path), path))
+    return sorted(folders)
+
+
+def archive_folder_name(archive):
+    """CSN folder of an archive, from its file name or its user.json email"""
+    stem = os.path.basename(archive)[:-len(ARCHIVE_SUFFIX)]
+    match = _CSN_NAME.fullmatch(stem)
+    if match:
+        return f"CSN{match.group(1)}"
+
+    with zipfile.ZipFile(archive) as zf:
+        users = sorted((n for n in zf.namelist() if n.rsplit('/', 1)[-1] == 'user.json'),
+                       key=lambda n: (n.count('/'), n))
+        for name in users:
+            try:
+                email = json.loads(zf.read(name)).get('email') or ''
+            except (ValueError, AttributeError):
+                continue
+            match = _CSN_EMAIL.match(email)
+            if match:
+                return f"CSN{match.group(1)}"
+    return stem
+
+
+def walk_folder(path):
+    """Yield (directory, {filename: size}) for a CSN directory or archive
+
+    Directories come in os.walk order with sorted subdirectories, so an
+    archive is walked exactly like the same export unzipped.
+    """
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            yield root, {name: os.path.getsize(os.path.join(root, name)) for name in files}
+        return
+
+    tree = {'': ({}, set())}   # directory -> (files, subdirectories)
+    with zipfile.ZipFile(path) as zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            directory, _, name = info.filename.rstrip('/').rpartition('/')
+            _add_directory(tree, directory)
+            tree[directory][0][name] = info.file_size
+
+    def walk(directory):
+        files, subdirs = tree[directory]
+        yield os.path.join(path, *directory.split('/')) if directory else path, files
+        for subdir in sorted(subdirs):
+            yield from walk(subdir)
+
+    yield from walk('')
+
+
+def _add_directory(tree, directory):
+    if directory in tree:
+        return
+    parent = directory.rpartition('/')[0]
+    _add_directory(tree, parent)
+    tree[directory] = ({}, set())
+    tree[parent][1].add(directory)
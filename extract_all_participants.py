@@ -2,75 +2,73 @@
 """
 Comprehensive participant extraction from all data sources
 """
+import argparse
 import json
 import os
-import re
 from collections import defaultdict
 from datetime import datetime
 
+import metrics
+from chatgpt_export import iter_conversations, iter_message_parts, read_html_json_data
+from export_sources import open_file
+from extraction_cache import ExtractionCache
+from ingest import ConversationIngest
+from output_files import FORMATS, RecordWriter, output_path
+from participant_key import encode_or_none, sort_key
+from participant_records import SCHEMA, ParticipantStore
+from participant_id_scanner import participant_ids
+
+# Bump when summarize_conversation or the ID scanner changes, so cached
+# per-source results are recomputed
+EXTRACTOR_VERSION = 1
+
 def extract_participant_ids_from_text(text):
-    """Extract all participant IDs from text using various patterns"""
+    """Extract all participant IDs from text using the shared scanner"""
+    return participant_ids(text)
+
+def extract_participant_ids_from_conversation(conv):
+    """Extract participant IDs from the message text of one conversation"""
     ids = set()
+    for part in iter_message_parts(conv):
+        ids |= extract_participant_ids_from_text(part.text)
+    return ids
 
-    # Patterns for participant IDs
-    patterns = [
-        r'[Mm]y [Ii][Dd] is (\d{8}_\d{4}_\d+)',
-        r'[Ii][Dd] is (\d{8}_\d{4}_\d+)',
-        r'(?:^|\s)(\d{8}_\d{4}_\d+)(?:\s|$|[,.])',
-        # Also match slightly malformed IDs
-        r'[Mm]y [Ii][Dd] is (\d{8}_\d{3,4}_\d+)',
-        r'[Ii][Dd] is (\d{8}_\d{3,4}_\d+)',
-    ]
-
-    for pattern in patterns:
-        matches = re.finditer(pattern, text)
-        for match in matches:
-            participant_id = match.group(1)
-            # Validate ID format (DDMMYYYY_HHMM_N)
-            if re.match(r'\d{8}_\d{3,4}_\d+', participant_id):
-                ids.add(participant_id)
+def summarize_conversation(conv):
+    """Reduce a conversation to the fields the extraction needs
+
+    Summaries are small plain dicts, so worker processes return them
+    instead of whole conversations and the extraction cache stores them.
+    """
+    with metrics.stage('scan'):
+        ids = sorted(extract_participant_ids_from_conversation(conv))
+
+    return {
+        'title': conv.get('title', ''),
+        'create_time': conv.get('create_time', 0),
+        'update_time': conv.get('update_time', 0),
+        'id': conv.get('conversation_id', conv.get('id', '')),
+        'participant_ids': ids
+    }
 
-    return ids
+def record_summary(participant_data, summary, filepath, csn_folder=None):
+    """Add one summarized conversation to every participant ID it mentions"""
+    for pid in summary['participant_ids']:
+        participant_data.add_conversation(
+            pid, summary['id'], summary['title'], summary['create_time'],
+            summary['update_time'], filepath, csn_folder
+        )
+
+def record_conversation(participant_data, conv, filepath):
+    """Add one conversation to every participant ID it mentions"""
+    record_summary(participant_data, summarize_conversation(conv), filepath)
 
 def process_json_file(filepath):
     """Process a JSON conversation file"""
-    participant_data = {}
+    participant_data = ParticipantStore()
 
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            content = f.read()
-            if not content.strip():
-                return participant_data
-
-            conversations = json.loads(content)
-
-            for conv in conversations:
-                create_time = conv.get('create_time', 0)
-                update_time = conv.get('update_time', 0)
-                title = conv.get('title', '')
-                conv_id = conv.get('conversation_id', conv.get('id', ''))
-
-                # Extract participant IDs from conversation
-                mapping = conv.get('mapping', {})
-                conversation_text = json.dumps(mapping)  # Convert to text for searching
-
-                participant_ids = extract_participant_ids_from_text(conversation_text)
-
-                for pid in participant_ids:
-                    if pid not in participant_data:
-                        participant_data[pid] = {
-                            'conversations': [],
-                            'first_seen': create_time,
-                            'sources': []
-                        }
-
-                    participant_data[pid]['conversations'].append({
-                        'title': title,
-                        'create_time': create_time,
-                        'update_time': update_time,
-                        'id': conv_id
-                    })
-                    participant_data[pid]['sources'].append(filepath)
+        for conv in iter_conversations(filepath):
+            record_conversation(participant_data, conv, filepath)
 
     except Exception as e:
         print(f"  Error processing {filepath}: {e}")
@@ -79,60 +77,25 @@ def process_json_file(filepath):
 
 def process_html_file(filepath):
     """Process an HTML file containing embedded JSON"""
-    participant_data = {}
+    participant_data = ParticipantStore()
 
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            content = f.read()
-
-            # Extract participant IDs from the entire HTML
-            participant_ids = extract_participant_ids_from_text(content)
-
-            # Try to extract JSON data from the HTML
-            json_match = re.search(r'var jsonData = (\[.*?\]);', content, re.DOTALL)
-            if json_match:
-                try:
-                    conversations = json.loads(json_match.group(1))
-
-                    for conv in conversations:
-                        create_time = conv.get('create_time', 0)
-                        update_time = conv.get('update_time', 0)
-                        title = conv.get('title', '')
-                        conv_id = conv.get('conversation_id', conv.get('id', ''))
-
-                        # Extract participant IDs from this conversation
-                        mapping = conv.get('mapping', {})
-                        conversation_text = json.dumps(mapping)
-
-                        conv_participant_ids = extract_participant_ids_from_text(conversation_text)
-
-                        for pid in conv_participant_ids:
-                            if pid not in participant_data:
-                                participant_data[pid] = {
-                                    'conversations': [],
-                                    'first_seen': create_time,
-                                    'sources': []
-                                }
-
-                            participant_data[pid]['conversations'].append({
-                                'title': title,
-                                'create_time': create_time,
-                                'update_time': update_time,
-                                'id': conv_id
-                            })
-                            participant_data[pid]['sources'].append(filepath)
-
-                except json.JSONDecodeError:
-                    pass
-
-            # Also add any IDs found in HTML but not in JSON
+        try:
+            embedded = read_html_json_data(filepath)
+        except json.JSONDecodeError:
+            embedded = None
+
+        if embedded is None:
+            # No usable embedded JSON; fall back to scanning the raw HTML
+            with open_file(filepath, 'r') as f:
+                participant_ids = extract_participant_ids_from_text(f.read())
+
             for pid in participant_ids:
-                if pid not in participant_data:
-                    participant_data[pid] = {
-                        'conversations': [],
-                        'first_seen': 0,
-                        'sources': [filepath]
-                    }
+                participant_data.add_mention(pid, filepath)
+
+        else:
+            for conv in embedded.conversations:
+                record_conversation(participant_data, conv, filepath)
 
     except Exception as e:
         print(f"  Error processing HTML {filepath}: {e}")
@@ -140,75 +103,82 @@ def process_html_file(filepath):
     return participant_data
 
 def merge_participant_data(all_data, new_data, csn_folder):
-    """Merge new participant data into the cumulative dataset"""
-    for pid, pdata in new_data.items():
-        if pid not in all_data:
-            all_data[pid] = {
-                'csn_folder': csn_folder,
-                'conversations': [],
-                'first_seen': pdata['first_seen'],
-                'sources': []
-            }
-
-        all_data[pid]['conversations'].extend(pdata['conversations'])
-        all_data[pid]['sources'].extend(pdata['sources'])
-
-        # Update first_seen if this is earlier
-        if pdata['first_seen'] > 0:
-            if all_data[pid]['first_seen'] == 0 or pdata['first_seen'] < all_data[pid]['first_seen']:
-                all_data[pid]['first_seen'] = pdata['first_seen']
-
-def main():
+    """Merge new participant data into the cumulative dataset
+
+    The same conversation can arrive from both chat.html and
+    conversations.json; it is kept once, since both stores key their
+    conversation tables by conversation id.
+    """
+    all_data.merge(new_data, csn_folder)
+
+def main(workers=1, use_cache=True, corpus=None, output_format='json'):
     print("="*80)
     print("COMPREHENSIVE PARTICIPANT EXTRACTION")
     print("="*80)
 
-    all_participants = {}
+    all_participants = ParticipantStore()
     data_dir = 'data'
 
-    # Process all CSN folders
-    for csn_folder in sorted(os.listdir(data_dir)):
-        csn_path = os.path.join(data_dir, csn_folder)
-        if not os.path.isdir(csn_path):
-            continue
-
-        print(f"\nProcessing {csn_folder}...")
-
-        # Find all JSON and HTML files recursively
-        for root, dirs, files in os.walk(csn_path):
-            for filename in files:
-                filepath = os.path.join(root, filename)
-
-                if filename == 'conversations.json':
-                    print(f"  - Processing {filename}")
-                    pdata = process_json_file(filepath)
-                    merge_participant_data(all_participants, pdata, csn_folder)
-
-                elif filename == 'chat.html':
-                    print(f"  - Processing {filename}")
-                    pdata = process_html_file(filepath)
-                    merge_participant_data(all_participants, pdata, csn_folder)
+    # Process every unique conversation once, in sorted CSN folder order
+    # Reuse the shared corpus when running inside the pipeline
+    ingest = corpus if corpus is not None else ConversationIngest(data_dir)
+    cache = ExtractionCache('extract_all_participants', EXTRACTOR_VERSION) if use_cache and corpus is None else None
+    current_source = None
+
+    for item in ingest.iter_summaries(summarize_conversation, workers, cache):
+        if current_source is None or item.csn_folder != current_source.csn_folder:
+            print(f"\nProcessing {item.csn_folder}...")
+        if current_source is None or item.path != current_source.path:
+            print(f"  - Processing {os.path.relpath(item.path, data_dir)}")
+        current_source = item
+
+        with metrics.stage('merge'):
+            record_summary(all_participants, item.conversation, item.path, item.csn_folder)
+
+    # Pages without usable embedded JSON are scanned as raw text
+    for source in ingest.unparsed:
+        if source.kind == 'html':
+            print(f"  - Scanning raw HTML {source.path}")
+            pdata = process_html_file(source.path)
+            merge_participant_data(all_participants, pdata, source.csn_folder)
+    metrics.checkpoint('extract')
+
+    print(f"\nSkipped {ingest.duplicates} duplicate conversation copies across {len(ingest.sources)} source files")
+    if cache:
+        print(cache.summary())
 
     print(f"\n{'='*80}")
     print(f"RESULTS")
     print(f"{'='*80}")
     print(f"Total unique participants: {len(all_participants)}")
 
+    # Chronological order: packed key (date, time, sequence), not DDMMYYYY text
+    ordered_ids = sorted(all_participants.keys(), key=sort_key)
+
+    # The same participant typed two ways (e.g. _4 and _04) shares a key
+    ids_by_key = defaultdict(list)
+    for pid in ordered_ids:
+        ids_by_key[encode_or_none(pid)].append(pid)
+    variants = [pids for key, pids in ids_by_key.items() if key is not None and len(pids) > 1]
+    if variants:
+        print(f"IDs written in more than one form: {'; '.join(', '.join(pids) for pids in variants)}")
+
     # Group by CSN folder
     csn_groups = defaultdict(list)
     for pid, pdata in all_participants.items():
-        csn_groups[pdata['csn_folder']].append(pid)
+        csn_groups[pdata.csn_folder].append(pid)
 
     print(f"\nParticipants by CSN folder:")
     for csn in sorted(csn_groups.keys()):
         print(f"  {csn}: {len(csn_groups[csn])} participants")
 
     # Analyze timestamps
+    table = all_participants.conversations
     all_timestamps = []
     for pid, pdata in all_participants.items():
-        for conv in pdata['conversations']:
-            if conv['create_time'] > 0:
-                all_timestamps.append(conv['create_time'])
+        for row in pdata.conversations:
+            if table.create_times[row] > 0:
+                all_timestamps.append(table.create_times[row])
 
     if all_timestamps:
         min_time = min(all_timestamps)
@@ -218,51 +188,57 @@ def main():
         print(f"  Earliest: {datetime.fromtimestamp(min_time)} (unix: {min_time})")
         print(f"  Latest: {datetime.fromtimestamp(max_time)} (unix: {max_time})")
         print(f"  Duration: {(max_time - min_time) / 86400:.1f} days")
+    metrics.checkpoint('report')
 
-    # Save comprehensive participant list
-    output_file = 'all_participants.json'
-    output = {
-        'total_participants': len(all_participants),
-        'extraction_date': datetime.now().isoformat(),
-        'participants': {}
-    }
+    # Save comprehensive participant list, one record per participant
+    output_file = output_path('all_participants', output_format)
+    output = RecordWriter(output_file, 'participants', key='participant_id', ensure_ascii=False, schema=SCHEMA)
+    extraction_date = datetime.now().isoformat()
 
-    for pid in sorted(all_participants.keys()):
+    for pid in ordered_ids:
         pdata = all_participants[pid]
-        output['participants'][pid] = {
-            'csn_folder': pdata['csn_folder'],
-            'num_conversations': len(pdata['conversations']),
-            'first_seen': datetime.fromtimestamp(pdata['first_seen']).isoformat() if pdata['first_seen'] > 0 else None,
-            'sources': list(set(pdata['sources'])),
-            'conversations': [
-                {
-                    'title': c['title'],
-                    'create_time': datetime.fromtimestamp(c['create_time']).isoformat() if c['create_time'] > 0 else None,
-                }
-                for c in pdata['conversations']
-            ]
-        }
-
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
+
+        # Every file any of the participant's conversations appeared in
+        sources = set(pdata.sources)
+        for row in pdata.conversations:
+            sources.update(ingest.sources_for(table.ids[row]))
+
+        # Timestamps stay float epochs (see participant_records.SCHEMA)
+        output.write(all_participants.export(pid, sources), key=pid)
+
+    output.close(total_participants=len(all_participants), extraction_date=extraction_date)
 
     print(f"\nDetailed data saved to: {output_file}")
 
     # Save simple participant list
     participant_list_file = 'participant_ids.txt'
     with open(participant_list_file, 'w', encoding='utf-8') as f:
-        for pid in sorted(all_participants.keys()):
+        for pid in ordered_ids:
             f.write(f"{pid}\n")
+    metrics.checkpoint('write')
 
     print(f"Participant ID list saved to: {participant_list_file}")
 
     # List some participant IDs
     print(f"\nFirst 30 participant IDs:")
-    for i, pid in enumerate(sorted(all_participants.keys())[:30], 1):
+    for i, pid in enumerate(ordered_ids[:30], 1):
         pdata = all_participants[pid]
-        print(f"  {i:3d}. {pid:25s} ({pdata['csn_folder']}, {len(pdata['conversations'])} convs)")
+        print(f"  {i:3d}. {pid:25s} ({pdata.csn_folder}, {len(pdata.conversations)} convs)")
 
     return all_participants
 
 if __name__ == '__main__':
-    all_participants = main()
+    parser = argparse.ArgumentParser(description='Extract participant IDs from all CSN exports')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processes used to parse and scan source files (default: 1, serial)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='re-parse every source instead of reusing .cache/ results')
+    parser.add_argument('--format', choices=FORMATS, default='json',
+                        help='all_participants file format: pretty-printed JSON or streamed '
+                             'JSON Lines, optionally compressed (default: json)')
+    metrics.add_argument(parser, 'extract_all_participants')
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable(args.metrics)
+
+    all_participants = main(workers=args.workers, use_cache=not args.no_cache, output_format=args.format)
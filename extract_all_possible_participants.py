@@ -3,34 +3,36 @@
 Extract EVERY possible participant from ALL conversations
 Try multiple methods to identify unique participants
 """
-import json
-import os
-import re
+import argparse
 from datetime import datetime
 from collections import defaultdict
 
+import metrics
+import near_duplicates
+import participant_id_scanner as scanner
+from accounts import AccountIndex
+from chatgpt_export import iter_message_parts
+from extraction_cache import ExtractionCache
+from ingest import ConversationIngest
+from output_files import FORMATS, RecordWriter, output_path
+from participant_key import sort_key
+
+# Bump when summarize_conversation or the marker scan changes, so cached
+# per-source results are recomputed
+EXTRACTOR_VERSION = 3
+
 def extract_all_participant_markers(conversation):
     """Extract any possible participant identifiers from a conversation"""
     markers = set()
 
-    # Get the full conversation as text
-    mapping = conversation.get('mapping', {})
-    full_text = json.dumps(mapping)
-
-    # Pattern 1: Standard ID format
-    pattern1 = r'[Mm]y [Ii][Dd] is (\d{8}_\d{3,4}_\d+)'
-    for match in re.finditer(pattern1, full_text):
-        markers.add(('explicit_id', match.group(1)))
-
-    # Pattern 2: ID without "my ID is"
-    pattern2 = r'(?:^|\s)(\d{8}_\d{3,4}_\d+)(?:\s|$|[,.])'
-    for match in re.finditer(pattern2, full_text):
-        markers.add(('mentioned_id', match.group(1)))
-
-    # Pattern 3: User email (from user.json correlation)
-    pattern3 = r'uksurveycsn\d+@gmail\.com'
-    for match in re.finditer(pattern3, full_text):
-        markers.add(('email', match.group(0)))
+    # Patterns 1-2: stated and bare IDs in a single pass over each message
+    # part; the survey account comes from the folder's user.json instead
+    for part in iter_message_parts(conversation):
+        for m in scanner.iter_matches(part.text):
+            if m.kind == scanner.EXPLICIT_ID:
+                markers.add(('explicit_id', m.value))
+            elif m.kind not in (scanner.EMBEDDED_ID, scanner.EMAIL):
+                markers.add(('mentioned_id', m.value))
 
     # Pattern 4: Conversation ID as fallback unique identifier
     conv_id = conversation.get('conversation_id', conversation.get('id', ''))
@@ -44,66 +46,85 @@ def extract_all_participant_markers(conversation):
 
     return markers
 
-def main():
+def summarize_conversation(conv):
+    """Reduce a conversation to its metadata and participant markers"""
+    with metrics.stage('scan'):
+        markers = extract_all_participant_markers(conv)
+    with metrics.stage('minhash'):
+        signature = near_duplicates.conversation_signature(conv)
+
+    return {
+        'title': conv.get('title', ''),
+        'create_time': conv.get('create_time', 0),
+        'conversation_id': conv.get('conversation_id', conv.get('id', '')),
+        'markers': markers,
+        'signature': signature
+    }
+
+def main(use_cache=True, corpus=None, output_format='json'):
     print("="*80)
     print("EXHAUSTIVE PARTICIPANT EXTRACTION")
     print("="*80)
 
     all_conversations = []
+    signatures = []     # MinHash of each conversation's user text, in all_conversations order
     all_participant_markers = defaultdict(set)
     conversations_by_method = defaultdict(list)
 
     data_dir = 'data'
 
-    # Load all conversations
-    for root, dirs, files in os.walk(data_dir):
-        if 'conversations.json' in files:
-            filepath = os.path.join(root, 'conversations.json')
-            csn_folder = os.path.basename(os.path.dirname(filepath))
-            if csn_folder == 'csn1':
-                csn_folder = os.path.basename(os.path.dirname(os.path.dirname(filepath)))
-
-            try:
-                with open(filepath, 'r') as f:
-                    conversations = json.load(f)
-
-                    for conv in conversations:
-                        markers = extract_all_participant_markers(conv)
-
-                        conv_data = {
-                            'csn_folder': csn_folder,
-                            'title': conv.get('title', ''),
-                            'create_time': conv.get('create_time', 0),
-                            'conversation_id': conv.get('conversation_id', conv.get('id', '')),
-                            'markers': markers
-                        }
-
-                        all_conversations.append(conv_data)
-
-                        # Categorize by identification method
-                        has_explicit_id = any(m[0] == 'explicit_id' for m in markers)
-                        has_mentioned_id = any(m[0] == 'mentioned_id' for m in markers)
-                        has_email = any(m[0] == 'email' for m in markers)
-
-                        if has_explicit_id:
-                            conversations_by_method['explicit_id'].append(conv_data)
-                            for m in markers:
-                                if m[0] in ['explicit_id', 'mentioned_id']:
-                                    all_participant_markers['explicit_ids'].add(m[1])
-                        elif has_mentioned_id:
-                            conversations_by_method['mentioned_id'].append(conv_data)
-                            for m in markers:
-                                if m[0] in ['mentioned_id']:
-                                    all_participant_markers['mentioned_ids'].add(m[1])
-                        elif has_email:
-                            conversations_by_method['email'].append(conv_data)
-                        else:
-                            conversations_by_method['no_clear_id'].append(conv_data)
-                            # Use conversation_id as unique participant
-                            all_participant_markers['conversation_ids'].add(conv_data['conversation_id'])
-
-            except Exception as e:
-                print(f"Error processing {filepath}: {e}")
+    # Load every unique conversation once; chat.html copies and nested
+    # folders such as CSN1/csn1 are deduplicated by the ingest layer
+    # Reuse the shared corpus when running inside the pipeline
+    ingest = corpus if corpus is not None else ConversationIngest(data_dir)
+    cache = ExtractionCache('extract_all_possible_participants', EXTRACTOR_VERSION) if use_cache and corpus is None else None
+
+    # Account and feedback lookups by folder and conversation id
+    accounts = corpus.accounts if corpus is not None else AccountIndex(data_dir)
+    accounts_seen = defaultdict(int)
+    feedback_count = 0
+
+    # Conversations are written out as they are read; the counts follow at the end
+    output_file = output_path('exhaustive_participant_analysis', output_format)
+    output = RecordWriter(output_file, 'conversations')
+
+    for item in ingest.iter_summaries(summarize_conversation, cache=cache):
+        conv_data = dict(csn_folder=item.csn_folder, **item.conversation)
+        markers = conv_data['markers']
+        signatures.append(conv_data.pop('signature'))
+
+        account = accounts.account(item.csn_folder)
+        conv_data['account_email'] = account.email if account else None
+        conv_data['feedback_ratings'] = [f.rating for f in accounts.feedback_for(item.key)]
+        accounts_seen[conv_data['account_email']] += 1
+        feedback_count += len(conv_data['feedback_ratings'])
+
+        all_conversations.append(conv_data)
+        # Marker sets become sorted [kind, value] pairs so they serialize
+        output.write(dict(conv_data, markers=sorted(list(m) for m in markers)))
+
+        # Categorize by identification method
+        has_explicit_id = any(m[0] == 'explicit_id' for m in markers)
+        has_mentioned_id = any(m[0] == 'mentioned_id' for m in markers)
+
+        if has_explicit_id:
+            conversations_by_method['explicit_id'].append(conv_data)
+            for m in markers:
+                if m[0] in ['explicit_id', 'mentioned_id']:
+                    all_participant_markers['explicit_ids'].add(m[1])
+        elif has_mentioned_id:
+            conversations_by_method['mentioned_id'].append(conv_data)
+            for m in markers:
+                if m[0] in ['mentioned_id']:
+                    all_participant_markers['mentioned_ids'].add(m[1])
+        else:
+            conversations_by_method['no_clear_id'].append(conv_data)
+            # Use conversation_id as unique participant
+            all_participant_markers['conversation_ids'].add(conv_data['conversation_id'])
+
+    if cache:
+        print(cache.summary())
+    metrics.checkpoint('extract')
 
     print(f"\n{'='*80}")
     print(f"IDENTIFICATION METHOD BREAKDOWN")
@@ -112,6 +133,11 @@ def main():
     for method, convs in sorted(conversations_by_method.items()):
         print(f"\n{method}: {len(convs)} conversations")
 
+    attributed = len(all_conversations) - accounts_seen.get(None, 0)
+    print(f"\nAttributed to a survey account (user.json): {attributed} of {len(all_conversations)} "
+          f"conversations, {len(accounts_seen) - (None in accounts_seen)} accounts")
+    print(f"Message feedback records joined: {feedback_count}")
+
     print(f"\n{'='*80}")
     print(f"UNIQUE PARTICIPANT COUNTS")
     print(f"{'='*80}")
@@ -150,11 +176,22 @@ def main():
     print(f"{'='*80}")
     print(f"Total participants: {method3_count}")
 
+    # Method 4: Each conversation, counting re-exported or repeated ones once
+    clusters = near_duplicates.find_clusters(signatures)
+    method4_count = near_duplicates.deduplicated_count(signatures, clusters)
+    print(f"\n{'='*80}")
+    print(f"METHOD 4: Conversations with near-duplicates merged (MinHash/LSH)")
+    print(f"{'='*80}")
+    print(f"Total participants: {method4_count}")
+    print(f"Near-duplicate clusters (user text similarity >= {near_duplicates.THRESHOLD}): "
+          f"{len(clusters)} covering {sum(len(m) for m in clusters)} conversations")
+
     # Final assessment
     print(f"\n{'='*80}")
     print(f"FINAL ASSESSMENT")
     print(f"{'='*80}")
     print(f"\nMost likely participant count: {method1_count} (each conversation = 1 participant)")
+    print(f"Deduplicated participant count: {method4_count} (near-duplicate conversations merged)")
     print(f"Participant IDs explicitly identified: {len(explicit_ids)}")
     print(f"Conversations without explicit ID: {method1_count - len(explicit_ids)}")
 
@@ -169,21 +206,34 @@ def main():
         print(f"  3. Additional CSN folders not included in export")
         print(f"  4. Some sessions had technical issues/no data collected")
 
-    # Save detailed output
-    output = {
-        'total_conversations': len(all_conversations),
-        'unique_participant_ids': len(all_unique_ids),
-        'method1_count': method1_count,
-        'method2_count': method2_count,
-        'method3_count': method3_count,
-        'explicit_ids': sorted(list(explicit_ids)),
-        'conversations': all_conversations
-    }
-
-    with open('exhaustive_participant_analysis.json', 'w') as f:
-        json.dump(output, f, indent=2)
+    metrics.checkpoint('report')
 
-    print(f"\nDetailed analysis saved to: exhaustive_participant_analysis.json")
+    # Save detailed output
+    output.close(
+        total_conversations=len(all_conversations),
+        unique_participant_ids=len(all_unique_ids),
+        method1_count=method1_count,
+        method2_count=method2_count,
+        method3_count=method3_count,
+        method4_count=method4_count,
+        near_duplicate_clusters=[[all_conversations[i]['conversation_id'] for i in members]
+                                 for members in clusters],
+        explicit_ids=sorted(explicit_ids, key=sort_key)
+    )
+
+    print(f"\nDetailed analysis saved to: {output_file}")
+    metrics.checkpoint('write')
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Count participants using every identification method')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='re-parse every source instead of reusing .cache/ results')
+    parser.add_argument('--format', choices=FORMATS, default='json',
+                        help='exhaustive_participant_analysis file format: pretty-printed JSON or '
+                             'streamed JSON Lines, optionally compressed (default: json)')
+    metrics.add_argument(parser, 'extract_all_possible_participants')
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable(args.metrics)
+
+    main(use_cache=not args.no_cache, output_format=args.format)
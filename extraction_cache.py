@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of per-source extraction results
+
+Results live under .cache/<name>/, one file per source, and are keyed by the
+source path, size, mtime and content hash plus the extractor version. A
+source whose size and mtime are unchanged is a hit without being read; if
+only the mtime changed, the content hash decides. Files inside a zipped
+export carry the archive's mtime. A result that depends on other files (a
+chat.html found identical to its conversations.json) also records their
+size, mtime and hash, and is stale as soon as one of them changes.
+
+Usage:
+    python extraction_cache.py stats
+    python extraction_cache.py invalidate [name ...]
+"""
+import argparse
+import hashlib
+import os
+import pickle
+import shutil
+
+import metrics
+from export_sources import file_stat
+from ingest import file_fingerprint
+
+CACHE_DIR = '.cache'
+
+
+class ExtractionCache:
+    """Per-source result cache for one extractor"""
+
+    def __init__(self, name, version, cache_dir=CACHE_DIR):
+        self.name = name
+        self.version = version
+        self.directory = os.path.join(cache_dir, name)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path):
+        """Return the cached result for path, or None if missing or stale"""
+        entry = self._load(path)
+        # Entries written before dependencies were recorded are stale
+        if entry is not None and entry['version'] == self.version and 'dependencies' in entry:
+            touched = False
+            fresh = True
+            for file_path, file_entry in [(path, entry)] + list(entry['dependencies'].items()):
+                unchanged = _unchanged(file_path, file_entry)
+                if unchanged is None:
+                    fresh = False
+                    break
+                touched = touched or unchanged
+            if fresh:
+                if touched:
+                    # Touched but unchanged; remember the new mtimes
+                    self._store(path, entry)
+                self.hits += 1
+                metrics.count('cache_hits')
+                return entry['result']
+
+        self.misses += 1
+        metrics.count('cache_misses')
+        return None
+
+    def put(self, path, result, sha1, dependencies=None):
+        """Store the result of extracting path, whose content hash is sha1
+
+        dependencies maps other files the result was derived from to their
+        content hashes; the entry is stale when any of them changes.
+        """
+        stat = file_stat(path)
+        self._store(path, {
+            'path': path,
+            'size': stat.size,
+            'mtime_ns': stat.mtime_ns,
+            'sha1': sha1,
+            'version': self.version,
+            'dependencies': {dependency: _file_entry(dependency, dependency_sha1)
+                             for dependency, dependency_sha1 in (dependencies or {}).items()},
+            'result': result
+        })
+
+    def summary(self):
+        """One-line hit/miss report"""
+        return f"Cache {self.directory}: {self.hits} hits, {self.misses} misses"
+
+    def _entry_path(self, path):
+        digest = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + '.pickle')
+
+    def _load(self, path):
+        try:
+            with open(self._entry_path(path), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"  Ignoring unreadable cache entry for {path}: {e}")
+            return None
+
+    def _store(self, path, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        entry_path = self._entry_path(path)
+        tmp_path = entry_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, entry_path)
+
+
+def _file_entry(path, sha1):
+    stat = file_stat(path)
+    return {'size': stat.size, 'mtime_ns': stat.mtime_ns, 'sha1': sha1}
+
+
+def _unchanged(path, file_entry):
+    """Compare a file with its recorded size, mtime and hash
+
+    Returns False if it is untouched, True if only its mtime changed (the
+    new one is stored in file_entry) and None if it changed or is gone.
+    """
+    try:
+        stat = file_stat(path)
+    except (OSError, KeyError):
+        return None
+    if file_entry['size'] != stat.size:
+        return None
+    if file_entry['mtime_ns'] == stat.mtime_ns:
+        return False
+    if file_entry['sha1'] != file_fingerprint(path):
+        return None
+    file_entry['mtime_ns'] = stat.mtime_ns
+    return True
+
+
+def invalidate(names=None, cache_dir=CACHE_DIR):
+    """Delete cached results for the given extractors, or all of them"""
+    if not os.path.isdir(cache_dir):
+        return []
+
+    removed = []
+    for name in sorted(os.listdir(cache_dir)):
+        if names and name not in names:
+            continue
+        shutil.rmtree(os.path.join(cache_dir, name))
+        removed.append(name)
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the extraction cache')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('stats', help='show cached entries per extractor')
+    invalidate_parser = subparsers.add_parser('invalidate', help='delete cached results')
+    invalidate_parser.add_argument('names', nargs='*', help='extractors to invalidate (default: all)')
+    args = parser.parse_args()
+
+    if args.command == 'invalidate':
+        removed = invalidate(args.names, args.cache_dir)
+        print(f"Invalidated: {', '.join(removed) if removed else 'nothing cached'}")
+        return
+
+    if not os.path.isdir(args.cache_dir):
+        print(f"No cache at {args.cache_dir}")
+        return
+    for name in sorted(os.listdir(args.cache_dir)):
+        directory = os.path.join(args.cache_dir, name)
+        entries = [e for e in os.listdir(directory) if e.endswith('.pickle')]
+        size = sum(os.path.getsize(os.path.join(directory, e)) for e in entries)
+        print(f"  {name}: {len(entries)} sources, {size / 1024:.1f} KB")
+
+
+if __name__ == '__main__':
+    main()
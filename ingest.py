@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Ingest layer: read every unique conversation in the export exactly once
+
+Each CSN folder ships the same conversations in both conversations.json and
+chat.html, and some folders contain nested copies (CSN1/csn1/). Sources
+that share their size with another source are fingerprinted by content
+hash to skip byte-identical copies, a chat.html whose payload is
+byte-identical to its conversations.json is skipped, and remaining
+duplicates are dropped by conversation id. Every file a conversation appeared in is kept as
+provenance.
+
+CSN folders may also be zipped exports; their files are read straight out
+of the archive (see export_sources).
+"""
+import hashlib
+import json
+import os
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import metrics
+from chatgpt_export import iter_conversations, read_html_json_data
+from export_sources import file_exists, list_folders, open_file, walk_folder
+
+Source = namedtuple('Source', ['csn_folder', 'path', 'kind', 'size'])
+IngestedConversation = namedtuple('IngestedConversation', ['csn_folder', 'path', 'key', 'conversation'])
+SourceResult = namedtuple('SourceResult', ['source', 'fingerprint', 'identical_to', 'parsed', 'records', 'error'])
+
+# Files holding conversations, in the order they are read within a directory
+SOURCE_FILES = [('conversations.json', 'json'), ('chat.html', 'html')]
+
+
+def find_sources(data_dir='data'):
+    """List conversation sources in sorted CSN folder order
+
+    Folder identity is the top-level directory or archive under data_dir,
+    so nested copies such as CSN1/csn1/ are attributed to CSN1.
+    """
+    sources = []
+    for csn_folder, csn_path in list_folders(data_dir):
+        for root, files in walk_folder(csn_path):
+            for filename, kind in SOURCE_FILES:
+                if filename in files:
+                    sources.append(Source(csn_folder, os.path.join(root, filename), kind, files[filename]))
+
+    return sources
+
+
+def find_files(filename, data_dir='data'):
+    """List (csn_folder, path) for every copy of filename, in sorted folder order"""
+    found = []
+    for csn_folder, csn_path in list_folders(data_dir):
+        for root, files in walk_folder(csn_path):
+            if filename in files:
+                found.append((csn_folder, os.path.join(root, filename)))
+
+    return found
+
+
+def conversation_key(conv):
+    """Stable identity for a conversation: its id, or a hash of its content"""
+    conv_id = conv.get('conversation_id') or conv.get('id')
+    if conv_id:
+        return conv_id
+    return hashlib.sha1(json.dumps(conv, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def file_fingerprint(path, block_size=1 << 20):
+    """SHA-1 of a file's bytes"""
+    digest = hashlib.sha1()
+    with open_file(path) as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+            metrics.count('bytes_hashed', len(block))
+    return digest.hexdigest()
+
+
+def read_source(source, summarize):
+    """Read one source file and summarize each conversation in it
+
+    Runs in worker processes, so it only depends on the file system: the
+    fingerprint and the byte-identical chat.html check are computed here and
+    interpreted by ConversationIngest in the parent. records is a list of
+    (conversation key, summarize(conversation)) pairs.
+    """
+    fingerprint = file_fingerprint(source.path)
+    identical_to = None
+    records = []
+    parsed = True
+    error = None
+
+    try:
+        if source.kind == 'json':
+            conversations = iter_conversations(source.path)
+        else:
+            sibling = os.path.join(os.path.dirname(source.path), 'conversations.json')
+            embedded = read_html_json_data(source.path, sibling if file_exists(sibling) else None)
+            if embedded is None:
+                conversations = None
+                parsed = False
+            elif embedded.identical:
+                conversations = None
+                identical_to = sibling
+            else:
+                conversations = embedded.conversations
+
+        for conv in conversations or ():
+            records.append((conversation_key(conv), summarize(conv)))
+
+    except ValueError as e:
+        parsed = False
+        error = str(e)
+
+    return SourceResult(source, fingerprint, identical_to, parsed, records, error)
+
+
+class ConversationIngest:
+    """Iterate over the unique conversations of an export
+
+    Each conversation is yielded once, from the first source it appears in.
+    provenance maps conversation keys to every file the conversation was
+    found in and is complete once iteration has finished.
+    """
+
+    def __init__(self, data_dir='data'):
+        self.sources = find_sources(data_dir)
+        self.provenance = defaultdict(list)
+        self.unparsed = []     # sources with no decodable conversations
+        self.duplicates = 0    # conversation copies skipped
+        self._file_keys = {}   # path -> keys of the conversations it holds
+        self._fingerprints = {}
+        self._sizes = Counter(source.size for source in self.sources)
+
+    def __iter__(self):
+        for source in self.sources:
+            with metrics.source(source.path, source.size):
+                if self._is_copy(source, self._fingerprint(source)):
+                    continue
+
+                try:
+                    conversations, identical_to = self._open(source)
+                    if identical_to:
+                        self._alias(identical_to, source.path)
+                        continue
+                    if conversations is None:
+                        self.unparsed.append(source)
+                        continue
+
+                    for conv in conversations:
+                        metrics.count('conversations_parsed')
+                        key = conversation_key(conv)
+                        if self._add(source, key):
+                            yield IngestedConversation(source.csn_folder, source.path, key, conv)
+
+                except ValueError as e:
+                    print(f"  Error processing {source.path}: {e}")
+                    self.unparsed.append(source)
+
+    def iter_summaries(self, summarize, workers=1, cache=None):
+        """Like iterating, but yield summarize(conversation) for each one
+
+        With workers > 1 the sources are read and summarized in a process
+        pool; results are consumed in source order, so deduplication and
+        output are identical to a serial run. summarize must be a picklable
+        module-level function. If an ExtractionCache is given, unchanged
+        sources are taken from it and only new or changed ones are read.
+        """
+        if workers <= 1 and cache is None:
+            for item in self:
+                yield item._replace(conversation=summarize(item.conversation))
+            return
+
+        for result in self._read_sources(summarize, workers, cache):
+            source = result.source
+            with metrics.source(source.path, source.size):
+                if self._is_copy(source, result.fingerprint):
+                    continue
+                if result.identical_to in self._file_keys:
+                    self._alias(result.identical_to, source.path)
+                    continue
+
+                for key, summary in result.records:
+                    if self._add(source, key):
+                        yield IngestedConversation(source.csn_folder, source.path, key, summary)
+
+                if result.error:
+                    print(f"  Error processing {source.path}: {result.error}")
+                if not result.parsed:
+                    self.unparsed.append(source)
+
+    def _read_sources(self, summarize, workers, cache):
+        """Yield a SourceResult for every source in order, from cache where possible"""
+        cached = [cache.get(source.path) if cache else None for source in self.sources]
+        missing = [source for source, result in zip(self.sources, cached) if result is None]
+
+        reader = partial(read_source, summarize=summarize)
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 and len(missing) > 1 else None
+        fingerprints = {}
+        try:
+            fresh = pool.map(reader, missing) if pool else map(reader, missing)
+            for source, result in zip(self.sources, cached):
+                if result is None:
+                    result = next(fresh)
+                    metrics.count('bytes_read', source.size, kind=source.kind)
+                    metrics.count('conversations_parsed', len(result.records))
+                    if cache:
+                        # An identical chat.html holds whatever its sibling
+                        # holds, so its entry is only valid with that sibling
+                        dependencies = None
+                        if result.identical_to:
+                            sibling_sha1 = fingerprints.get(result.identical_to) or file_fingerprint(result.identical_to)
+                            dependencies = {result.identical_to: sibling_sha1}
+                        cache.put(source.path, result, result.fingerprint, dependencies)
+                fingerprints[source.path] = result.fingerprint
+                yield result._replace(source=source)
+        finally:
+            if pool:
+                pool.shutdown()
+
+    def _fingerprint(self, source):
+        """Content hash of a source, or just its path if no other source has its size
+
+        A byte-identical copy must have the same size, so a source with a
+        unique size is not read an extra time to hash it.
+        """
+        if self._sizes[source.size] < 2:
+            return source.path
+        return file_fingerprint(source.path)
+
+    def _is_copy(self, source, fingerprint):
+        """Register a source; alias it and return True if its bytes were seen"""
+        original = self._fingerprints.setdefault(fingerprint, source.path)
+        if original != source.path:
+            metrics.count('duplicate_sources')
+            self._alias(original, source.path)
+            return True
+        self._file_keys[source.path] = []
+        return False
+
+    def _add(self, source, key):
+        """Record that source holds key; return True the first time key is seen"""
+        self._file_keys[source.path].append(key)
+        seen = key in self.provenance
+        self.provenance[key].append(source.path)
+        if seen:
+            self.duplicates += 1
+            metrics.count('duplicate_conversations')
+        return not seen
+
+    def _open(self, source):
+        """Return (conversations, identical_to) for a source
+
+        identical_to is the sibling conversations.json when a chat.html
+        payload is byte-identical to it; conversations is None then, and
+        also for pages without embedded data.
+        """
+        metrics.count('bytes_read', source.size, kind=source.kind)
+        if source.kind == 'json':
+            return iter_conversations(source.path), None
+
+        sibling = os.path.join(os.path.dirname(source.path), 'conversations.json')
+        if sibling not in self._file_keys:
+            sibling = None
+
+        embedded = read_html_json_data(source.path, sibling)
+        if embedded is None:
+            return None, None
+        if embedded.identical:
+            return None, sibling
+        return embedded.conversations, None
+
+    def _alias(self, original, path):
+        """Record path as another copy of every conversation in original"""
+        keys = self._file_keys[original]
+        self._file_keys[path] = keys
+        for key in keys:
+            self.provenance[key].append(path)
+        self.duplicates += len(keys)
+        metrics.count('duplicate_conversations', len(keys))
+
+    def sources_for(self, key):
+        """Return the sorted, distinct files a conversation appeared in"""
+        return sorted(set(self.provenance.get(key, ())))
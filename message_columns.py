@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Per-message columnar export for downstream statistics
+
+One row per message of every unique conversation, in tree order (parents
+before children, branches in children order):
+
+    conversation   row of the conversation in conversation_ids
+    csn_folder     category code
+    role           category code (user, assistant, system, tool)
+    create_time    epoch seconds, NaN when the message has none
+    content_type   category code (text, code, multimodal_text, ...)
+    chars, words   of the message's text: its string parts, or the text
+                   field of code and execution_output content
+    model_slug     category code, -1 for messages no model wrote
+    active         on the thread the participant ended on (current_node)
+
+With the default npy format every column is a NumPy .npy file in the
+output directory, next to columns.json with the row count, the category
+labels and the conversation ids; load_columns() memory-maps the columns
+back, so even millions of rows load without parsing anything. The csv
+format writes the same rows, with labels instead of codes, to a single
+file. Rows are written conversation by conversation, so memory is bounded
+by the largest conversation rather than the export.
+
+Usage:
+    python message_columns.py [--format npy|csv] [--output message_columns]
+"""
+import argparse
+import csv
+import json
+import os
+import time
+
+import numpy as np
+
+import metrics
+from conversation_thread import active_path, tree_order
+from ingest import ConversationIngest
+
+# Column name -> dtype, in file order
+COLUMNS = {
+    'conversation': np.dtype('<i4'),
+    'csn_folder': np.dtype('<i2'),
+    'role': np.dtype('<i2'),
+    'create_time': np.dtype('<f8'),
+    'content_type': np.dtype('<i2'),
+    'chars': np.dtype('<i4'),
+    'words': np.dtype('<i4'),
+    'model_slug': np.dtype('<i2'),
+    'active': np.dtype('?'),
+}
+
+# Columns stored as codes into columns.json's category labels
+CATEGORIES = ['csn_folder', 'role', 'content_type', 'model_slug']
+
+METADATA_FILE = 'columns.json'
+
+# Rows copied per step when the raw column files become .npy files
+COPY_ROWS = 1 << 20
+
+
+def iter_message_rows(conversation):
+    """Yield (role, create_time, content_type, chars, words, model_slug, active) per message"""
+    mapping = conversation.get('mapping') or {}
+    active = set(active_path(conversation))
+
+    for node_id in tree_order(conversation):
+        message = mapping[node_id].get('message')
+        if not message:
+            continue
+        content = message.get('content') or {}
+        texts = [part for part in content.get('parts') or () if isinstance(part, str)]
+        if isinstance(content.get('text'), str):
+            texts.append(content['text'])
+        yield (
+            (message.get('author') or {}).get('role'),
+            message.get('create_time'),
+            content.get('content_type'),
+            sum(len(text) for text in texts),
+            sum(len(text.split()) for text in texts),
+            (message.get('metadata') or {}).get('model_slug'),
+            node_id in active
+        )
+
+
+class Codes:
+    """Category labels in first-seen order; None is code -1"""
+
+    def __init__(self):
+        self.labels = []
+        self._codes = {}
+
+    def code(self, label):
+        if label is None:
+            return -1
+        if label not in self._codes:
+            self._codes[label] = len(self.labels)
+            self.labels.append(label)
+        return self._codes[label]
+
+
+class ColumnWriter:
+    """Append rows to one raw file per column; close() turns them into .npy files"""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.rows = 0
+        self.codes = {name: Codes() for name in CATEGORIES}
+        self.conversation_ids = []
+        self._raw = {name: open(self._path(name) + '.tmp', 'wb') for name in COLUMNS}
+
+    def _path(self, name):
+        return os.path.join(self.directory, name + '.npy')
+
+    def write_conversation(self, conversation_id, csn_folder, rows):
+        """Append the message rows of one conversation"""
+        conversation = len(self.conversation_ids)
+        self.conversation_ids.append(conversation_id)
+        folder = self.codes['csn_folder'].code(csn_folder)
+
+        columns = {name: [] for name in COLUMNS}
+        for role, create_time, content_type, chars, words, model_slug, active in rows:
+            columns['conversation'].append(conversation)
+            columns['csn_folder'].append(folder)
+            columns['role'].append(self.codes['role'].code(role))
+            columns['create_time'].append(np.nan if create_time is None else create_time)
+            columns['content_type'].append(self.codes['content_type'].code(content_type))
+            columns['chars'].append(chars)
+            columns['words'].append(words)
+            columns['model_slug'].append(self.codes['model_slug'].code(model_slug))
+            columns['active'].append(active)
+
+        for name, dtype in COLUMNS.items():
+            np.asarray(columns[name], dtype=dtype).tofile(self._raw[name])
+        self.rows += len(columns['conversation'])
+
+    def close(self):
+        for name, dtype in COLUMNS.items():
+            raw_path = self._raw[name].name
+            self._raw[name].close()
+            column = np.lib.format.open_memmap(self._path(name), mode='w+', dtype=dtype, shape=(self.rows,))
+            with open(raw_path, 'rb') as raw:
+                for start in range(0, self.rows, COPY_ROWS):
+                    chunk = np.fromfile(raw, dtype=dtype, count=min(COPY_ROWS, self.rows - start))
+                    column[start:start + len(chunk)] = chunk
+            column.flush()
+            del column
+            os.remove(raw_path)
+
+        metadata = {
+            'rows': self.rows,
+            'columns': {name: dtype.str for name, dtype in COLUMNS.items()},
+            'categories': {name: self.codes[name].labels for name in CATEGORIES},
+            'conversation_ids': self.conversation_ids
+        }
+        with open(os.path.join(self.directory, METADATA_FILE), 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, indent=2, ensure_ascii=False)
+
+
+class CsvWriter:
+    """The same rows as one CSV file, with category labels instead of codes"""
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(['conversation_id', 'csn_folder', 'role', 'create_time', 'content_type',
+                               'chars', 'words', 'model_slug', 'active'])
+
+    def write_conversation(self, conversation_id, csn_folder, rows):
+        for role, create_time, content_type, chars, words, model_slug, active in rows:
+            self._writer.writerow([conversation_id, csn_folder, role or '',
+                                   '' if create_time is None else create_time, content_type or '',
+                                   chars, words, model_slug or '', int(active)])
+            self.rows += 1
+
+    def close(self):
+        self._file.close()
+
+
+def load_columns(directory='message_columns', mmap=True):
+    """Return ({column: array}, metadata) of an npy export
+
+    Columns are memory-mapped unless mmap is False; metadata is columns.json
+    (rows, categories, conversation_ids).
+    """
+    with open(os.path.join(directory, METADATA_FILE), encoding='utf-8') as f:
+        metadata = json.load(f)
+    columns = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode='r' if mmap else None)
+               for name in metadata['columns']}
+    return columns, metadata
+
+
+def main(output_format='npy', output=None, corpus=None):
+    print("="*80)
+    print("PER-MESSAGE COLUMNAR EXPORT")
+    print("="*80)
+
+    data_dir = 'data'
+    output = output or ('message_columns' if output_format == 'npy' else 'messages.csv')
+    writer = ColumnWriter(output) if output_format == 'npy' else CsvWriter(output)
+
+    # Reuse the shared corpus when running inside the pipeline
+    conversations = corpus if corpus is not None else ConversationIngest(data_dir)
+    conversation_count = 0
+    for item in conversations:
+        with metrics.stage('rows'):
+            writer.write_conversation(item.key, item.csn_folder, iter_message_rows(item.conversation))
+        conversation_count += 1
+    writer.close()
+    metrics.count('messages', writer.rows)
+    metrics.checkpoint('write')
+
+    print(f"\nWrote {writer.rows} messages of {conversation_count} conversations to: {output}")
+
+    if output_format == 'npy':
+        start = time.perf_counter()
+        columns, metadata = load_columns(output)
+        roles = np.bincount(columns['role'][columns['role'] >= 0], minlength=len(metadata['categories']['role']))
+        elapsed = time.perf_counter() - start
+        print(f"Reloaded {len(columns['role'])} rows in {elapsed:.3f}s")
+        print(f"\nMessages by role:")
+        for label, count in zip(metadata['categories']['role'], roles):
+            print(f"  {label:10s} {count}")
+        print(f"Messages on the active thread: {int(columns['active'].sum())}")
+        metrics.checkpoint('load')
+
+    return writer.rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export one row per message as NumPy columns or CSV')
+    parser.add_argument('--format', choices=['npy', 'csv'], default='npy',
+                        help='npy column files in a directory, or one compact CSV (default: npy)')
+    parser.add_argument('--output', help='output directory (npy) or file (csv) '
+                                         '(default: message_columns/ or messages.csv)')
+    metrics.add_argument(parser, 'message_columns')
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable(args.metrics)
+
+    main(output_format=args.format, output=args.output)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Opt-in run metrics: stage and per-source timings, counters, peak memory
+
+Disabled by default. While disabled, count() and checkpoint() are empty
+functions and stage()/source() return one shared no-op context manager,
+so the hooks can stay wired into the hot paths. Callers must look the hooks
+up as metrics.count etc. at call time, since enable() swaps them. A script
+enables collection with --metrics, and the report is written next to its
+outputs on exit as JSON, or as Prometheus text exposition if the file name
+ends in .prom.
+
+Timings of a source cover everything from opening it to finishing it,
+including work the caller does on each conversation in between. Work done
+in --workers processes is not counted.
+"""
+import atexit
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import nullcontext
+from datetime import datetime
+
+_NOOP = nullcontext()
+
+_stages = {}
+_sources = {}
+_counters = {}
+_started = None
+_path = None
+_active = []   # names of the stages currently entered, outermost first
+_last = {}     # stage prefix -> (wall, cpu) of its last checkpoint
+
+
+def count(name, n=1, **labels):
+    """Add n to a counter (no-op until enabled)"""
+
+
+def stage(name):
+    """Context manager timing a named stage; repeated entries accumulate
+
+    Stages and checkpoints inside a stage are recorded as outer/inner.
+    """
+    return _NOOP
+
+
+def source(path, size):
+    """Context manager timing one source file of size bytes"""
+    return _NOOP
+
+
+def checkpoint(name):
+    """Book the time since the previous checkpoint (or since the enclosing
+    stage or the run began) to stage name"""
+
+
+def _count(name, n=1, **labels):
+    key = name
+    if labels:
+        key += '{' + ','.join(f'{k}="{v}"' for k, v in sorted(labels.items())) + '}'
+    _counters[key] = _counters.get(key, 0) + n
+
+
+def _stats(table, key, **extra):
+    stats = table.get(key)
+    if stats is None:
+        stats = table[key] = dict({'wall_s': 0.0, 'cpu_s': 0.0, 'calls': 0}, **extra)
+    return stats
+
+
+def _book(stats, wall, cpu, rss=False):
+    stats['wall_s'] += wall
+    stats['cpu_s'] += cpu
+    stats['calls'] += 1
+    if rss:
+        # Peak memory so far; skipped for stages entered once per conversation
+        stats['max_rss_kb'] = peak_rss_kb()
+
+
+class _Timer:
+    """Times one entry of a stage (name given) or a source (name None)"""
+    __slots__ = ('stats', 'name', 'wall', 'cpu')
+
+    def __init__(self, stats, name=None):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        if self.name is not None:
+            _active.append(self.name)
+            _last['/'.join(_active)] = (self.wall, self.cpu)
+        return self
+
+    def __exit__(self, *exc):
+        if self.name is not None:
+            _active.pop()
+        _book(self.stats, time.perf_counter() - self.wall, time.process_time() - self.cpu,
+              rss=self.name is None)
+        return False
+
+
+def _stage(name):
+    return _Timer(_stats(_stages, '/'.join(_active + [name])), name)
+
+
+def _source(path, size):
+    return _Timer(_stats(_sources, path, size_bytes=size))
+
+
+def _checkpoint(name):
+    prefix = '/'.join(_active)
+    wall, cpu = time.perf_counter(), time.process_time()
+    last_wall, last_cpu = _last[prefix]
+    _book(_stats(_stages, '/'.join(_active + [name])), wall - last_wall, cpu - last_cpu, rss=True)
+    _last[prefix] = (wall, cpu)
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KB
+
+    Linux's VmHWM is preferred: ru_maxrss also covers the parent's memory
+    from before exec when a script is started as a subprocess.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return max_rss_kb(resource.getrusage(resource.RUSAGE_SELF))
+
+
+def max_rss_kb(usage):
+    """ru_maxrss of a resource usage in KB (macOS reports bytes)"""
+    return usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+
+
+def enabled():
+    return _started is not None
+
+
+def enable(path=None):
+    """Start collecting; if path is given the report is written there at exit"""
+    global count, stage, source, checkpoint, _started, _path
+    count, stage, source, checkpoint = _count, _stage, _source, _checkpoint
+    _started = _last[''] = (time.perf_counter(), time.process_time())
+    if path and _path is None:
+        atexit.register(lambda: write(_path))
+    _path = path
+
+
+def report():
+    """Return the collected metrics as a dict"""
+    wall, cpu = _started
+    return {
+        'script': os.path.basename(sys.argv[0]),
+        'finished': datetime.now().isoformat(),
+        'wall_s': round(time.perf_counter() - wall, 6),
+        'cpu_s': round(time.process_time() - cpu, 6),
+        'max_rss_kb': peak_rss_kb(),
+        'stages': _rounded(_stages),
+        'sources': _rounded(_sources),
+        'counters': dict(sorted(_counters.items()))
+    }
+
+
+def _rounded(table):
+    return {name: {k: round(v, 6) if isinstance(v, float) else v for k, v in stats.items()}
+            for name, stats in table.items()}
+
+
+def to_prometheus(data):
+    """Render a report dict in the Prometheus text exposition format"""
+    script = data['script']
+    lines = [
+        '# TYPE export_run_seconds gauge',
+        f'export_run_seconds{{script="{script}",clock="wall"}} {data["wall_s"]}',
+        f'export_run_seconds{{script="{script}",clock="cpu"}} {data["cpu_s"]}',
+        '# TYPE export_max_rss_kilobytes gauge',
+        f'export_max_rss_kilobytes{{script="{script}"}} {data["max_rss_kb"]}',
+        '# TYPE export_stage_seconds gauge',
+    ]
+    for name, stats in data['stages'].items():
+        for clock in ('wall', 'cpu'):
+            lines.append(f'export_stage_seconds{{script="{script}",stage="{name}",clock="{clock}"}} '
+                         f'{stats[clock + "_s"]}')
+    lines.append('# TYPE export_source_seconds gauge')
+    for path, stats in data['sources'].items():
+        lines.append(f'export_source_seconds{{script="{script}",source="{path}"}} {stats["wall_s"]}')
+    lines.append('# TYPE export_events_total counter')
+    for key, value in data['counters'].items():
+        name, _, labels = key.partition('{')
+        labels = f'script="{script}",event="{name}"' + (',' + labels.rstrip('}') if labels else '')
+        lines.append(f'export_events_total{{{labels}}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def write(path):
+    """Write the report to path (.prom for Prometheus text, JSON otherwise)"""
+    data = report()
+    with open(path, 'w', encoding='utf-8') as f:
+        if path.endswith('.prom'):
+            f.write(to_prometheus(data))
+        else:
+            json.dump(data, f, indent=2)
+    print(f"Metrics saved to: {path}")
+
+
+def add_argument(parser, script):
+    """Add the standard --metrics [FILE] option to a script's parser"""
+    parser.add_argument('--metrics', nargs='?', const=f'{script}_metrics.json', metavar='FILE',
+                        help=f'record stage timings and counters to FILE '
+                             f'(default: {script}_metrics.json; .prom for Prometheus text)')
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate conversations across CSN folders (MinHash + LSH)
+
+A conversation re-exported from another computer, or retried by the same
+participant, repeats most of what the participant typed. Each conversation's
+user-message text is cut into word shingles and reduced to a MinHash
+signature; the share of equal signature positions estimates the Jaccard
+similarity of two shingle sets. Signatures are split into bands and
+conversations sharing any band land in the same bucket (LSH), so only
+bucket mates are compared - each against the first conversation in its
+bucket - and the run is linear in the number of conversations instead of
+quadratic. Candidates at or above the threshold are merged into clusters.
+
+Usage:
+    python near_duplicates.py [--threshold 0.8] [--no-cache]
+"""
+import argparse
+import json
+import re
+import zlib
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+
+import metrics
+from chatgpt_export import iter_message_parts
+from extraction_cache import ExtractionCache
+from ingest import ConversationIngest
+
+# Bump when the signature parameters or summarize_conversation change, so
+# cached per-source results are recomputed
+EXTRACTOR_VERSION = 1
+
+NUM_PERM = 128        # signature length
+BANDS = 32            # LSH bands of NUM_PERM // BANDS rows each
+SHINGLE_WORDS = 3
+THRESHOLD = 0.8       # estimated Jaccard similarity for a near-duplicate
+
+# Universal hashes (a * x + b) mod p over 31-bit shingle hashes; fixed seed so
+# signatures from different runs and the cache are comparable
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20241201)
+_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.int64)
+_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.int64)
+
+_WORD = re.compile(r'\w+')
+
+
+def user_text(conv):
+    """Everything the participant typed in a conversation"""
+    return '\n'.join(part.text for part in iter_message_parts(conv) if part.role == 'user')
+
+
+def shingles(text, k=SHINGLE_WORDS):
+    """Set of k-word shingles of lowercased text (the whole text if shorter)"""
+    words = _WORD.findall(text.lower())
+    if len(words) <= k:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+
+def signature(shingle_set):
+    """MinHash signature (NUM_PERM uint32) of a shingle set; None if empty"""
+    if not shingle_set:
+        return None
+    hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) % _PRIME for s in shingle_set),
+                         dtype=np.int64, count=len(shingle_set))
+    return ((np.outer(hashes, _A) + _B) % _PRIME).min(axis=0).astype(np.uint32)
+
+
+def conversation_signature(conv):
+    return signature(shingles(user_text(conv)))
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+def find_clusters(signatures, threshold=THRESHOLD, bands=BANDS):
+    """Group near-duplicate signatures; returns clusters as sorted index lists
+
+    signatures is a list of signatures (None for conversations without user
+    text, which are never clustered). Only clusters of two or more are
+    returned, ordered by their first index.
+    """
+    parent = list(range(len(signatures)))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    rows = NUM_PERM // bands
+    for band in range(bands):
+        buckets = {}
+        for i, sig in enumerate(signatures):
+            if sig is None:
+                continue
+            first = buckets.setdefault(sig[band * rows:(band + 1) * rows].tobytes(), i)
+            if first != i and root(i) != root(first):
+                metrics.count('lsh_candidates')
+                if similarity(sig, signatures[first]) >= threshold:
+                    parent[root(i)] = root(first)
+
+    clusters = defaultdict(list)
+    for i, sig in enumerate(signatures):
+        if sig is not None:
+            clusters[root(i)].append(i)
+    return sorted((members for members in clusters.values() if len(members) > 1), key=lambda m: m[0])
+
+
+def describe_cluster(signatures, members):
+    """Similarity of each member to the cluster's first conversation"""
+    first = signatures[members[0]]
+    scores = [similarity(first, signatures[i]) for i in members[1:]]
+    return {'min_similarity': min(scores), 'mean_similarity': sum(scores) / len(scores)}
+
+
+def deduplicated_count(signatures, clusters):
+    """Conversations left when every cluster counts as one"""
+    return len(signatures) - sum(len(members) - 1 for members in clusters)
+
+
+def summarize_conversation(conv):
+    """Reduce a conversation to what the cluster report shows, plus its signature"""
+    with metrics.stage('minhash'):
+        sig = conversation_signature(conv)
+    return {
+        'title': conv.get('title', ''),
+        'create_time': conv.get('create_time', 0),
+        'signature': sig
+    }
+
+
+def main(threshold=THRESHOLD, use_cache=True, corpus=None):
+    print("="*80)
+    print("NEAR-DUPLICATE CONVERSATIONS (MinHash/LSH)")
+    print("="*80)
+
+    data_dir = 'data'
+
+    # Reuse the shared corpus when running inside the pipeline
+    ingest = corpus if corpus is not None else ConversationIngest(data_dir)
+    cache = ExtractionCache('near_duplicates', EXTRACTOR_VERSION) if use_cache and corpus is None else None
+    items = list(ingest.iter_summaries(summarize_conversation, cache=cache))
+    if cache:
+        print(cache.summary())
+    metrics.checkpoint('extract')
+
+    signatures = [item.conversation['signature'] for item in items]
+    clusters = find_clusters(signatures, threshold)
+    metrics.checkpoint('cluster')
+
+    without_text = sum(1 for sig in signatures if sig is None)
+    print(f"\nConversations: {len(items)} ({without_text} without user text)")
+    print(f"Near-duplicate clusters (similarity >= {threshold}): {len(clusters)} "
+          f"covering {sum(len(m) for m in clusters)} conversations")
+    print(f"Deduplicated conversation count: {deduplicated_count(signatures, clusters)}")
+
+    output_clusters = []
+    for members in clusters:
+        scores = describe_cluster(signatures, members)
+        folders = sorted({items[i].csn_folder for i in members})
+        print(f"\n  {len(members)} conversations, similarity {scores['min_similarity']:.2f}-1.00 "
+              f"(mean {scores['mean_similarity']:.2f}), folders: {', '.join(folders)}")
+        for i in members:
+            print(f"    {items[i].csn_folder:6s} {items[i].key}  {items[i].conversation['title']}")
+
+        output_clusters.append(dict(scores, conversations=[
+            {
+                'conversation_id': items[i].key,
+                'csn_folder': items[i].csn_folder,
+                'title': items[i].conversation['title'],
+                'similarity': similarity(signatures[members[0]], signatures[i])
+            }
+            for i in members
+        ]))
+    metrics.checkpoint('report')
+
+    output = {
+        'analysis_date': datetime.now().isoformat(),
+        'threshold': threshold,
+        'num_perm': NUM_PERM,
+        'bands': BANDS,
+        'total_conversations': len(items),
+        'deduplicated_count': deduplicated_count(signatures, clusters),
+        'clusters': output_clusters
+    }
+    with open('near_duplicates.json', 'w', encoding='utf-8') as f:
+        json.dump(output, f, indent=2, ensure_ascii=False)
+    metrics.checkpoint('write')
+
+    print(f"\nCluster report saved to: near_duplicates.json")
+    return output
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Find near-duplicate conversations across CSN folders')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help=f'estimated Jaccard similarity to count as a duplicate (default: {THRESHOLD})')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='re-parse every source instead of reusing .cache/ results')
+    metrics.add_argument(parser, 'near_duplicates')
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable(args.metrics)
+
+    main(threshold=args.threshold, use_cache=not args.no_cache)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Result files as pretty-printed JSON or streamed JSON Lines
+
+The format follows the file name. name.json is one indented JSON document,
+built in memory and written at the end. name.jsonl holds a header line, one
+record per line written as records are produced, and a footer line with the
+totals only known at the end; .gz and .zst suffixes compress either format
+(zstd needs the optional zstandard package).
+
+    {"header": {"collection": "participants", "key": "participant_id", "schema": {...}}}
+    {"participant_id": "01122024_1000_1", "csn_folder": "CSN1", ...}
+    {"footer": {"total_participants": 245, ...}}
+
+Records of a keyed collection (a JSON object in the .json form) carry their
+key as their first field. A file's schema, if it declares one, is the
+header's schema field or the document's top-level "schema".
+"""
+import gzip
+import io
+import json
+import os
+
+# --format choices of the scripts that write result files
+FORMATS = ['json', 'json.gz', 'jsonl', 'jsonl.gz', 'jsonl.zst']
+
+
+def output_path(stem, fmt='json'):
+    return f"{stem}.{fmt}"
+
+
+def find_output(stem):
+    """Newest existing result file for stem in any format, else stem.json"""
+    existing = [output_path(stem, fmt) for fmt in FORMATS if os.path.exists(output_path(stem, fmt))]
+    return max(existing, key=os.path.getmtime) if existing else output_path(stem)
+
+
+def is_jsonl(path):
+    return _strip_compression(path).endswith('.jsonl')
+
+
+def _strip_compression(path):
+    for suffix in ('.gz', '.zst'):
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+
+def open_text(path, mode='r'):
+    """Open a result file as UTF-8 text ('r' or 'w'), (de)compressing by suffix"""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    if path.endswith('.zst'):
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("zstd result files need the zstandard package (pip install zstandard)")
+        raw = open(path, mode + 'b')
+        if mode == 'w':
+            stream = zstandard.ZstdCompressor().stream_writer(raw)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(raw)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class RecordWriter:
+    """Write one result file: a collection of records plus top-level fields
+
+    JSONL records go to disk as they are written; for JSON they are kept
+    until close(), which writes the whole document with the fields first,
+    exactly as json.dump(..., indent=2) of the equivalent dict.
+    """
+
+    def __init__(self, path, collection, key=None, ensure_ascii=True, schema=None):
+        self.path = path
+        self.collection = collection
+        self.key = key
+        self.ensure_ascii = ensure_ascii
+        self.schema = schema
+        self.count = 0
+        if is_jsonl(path):
+            self._records = None
+            self._file = open_text(path, 'w')
+            header = {'collection': collection, 'key': key}
+            if schema:
+                header['schema'] = schema
+            self._write_line({'header': header})
+        else:
+            self._records = {} if key else []
+            self._file = None
+
+    def write(self, record, key=None):
+        """Add a record; key is required for keyed collections"""
+        self.count += 1
+        if self._records is None:
+            self._write_line({self.key: key, **record} if self.key else record)
+        elif self.key:
+            self._records[key] = record
+        else:
+            self._records.append(record)
+
+    def close(self, **fields):
+        """Finish the file with its top-level fields (the footer line in JSONL)"""
+        if self._records is None:
+            self._write_line({'footer': fields})
+            self._file.close()
+            return
+
+        document = {'schema': self.schema} if self.schema else {}
+        document.update(fields)
+        document[self.collection] = self._records
+        with open_text(self.path, 'w') as f:
+            json.dump(document, f, indent=2, ensure_ascii=self.ensure_ascii)
+
+    def _write_line(self, obj):
+        self._file.write(json.dumps(obj, ensure_ascii=False) + '\n')
+
+
+def read_records(path, collection, key=None):
+    """Return (schema, records) of a result file; schema is None if undeclared
+
+    records yields one record at a time: JSONL files are read line by line
+    as it is consumed, a JSON document is loaded whole. Records of a keyed
+    collection come with their key as field `key`.
+    """
+    if not is_jsonl(path):
+        with open_text(path) as f:
+            document = json.load(f)
+        records = document[collection]
+        if key:
+            records = ({key: record_key, **record} for record_key, record in records.items())
+        return document.get('schema'), iter(records)
+
+    f = open_text(path)
+    header = json.loads(f.readline()).get('header') or {}
+    return header.get('schema'), _iter_lines(f)
+
+
+def iter_records(path, collection, key=None):
+    """Yield the records of a result file one at a time (see read_records)"""
+    return read_records(path, collection, key)[1]
+
+
+def _iter_lines(f):
+    with f:
+        for line in f:
+            record = json.loads(line)
+            if len(record) == 1 and 'footer' in record:
+                continue
+            yield record
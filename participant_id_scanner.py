@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Single-pass scanner for participant IDs and survey account emails
+
+All extraction scripts share this one precompiled pattern instead of
+running their own list of regexes over the same text.
+"""
+import re
+from collections import namedtuple
+
+import metrics
+
+# Match kinds
+EXPLICIT_ID = 'explicit_id'    # "My ID is 01122024_1000_17"
+STATED_ID = 'stated_id'        # "ID is 01122024_1000_17" (without "my")
+MENTIONED_ID = 'mentioned_id'  # bare ID surrounded by whitespace/punctuation
+EMBEDDED_ID = 'embedded_id'    # ID glued to other text, e.g. "20679508_03122024_1757_11"
+EMAIL = 'email'                # uksurveycsnNN@gmail.com
+
+ID_KINDS = (EXPLICIT_ID, STATED_ID, MENTIONED_ID, EMBEDDED_ID)
+
+# Participant ID format: DDMMYYYY_HHMM_N (some participants typed HMM)
+PARTICIPANT_ID = r'\d{8}_\d{3,4}_\d+'
+
+# Case-insensitive, so "MY ID IS ..." and "Id Is ..." are stated IDs too
+SCANNER = re.compile(
+    r'(?P<my>my )?id is (?P<stated>' + PARTICIPANT_ID + r')'
+    r'|(?P<bare>' + PARTICIPANT_ID + r')'
+    r'|(?P<email>uksurveycsn\d+@gmail\.com)',
+    re.IGNORECASE
+)
+
+
+class IdMatch(namedtuple('IdMatch', ['kind', 'value', 'start', 'end'])):
+    """A single scanner hit; start/end are offsets of value in the text"""
+    __slots__ = ()
+
+    @property
+    def malformed(self):
+        """True for participant IDs with a 3-digit (HMM) time part"""
+        if self.kind == EMAIL:
+            return False
+        return len(self.value.split('_')[1]) == 3
+
+
+def _is_delimited(text, match):
+    """Check a bare ID is preceded by whitespace and followed by whitespace or ,."""
+    start, end = match.span()
+    if start > 0 and not text[start - 1].isspace():
+        return False
+    return end == len(text) or text[end].isspace() or text[end] in ',.'
+
+
+def iter_matches(text):
+    """Yield IdMatch tuples for every ID or email in text, in order"""
+    for match in SCANNER.finditer(text):
+        if match.group('stated') is not None:
+            kind = EXPLICIT_ID if match.group('my') is not None else STATED_ID
+            group = 'stated'
+        elif match.group('bare') is not None:
+            kind = MENTIONED_ID if _is_delimited(text, match) else EMBEDDED_ID
+            group = 'bare'
+        else:
+            kind = EMAIL
+            group = 'email'
+        metrics.count('regex_matches', kind=kind)
+        yield IdMatch(kind, match.group(group), match.start(group), match.end(group))
+
+
+def scan(text):
+    """Return all IdMatch tuples found in text"""
+    return list(iter_matches(text))
+
+
+def participant_ids(text):
+    """Return the set of participant IDs stated or mentioned in text
+
+    Malformed (3-digit time) IDs are only accepted when explicitly stated.
+    """
+    ids = set()
+    for m in iter_matches(text):
+        if m.kind in (EMAIL, EMBEDDED_ID):
+            continue
+        if m.kind == MENTIONED_ID and m.malformed:
+            continue
+        ids.add(m.value)
+    return ids
+
+
+def first_participant_id(text):
+    """Return the best participant ID in text, or None
+
+    Prefers "My ID is", then "ID is", then the first well-formed ID
+    anywhere in the text.
+    """
+    best = None
+    for m in iter_matches(text):
+        if m.kind == EMAIL or m.malformed:
+            continue
+        if m.kind == EXPLICIT_ID:
+            return m.value
+        if best is None or (m.kind == STATED_ID and best.kind != STATED_ID):
+            best = m
+    return best.value if best else None
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Packed 64-bit keys for participant IDs (DDMMYYYY_HHMM_N)
+
+A key packs the study date as YYYYMMDD, the session time as HHMM and the
+sequence number into one non-negative integer, most significant first, so
+keys sort chronologically and compare and hash at integer speed. IDs that
+only differ in how they were typed - a 3-digit HMM time or a zero-padded
+sequence - map to the same key. IDs naming an impossible calendar date
+(month 14, 41st day, ...) are rejected like any other non-ID, so they never
+sort among real ones.
+
+    date (YYYYMMDD) | time (HHMM) | sequence
+        27 bits     |   14 bits   |  22 bits
+"""
+import datetime
+import re
+
+TIME_BITS = 14
+SEQUENCE_BITS = 22
+TIME_SHIFT = SEQUENCE_BITS
+DATE_SHIFT = SEQUENCE_BITS + TIME_BITS
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+# Sorts after every valid key; used for strings that are not participant IDs
+NO_KEY = 1 << 63
+
+_ID_FIELDS = re.compile(r'(\d{2})(\d{2})(\d{4})_(\d{3,4})_(\d+)')
+
+
+def pack(date, time, sequence):
+    """Pack YYYYMMDD, HHMM and sequence integers (or numpy arrays) into keys"""
+    return (date << DATE_SHIFT) | (time << TIME_SHIFT) | sequence
+
+
+def unpack(key):
+    """Split a key (or numpy array of keys) into (YYYYMMDD, HHMM, sequence)"""
+    return key >> DATE_SHIFT, (key >> TIME_SHIFT) & ((1 << TIME_BITS) - 1), key & MAX_SEQUENCE
+
+
+def encode(pid):
+    """Return the packed key of a participant ID; raises ValueError if it is not one"""
+    match = _ID_FIELDS.fullmatch(pid)
+    if not match:
+        raise ValueError(f"Not a participant ID: {pid!r}")
+
+    day, month, year, time, seq = match.groups()
+    try:
+        datetime.date(int(year), int(month), int(day))
+    except ValueError:
+        raise ValueError(f"Not a calendar date: {pid!r}") from None
+
+    sequence = int(seq)
+    if sequence > MAX_SEQUENCE:
+        raise ValueError(f"Sequence number too large: {pid!r}")
+    return pack(int(year + month + day), int(time), sequence)
+
+
+def decode(key):
+    """Return the canonical DDMMYYYY_HHMM_N form of a key"""
+    date, time, sequence = unpack(key)
+    return f"{date % 100:02d}{date // 100 % 100:02d}{date // 10000:04d}_{time:04d}_{sequence}"
+
+
+def normalize(pid):
+    """Canonical form of a participant ID: 4-digit time, unpadded sequence"""
+    return decode(encode(pid))
+
+
+def encode_or_none(pid):
+    """Like encode, but return None for strings that are not participant IDs"""
+    try:
+        return encode(pid)
+    except ValueError:
+        return None
+
+
+def sort_key(pid):
+    """sorted() key: chronological by packed key, then by the ID as written"""
+    key = encode_or_none(pid)
+    return (NO_KEY if key is None else key), pid
+
+
+def study_date(key):
+    """YYYY-MM-DD study date of a key"""
+    date = key >> DATE_SHIFT
+    return f"{date // 10000:04d}-{date // 100 % 100:02d}-{date % 100:02d}"
+
+
+def sequence(key):
+    """Sequence number of a key"""
+    return key & MAX_SEQUENCE
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Compact participant records
+
+Conversations are stored once in a column-oriented ConversationTable and
+participants refer to them by row number, so a participant costs a few
+machine words per conversation instead of a dict with a copy of the title.
+Folder and source strings are interned and provenance is a set.
+
+Records are written to all_participants.* in a versioned schema (SCHEMA):
+
+    participant_id     str
+    csn_folder         str, the folder the participant was first seen in
+    num_conversations  int
+    first_seen         float Unix epoch of the earliest conversation, or None
+    sources            sorted list of str
+    conversations      list of {"id": str, "title": str, "create_time": float or None}
+
+Version 2 files lack the conversation ids (None when upgraded). Version 1
+files, which have no schema field, also held naive local-time ISO strings
+instead of epochs. upgrade_record converts records of both.
+"""
+import sys
+from array import array
+from datetime import datetime
+
+SCHEMA = {'name': 'all_participants', 'version': 3}
+
+
+class ConversationTable:
+    """Shared table of the conversations participants refer to"""
+    __slots__ = ('ids', 'titles', 'create_times', 'update_times', '_rows')
+
+    def __init__(self):
+        self.ids = []
+        self.titles = []
+        self.create_times = array('d')
+        self.update_times = array('d')
+        self._rows = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, conv_id, title, create_time, update_time):
+        """Return the row of a conversation, adding it the first time it is seen"""
+        row = self._rows.get(conv_id)
+        if row is None:
+            row = self._rows[conv_id] = len(self.ids)
+            self.ids.append(conv_id)
+            self.titles.append(title)
+            self.create_times.append(create_time or 0)
+            self.update_times.append(update_time or 0)
+        return row
+
+    def values(self, row):
+        """Return (id, title, create_time, update_time) of a row"""
+        return self.ids[row], self.titles[row], self.create_times[row], self.update_times[row]
+
+    def as_dict(self, row):
+        """Return a row in the old per-participant conversation dict shape"""
+        return {
+            'title': self.titles[row],
+            'create_time': self.create_times[row],
+            'update_time': self.update_times[row],
+            'id': self.ids[row]
+        }
+
+
+class ParticipantRecord:
+    """One participant: folder, first sighting, conversation rows and sources"""
+    __slots__ = ('csn_folder', 'first_seen', 'conversations', 'sources')
+
+    def __init__(self, csn_folder=None, first_seen=0):
+        self.csn_folder = csn_folder
+        self.first_seen = first_seen
+        self.conversations = array('l')   # rows in the store's ConversationTable
+        self.sources = set()
+
+    def see(self, create_time):
+        """Move first_seen back to create_time if it is earlier"""
+        if create_time > 0 and (self.first_seen == 0 or create_time < self.first_seen):
+            self.first_seen = create_time
+
+
+class ParticipantStore:
+    """Participant records keyed by ID, sharing one conversation table"""
+
+    def __init__(self):
+        self.conversations = ConversationTable()
+        self.records = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, pid):
+        return pid in self.records
+
+    def __getitem__(self, pid):
+        return self.records[pid]
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def keys(self):
+        return self.records.keys()
+
+    def items(self):
+        return self.records.items()
+
+    def record(self, pid, csn_folder=None, first_seen=0):
+        """Return the record for pid, creating it if needed"""
+        record = self.records.get(pid)
+        if record is None:
+            folder = sys.intern(csn_folder) if csn_folder else None
+            record = self.records[pid] = ParticipantRecord(folder, first_seen)
+        return record
+
+    def add_conversation(self, pid, conv_id, title, create_time, update_time, source, csn_folder=None):
+        """Attach a conversation to pid; repeated conversations are kept once"""
+        row = self.conversations.add(conv_id, title, create_time, update_time)
+        record = self.record(pid, csn_folder, create_time)
+        if row not in record.conversations:
+            record.conversations.append(row)
+        record.sources.add(sys.intern(source))
+        record.see(create_time)
+
+    def add_mention(self, pid, source, csn_folder=None):
+        """Record that pid appears in source without a known conversation"""
+        self.record(pid, csn_folder).sources.add(sys.intern(source))
+
+    def merge(self, other, csn_folder):
+        """Merge another store in; new participants are attributed to csn_folder"""
+        for pid, theirs in other.records.items():
+            record = self.record(pid, csn_folder, theirs.first_seen)
+            for row in theirs.conversations:
+                row = self.conversations.add(*other.conversations.values(row))
+                if row not in record.conversations:
+                    record.conversations.append(row)
+            record.sources |= theirs.sources
+            record.see(theirs.first_seen)
+
+    def export(self, pid, sources):
+        """Return pid's record in the all_participants schema (without its ID)"""
+        record = self.records[pid]
+        table = self.conversations
+        return {
+            'csn_folder': record.csn_folder,
+            'num_conversations': len(record.conversations),
+            'first_seen': _epoch(record.first_seen),
+            'sources': sorted(sources),
+            'conversations': [
+                {'id': table.ids[row], 'title': table.titles[row], 'create_time': _epoch(table.create_times[row])}
+                for row in record.conversations
+            ]
+        }
+
+    def conversations_of(self, pid):
+        """Return pid's conversations as dicts, in the order they were added"""
+        return [self.conversations.as_dict(row) for row in self.records[pid].conversations]
+
+
+def _epoch(timestamp):
+    return timestamp if timestamp and timestamp > 0 else None
+
+
+def schema_version(schema):
+    """Version of a participants file's schema; 1 for files without one"""
+    if schema is None:
+        return 1
+    if schema.get('name') != SCHEMA['name'] or schema.get('version', 0) > SCHEMA['version']:
+        raise ValueError(f"Unsupported participants schema {schema}; expected {SCHEMA} or older")
+    return schema['version']
+
+
+def upgrade_record(record, version):
+    """Convert a record read from a file of the given schema version to SCHEMA"""
+    if version >= SCHEMA['version']:
+        return record
+
+    first_seen = record.get('first_seen')
+    conversations = [{'id': None, **conv} for conv in record.get('conversations', [])]
+    if version == 1:
+        first_seen = _from_isoformat(first_seen)
+        for conv in conversations:
+            conv['create_time'] = _from_isoformat(conv.get('create_time'))
+    return dict(record, first_seen=first_seen, conversations=conversations)
+
+
+def _from_isoformat(text):
+    # Version 1 wrote naive local times, so they are read back as local times
+    return datetime.fromisoformat(text.replace('Z', '+00:00')).timestamp() if text else None
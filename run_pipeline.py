@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Run any subset of the analysis stages in one process
+
+The export is parsed once into a shared corpus, and every conversation-level
+stage runs against it. Stages always run in pipeline order, so reports that
+read all_participants.json see the output of the extraction stage. With
+--format the large result files are written in that format (e.g. jsonl.gz),
+and the reports read whichever participants file was written last.
+
+Usage:
+    python run_pipeline.py                      # all stages
+    python run_pipeline.py participants dates   # selected stages
+    python run_pipeline.py --format jsonl.gz    # streamed, compressed results
+    python run_pipeline.py --list
+"""
+import argparse
+import time
+
+import analyze_date_patterns
+import analyze_model_comparisons
+import analyze_participants
+import create_final_dataset
+import deep_analysis_all_conversations
+import export_index
+import extract_all_participants
+import extract_all_possible_participants
+import message_columns
+import metrics
+import near_duplicates
+import search_index
+import session_slots
+import session_timeline
+from corpus import Corpus
+from output_files import FORMATS
+
+# name -> (description, runner); runners take the shared corpus and the
+# result file format
+STAGES = {
+    'participants': ('extract participant IDs (all_participants.json)',
+                     lambda corpus, fmt: extract_all_participants.main(corpus=corpus, output_format=fmt)),
+    'analyze': ('first stated ID per conversation (participant_analysis.json)',
+                lambda corpus, fmt: analyze_participants.main(corpus=corpus)),
+    'possible': ('every identification method (exhaustive_participant_analysis.json)',
+                 lambda corpus, fmt: extract_all_possible_participants.main(corpus=corpus, output_format=fmt)),
+    'duplicates': ('near-duplicate conversations by user text (near_duplicates.json)',
+                   lambda corpus, fmt: near_duplicates.main(corpus=corpus)),
+    'deep': ('every conversation as a participant (all_conversations_detailed.json)',
+             lambda corpus, fmt: deep_analysis_all_conversations.analyze_all_conversations(
+                 corpus=corpus, output_format=fmt)),
+    'timeline': ('session concurrency and idle gaps per CSN computer (session_timeline.json)',
+                 lambda corpus, fmt: session_timeline.main(corpus=corpus)),
+    'messages': ('one row per message as NumPy columns (message_columns/)',
+                 lambda corpus, fmt: message_columns.main(corpus=corpus)),
+    'comparisons': ('model comparisons joined to participants (model_comparisons_analysis.json)',
+                    lambda corpus, fmt: analyze_model_comparisons.main(corpus=corpus)),
+    'index': ('SQLite index of conversations, messages and mentions (export_index.sqlite)',
+              lambda corpus, fmt: export_index.build_index(conversations=corpus)),
+    'search': ('full-text index of every message part (search_index.sqlite)',
+               lambda corpus, fmt: search_index.update_index(conversations=corpus)),
+    'dates': ('participant ID date and sequence report',
+              lambda corpus, fmt: analyze_date_patterns.main()),
+    'slots': ('conversations without an ID attributed to session slots (session_attribution.json)',
+              lambda corpus, fmt: session_slots.main()),
+    'dataset': ('final CSV dataset (final_participant_dataset.csv)',
+                lambda corpus, fmt: create_final_dataset.main()),
+}
+
+# Stages that only read the outputs of earlier stages
+FILE_STAGES = {'dates', 'slots', 'dataset'}
+
+
+def run(stage_names, data_dir='data', output_format='json'):
+    """Run the named stages in pipeline order against one shared corpus"""
+    selected = [name for name in STAGES if name in stage_names]
+
+    corpus = None
+    if any(name not in FILE_STAGES for name in selected):
+        start = time.perf_counter()
+        with metrics.stage('load_corpus'):
+            corpus = Corpus(data_dir)
+        print(f"Loaded {len(corpus)} unique conversations from {len(corpus.sources)} sources "
+              f"in {time.perf_counter() - start:.2f}s")
+
+    for name in selected:
+        print(f"\n{'#'*80}\n# STAGE: {name}\n{'#'*80}")
+        start = time.perf_counter()
+        with metrics.stage(name):
+            STAGES[name][1](corpus, output_format)
+        print(f"\nStage {name} finished in {time.perf_counter() - start:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run analysis stages over a single parse of the export')
+    parser.add_argument('stages', nargs='*', help='stages to run (default: all)')
+    parser.add_argument('--list', action='store_true', help='list available stages')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--format', choices=FORMATS, default='json',
+                        help='format of the large result files (default: json)')
+    metrics.add_argument(parser, 'run_pipeline')
+    args = parser.parse_args()
+
+    if args.list:
+        for name, (description, _) in STAGES.items():
+            print(f"  {name:14s} {description}")
+        return
+
+    unknown = [name for name in args.stages if name not in STAGES]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)} (see --list)")
+
+    if args.metrics:
+        metrics.enable(args.metrics)
+    run(args.stages or list(STAGES), args.data_dir, args.format)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Full-text search over every message of the export
+
+Every message part is tokenized into lowercase words (participant IDs such
+as 28112024_1200_1 stay one word) and stored in an inverted index in a
+SQLite file: for each term, the message parts it occurs in and its word
+positions there. Queries look terms up by index instead of scanning text:
+
+    esperanto verb         parts containing both words
+    "my id is"             the exact phrase (consecutive words)
+    2811202*               any word starting with 2811202
+    "id is 0412*"          phrases may end in or contain prefixes
+
+and can be narrowed to CSN folders, a role and a time range. The index
+records the size and mtime of every source it has read, so `update` only
+reads the CSN folders that are new or have changed since.
+
+Usage:
+    python search_index.py update [--db search_index.sqlite]
+    python search_index.py build
+    python search_index.py search '"my id is"' [--folder CSN5] [--role user] [--since 2024-12-03]
+    python search_index.py stats
+"""
+import argparse
+import os
+import re
+import sqlite3
+import time
+from array import array
+from datetime import datetime
+
+import metrics
+from chatgpt_export import iter_message_parts
+from export_sources import file_stat
+from ingest import ConversationIngest, find_sources
+
+DEFAULT_DB = 'search_index.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+-- Every source a conversation was found in; it is indexed from the first
+CREATE TABLE IF NOT EXISTS conversation_sources (
+    conversation_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (conversation_id, path)
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    conversation_id TEXT PRIMARY KEY,
+    csn_folder TEXT NOT NULL,
+    source TEXT NOT NULL,
+    title TEXT
+);
+CREATE TABLE IF NOT EXISTS parts (
+    part_id INTEGER PRIMARY KEY,
+    conversation_id TEXT NOT NULL,
+    message_id TEXT,
+    csn_folder TEXT NOT NULL,
+    role TEXT,
+    create_time REAL,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS terms (
+    term_id INTEGER PRIMARY KEY,
+    term TEXT NOT NULL UNIQUE
+);
+-- positions: the term's word positions in the part, as native uint32s
+CREATE TABLE IF NOT EXISTS postings (
+    term_id INTEGER NOT NULL,
+    part_id INTEGER NOT NULL,
+    positions BLOB NOT NULL,
+    PRIMARY KEY (term_id, part_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_parts_conversation ON parts (conversation_id);
+-- Lets an update drop a conversation's postings without scanning them all
+CREATE INDEX IF NOT EXISTS idx_postings_part ON postings (part_id);
+CREATE INDEX IF NOT EXISTS idx_conversations_source ON conversations (source);
+CREATE INDEX IF NOT EXISTS idx_conversation_sources_path ON conversation_sources (path);
+"""
+
+_TOKEN = re.compile(r'\w+')
+_QUERY = re.compile(r'"([^"]*)"|(\S+)')
+
+# SQLite host parameters per IN (...) list
+_BATCH = 500
+
+# Candidate parts up to which postings are looked up by key rather than read in full
+_SEEK_LIMIT = 2000
+
+
+def tokenize(text):
+    """Lowercase words of a text, in order"""
+    return _TOKEN.findall(text.lower())
+
+
+def _positions(words):
+    """{term: array of positions} for a tokenized part"""
+    positions = {}
+    for i, word in enumerate(words):
+        positions.setdefault(word, array('I')).append(i)
+    return positions
+
+
+def _open(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def update_index(db_path=DEFAULT_DB, data_dir='data', conversations=None):
+    """Index the sources that are new or changed since the last update
+
+    A CSN folder with any new or changed source is re-read in full, together
+    with any other source holding a conversation that was indexed from it
+    or from a source that no longer exists, so the result is the same as a
+    rebuild. conversations is an iterable of ingested conversations covering
+    the whole export (e.g. a shared corpus); by default only the sources to
+    re-read are parsed. Returns (sources read, conversations indexed).
+    """
+    conn = _open(db_path)
+    indexed = {path: (size, mtime_ns) for path, size, mtime_ns in conn.execute("SELECT * FROM sources")}
+    sources = find_sources(data_dir)
+    stats = {source.path: file_stat(source.path) for source in sources}
+    changed_folders = {source.csn_folder for source in sources
+                       if indexed.get(source.path) != (stats[source.path].size, stats[source.path].mtime_ns)}
+    stale = {source.path for source in sources if source.csn_folder in changed_folders}
+    removed = indexed.keys() - stats.keys()
+
+    terms = dict(conn.execute("SELECT term, term_id FROM terms"))
+    count = 0
+    with conn:
+        # Drop what was indexed from the stale sources; copies of those
+        # conversations elsewhere are read again as well
+        dropped = [key for path in stale | removed for (key,) in
+                   conn.execute("SELECT conversation_id FROM conversations WHERE source = ?", (path,))]
+        for key in dropped:
+            stale.update(path for (path,) in conn.execute(
+                "SELECT path FROM conversation_sources WHERE conversation_id = ?", (key,)) if path in stats)
+            conn.execute("DELETE FROM postings WHERE part_id IN "
+                         "(SELECT part_id FROM parts WHERE conversation_id = ?)", (key,))
+            conn.execute("DELETE FROM parts WHERE conversation_id = ?", (key,))
+            conn.execute("DELETE FROM conversations WHERE conversation_id = ?", (key,))
+        conn.executemany("DELETE FROM conversation_sources WHERE path = ?", ((path,) for path in stale | removed))
+        conn.executemany("DELETE FROM sources WHERE path = ?", ((path,) for path in removed))
+
+        if conversations is None:
+            conversations = ConversationIngest(data_dir)
+            conversations.sources = [source for source in conversations.sources if source.path in stale]
+
+        for item in conversations:
+            if item.path not in stale:
+                continue
+            if conn.execute("SELECT 1 FROM conversations WHERE conversation_id = ?", (item.key,)).fetchone():
+                continue
+            with metrics.stage('tokenize'):
+                _index_conversation(conn, terms, item)
+            count += 1
+
+        conn.executemany("INSERT OR IGNORE INTO conversation_sources VALUES (?, ?)",
+                         ((key, path) for key, paths in conversations.provenance.items()
+                          for path in paths if path in stale))
+        conn.executemany("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)",
+                         ((path, stats[path].size, stats[path].mtime_ns) for path in stale))
+    conn.close()
+    return len(stale), count
+
+
+def _index_conversation(conn, terms, item):
+    conv = item.conversation
+    conn.execute("INSERT INTO conversations VALUES (?, ?, ?, ?)",
+                 (item.key, item.csn_folder, item.path, conv.get('title', '')))
+
+    # The same text parts, in the same order, as every other tool reads
+    for part in iter_message_parts(conv):
+        part_id = conn.execute(
+            "INSERT INTO parts (conversation_id, message_id, csn_folder, role, create_time, text) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (item.key, part.message_id, item.csn_folder, part.role, part.create_time, part.text)
+        ).lastrowid
+
+        rows = []
+        for term, positions in _positions(tokenize(part.text)).items():
+            term_id = terms.get(term)
+            if term_id is None:
+                term_id = conn.execute("INSERT INTO terms (term) VALUES (?)", (term,)).lastrowid
+                terms[term] = term_id
+            rows.append((term_id, part_id, positions.tobytes()))
+        conn.executemany("INSERT INTO postings VALUES (?, ?, ?)", rows)
+        metrics.count('parts_indexed')
+
+
+def parse_query(query):
+    """Split a query into phrases: lists of words, '*'-suffixed words being prefixes"""
+    phrases = []
+    for quoted, word in _QUERY.findall(query):
+        text = quoted if quoted else word
+        words = [word + star for word, star in re.findall(r'(\w+)(\*?)', text.lower())]
+        if words:
+            phrases.append(words)
+    return phrases
+
+
+def _term_filter(word):
+    """SQL condition and parameters selecting a word's terms (one, or every prefixed one)"""
+    if word.endswith('*'):
+        prefix = word[:-1]
+        return "t.term >= ? AND t.term < ?", (prefix, prefix + '\U0010ffff')
+    return "t.term = ?", (word,)
+
+
+def _document_frequency(conn, word):
+    condition, params = _term_filter(word)
+    return conn.execute(f"SELECT COUNT(*) FROM terms t JOIN postings p ON p.term_id = t.term_id "
+                        f"WHERE {condition}", params).fetchone()[0]
+
+
+def _term_postings(conn, word, candidates=None):
+    """{part_id: set of positions} of a word, limited to candidates if given"""
+    condition, params = _term_filter(word)
+    select = ("SELECT p.part_id, p.positions FROM terms t JOIN postings p ON p.term_id = t.term_id "
+              f"WHERE {condition}")
+    if candidates is not None and len(candidates) <= _SEEK_LIMIT:
+        # Few candidates: seek each (term, part) key instead of reading the whole posting list
+        rows = _seek_postings(conn, select, params, sorted(candidates))
+    else:
+        rows = conn.execute(select, params)
+
+    postings = {}
+    for part_id, blob in rows:
+        if candidates is not None and part_id not in candidates:
+            continue
+        positions = array('I')
+        positions.frombytes(blob)
+        postings.setdefault(part_id, set()).update(positions)
+    return postings
+
+
+def _seek_postings(conn, select, params, part_ids):
+    for start in range(0, len(part_ids), _BATCH):
+        batch = part_ids[start:start + _BATCH]
+        yield from conn.execute(f"{select} AND p.part_id IN ({', '.join('?' * len(batch))})", params + tuple(batch))
+
+
+def _phrase_matches(conn, words, candidates=None):
+    """{part_id: first position} of the parts containing the words consecutively
+
+    Words are looked up rarest first; positions of the later, commoner words
+    are only decoded for parts that still hold every word so far (and are
+    among candidates, if given).
+    """
+    postings = [None] * len(words)
+    for i in sorted(range(len(words)), key=lambda i: _document_frequency(conn, words[i])):
+        postings[i] = _term_postings(conn, words[i], candidates)
+        candidates = set(postings[i])
+        if not candidates:
+            return {}
+
+    if len(words) == 1:
+        return {part_id: min(positions) for part_id, positions in postings[0].items()}
+
+    matches = {}
+    for part_id in candidates:
+        starts = [p for p in postings[0][part_id]
+                  if all(p + i in postings[i][part_id] for i in range(1, len(words)))]
+        if starts:
+            matches[part_id] = min(starts)
+    return matches
+
+
+def search(conn, query, folders=None, role=None, since=None, until=None, limit=20):
+    """Return (total matching parts, up to limit result rows in time order)
+
+    Each row has conversation_id, message_id, csn_folder, role, create_time,
+    title, text and position (word position of the first phrase's match).
+    """
+    phrases = parse_query(query)
+    if not phrases:
+        return 0, []
+
+    # Longest phrases first: they match the fewest parts and narrow the rest
+    matches = None
+    for words in sorted(phrases, key=len, reverse=True):
+        found = _phrase_matches(conn, words, None if matches is None else set(matches))
+        matches = found if matches is None else {part_id: matches[part_id] for part_id in found}
+        if not matches:
+            return 0, []
+
+    conditions = []
+    params = []
+    if folders:
+        conditions.append(f"p.csn_folder IN ({', '.join('?' * len(folders))})")
+        params.extend(folders)
+    if role:
+        conditions.append("p.role = ?")
+        params.append(role)
+    if since is not None:
+        conditions.append("p.create_time >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("p.create_time < ?")
+        params.append(until)
+    where = ''.join(f" AND {c}" for c in conditions)
+
+    # Filter and order every match, then fetch the text of the shown ones only
+    hits = []
+    part_ids = sorted(matches)
+    for start in range(0, len(part_ids), _BATCH):
+        batch = part_ids[start:start + _BATCH]
+        hits.extend(conn.execute(
+            f"SELECT p.create_time, p.part_id FROM parts p "
+            f"WHERE p.part_id IN ({', '.join('?' * len(batch))}){where}",
+            batch + params
+        ))
+    hits.sort(key=lambda hit: (hit[0] or 0, hit[1]))
+
+    results = []
+    for _, part_id in hits[:limit]:
+        row = conn.execute(
+            "SELECT p.part_id, p.conversation_id, p.message_id, p.csn_folder, p.role, p.create_time, "
+            "c.title, p.text FROM parts p JOIN conversations c ON c.conversation_id = p.conversation_id "
+            "WHERE p.part_id = ?", (part_id,)
+        ).fetchone()
+        results.append(dict(row, position=matches[part_id]))
+    return len(hits), results
+
+
+def snippet(text, position, width=80):
+    """Text around the word at position, on one line"""
+    spans = [m.span() for m in _TOKEN.finditer(text)]
+    if position >= len(spans):
+        return text[:width].replace('\n', ' ')
+    begin = max(0, spans[position][0] - width // 3)
+    excerpt = text[begin:begin + width].replace('\n', ' ')
+    return ('...' if begin else '') + excerpt + ('...' if begin + width < len(text) else '')
+
+
+def _parse_time(value):
+    """Epoch seconds from an epoch number, YYYY-MM-DD or ISO datetime (local time)"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def connect(db_path=DEFAULT_DB):
+    """Open an existing search index read-only"""
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"{db_path} not found; run 'python search_index.py update' first")
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build, update or search the full-text message index')
+    parser.add_argument('--db', default=DEFAULT_DB)
+    parser.add_argument('--data-dir', default='data')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('update', help='index new and changed exports')
+    subparsers.add_parser('build', help='rebuild the index from scratch')
+    subparsers.add_parser('stats', help='sizes of the index')
+    search_parser = subparsers.add_parser('search', help='find message parts matching a query')
+    search_parser.add_argument('query', help='words, "quoted phrases" and prefix* terms, all required')
+    search_parser.add_argument('--folder', action='append', help='CSN folder to search (repeatable)')
+    search_parser.add_argument('--role', help='message author role (user, assistant, system, tool)')
+    search_parser.add_argument('--since', type=_parse_time, help='earliest create_time (epoch or ISO date)')
+    search_parser.add_argument('--until', type=_parse_time, help='create_time before (epoch or ISO date)')
+    search_parser.add_argument('--limit', type=int, default=20, help='results to show (default: 20)')
+    metrics.add_argument(parser, 'search_index')
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable(args.metrics)
+
+    if args.command in ('update', 'build'):
+        if args.command == 'build' and os.path.exists(args.db):
+            os.remove(args.db)
+        start = time.perf_counter()
+        sources, count = update_index(args.db, args.data_dir)
+        print(f"Indexed {count} conversations from {sources} sources read into {args.db} "
+              f"in {time.perf_counter() - start:.2f}s")
+        return
+
+    conn = connect(args.db)
+    if args.command == 'stats':
+        for table in ('sources', 'conversations', 'parts', 'terms', 'postings'):
+            print(f"  {table}: {conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]}")
+        return
+
+    start = time.perf_counter()
+    total, results = search(conn, args.query, args.folder, args.role, args.since, args.until, args.limit)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"{total} matching message parts ({elapsed:.1f} ms)")
+    for r in results:
+        when = datetime.fromtimestamp(r['create_time']).strftime('%Y-%m-%d %H:%M') if r['create_time'] else '-'
+        print(f"\n  {r['csn_folder']:6s} {when}  {r['role'] or '-':9s} {r['conversation_id']}  {r['title']}")
+        print(f"    {snippet(r['text'], r['position'])}")
+    if total > len(results):
+        print(f"\n({total - len(results)} more; use --limit)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Attribute unidentified conversations to scheduled session slots
+
+A participant ID DDMMYYYY_HHMM_N names the session slot its participant
+was booked into, and the conversations of a slot start within the session
+that follows. Every conversation with a stated ID anchors its slot on its
+CSN folder's timeline; a conversation without an ID is attributed to the
+latest slot of its folder that has started by its create_time (allowing
+for clocks running a little early), if that session is still running.
+
+Slots are sorted per folder once and each unidentified conversation is
+placed with a binary search, so the join is O(n log n) overall. The
+confidence of an attribution is 1 inside the span the slot's identified
+conversations cover and falls off linearly over a session length outside
+it; it is shared between the IDs when a slot has more than one.
+
+Usage:
+    python session_slots.py [--input exhaustive_participant_analysis.jsonl]
+"""
+import argparse
+import json
+from bisect import bisect_right
+from collections import defaultdict, namedtuple
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import metrics
+import participant_key
+from output_files import find_output, iter_records
+
+# Session times in IDs are lab wall-clock times
+STUDY_TZ = ZoneInfo('Europe/London')
+
+# Conversations start up to SESSION_MINUTES after their slot, and up to
+# EARLY_MINUTES before it on a lab computer whose clock runs fast
+SESSION_MINUTES = 60
+EARLY_MINUTES = 15
+
+Slot = namedtuple('Slot', ['csn_folder', 'start', 'participant_ids', 'first_seen', 'last_seen'])
+
+
+def slot_start(key):
+    """Epoch of the session slot a participant key names; None if impossible"""
+    date, time, _ = participant_key.unpack(key)
+    try:
+        return datetime(date // 10000, date // 100 % 100, date % 100,
+                        time // 100, time % 100, tzinfo=STUDY_TZ).timestamp()
+    except ValueError:
+        return None
+
+
+def in_session(start, create_time, session_minutes=SESSION_MINUTES):
+    return start - EARLY_MINUTES * 60 <= create_time <= start + session_minutes * 60
+
+
+def build_slots(conversations, session_minutes=SESSION_MINUTES):
+    """Return ({csn_folder: [Slot] sorted by start}, IDs that anchor no slot)
+
+    conversations yields (csn_folder, create_time, explicit_ids). An ID whose
+    slot does not contain its own conversation is most likely mistyped (a
+    wrong year or day) and anchors nothing.
+    """
+    anchors = defaultdict(lambda: [set(), []])    # (csn_folder, start) -> [IDs, create_times]
+    mistyped = set()
+
+    for csn_folder, create_time, pids in conversations:
+        for pid in pids:
+            key = participant_key.encode_or_none(pid)
+            start = slot_start(key) if key is not None else None
+            if start is None or not create_time or not in_session(start, create_time, session_minutes):
+                mistyped.add(pid)
+                continue
+            ids, times = anchors[(csn_folder, start)]
+            ids.add(participant_key.decode(key))
+            times.append(create_time)
+
+    slots = defaultdict(list)
+    for (csn_folder, start), (ids, times) in sorted(anchors.items()):
+        slots[csn_folder].append(Slot(csn_folder, start, sorted(ids, key=participant_key.sort_key),
+                                      min(times), max(times)))
+    return slots, mistyped
+
+
+def confidence(slot, create_time, session_minutes=SESSION_MINUTES):
+    """How surely a conversation at create_time belongs to slot, 0..1"""
+    first = min(slot.start, slot.first_seen)
+    if first <= create_time <= slot.last_seen:
+        score = 1.0
+    else:
+        gap = first - create_time if create_time < first else create_time - slot.last_seen
+        score = max(0.0, 1 - gap / (session_minutes * 60))
+    return round(score / len(slot.participant_ids), 3)
+
+
+class SlotIndex:
+    """Session slots of every CSN folder, searchable by time"""
+
+    def __init__(self, slots, session_minutes=SESSION_MINUTES):
+        self.slots = slots
+        self.session_minutes = session_minutes
+        # Each folder's slots by the earliest time a conversation can belong to them
+        self._opens = {folder: [s.start - EARLY_MINUTES * 60 for s in folder_slots]
+                       for folder, folder_slots in slots.items()}
+
+    def find(self, csn_folder, create_time):
+        """Latest slot of csn_folder still in session at create_time, or None"""
+        opens = self._opens.get(csn_folder)
+        if not opens or not create_time:
+            return None
+        i = bisect_right(opens, create_time) - 1
+        if i < 0:
+            return None
+        slot = self.slots[csn_folder][i]
+        return slot if in_session(slot.start, create_time, self.session_minutes) else None
+
+
+def load_conversations(input_path):
+    """Split the exhaustive extraction's records into identified and unidentified
+
+    Returns (anchors, unidentified, unique_ids): anchors are (csn_folder,
+    create_time, explicit_ids) of conversations with a stated ID,
+    unidentified the records without any ID, and unique_ids every stated or
+    mentioned ID, as counted by extract_all_possible_participants.
+    """
+    anchors = []
+    unidentified = []
+    unique_ids = set()
+
+    for record in iter_records(input_path, 'conversations'):
+        explicit = [value for kind, value in record['markers'] if kind == 'explicit_id']
+        mentioned = [value for kind, value in record['markers'] if kind == 'mentioned_id']
+        unique_ids.update(explicit, mentioned)
+        if explicit:
+            anchors.append((record['csn_folder'], record['create_time'], explicit))
+        elif not mentioned:
+            unidentified.append(record)
+
+    return anchors, unidentified, unique_ids
+
+
+def main(input_path=None, session_minutes=SESSION_MINUTES):
+    print("="*80)
+    print("SESSION SLOT ATTRIBUTION")
+    print("="*80)
+
+    input_path = input_path or find_output('exhaustive_participant_analysis')
+    anchors, unidentified, unique_ids = load_conversations(input_path)
+    metrics.checkpoint('load')
+
+    slots, mistyped = build_slots(anchors, session_minutes)
+    index = SlotIndex(slots, session_minutes)
+    print(f"\nSession slots from stated IDs: {sum(len(s) for s in slots.values())} "
+          f"in {len(slots)} CSN folders ({len(mistyped)} IDs outside their own session skipped)")
+
+    # Time order within each folder, so the report reads as a timeline
+    unidentified.sort(key=lambda r: (r['csn_folder'], r['create_time'] or 0))
+    attributions = []
+    unattributed = []
+    for record in unidentified:
+        slot = index.find(record['csn_folder'], record['create_time'])
+        if slot is None:
+            unattributed.append(record)
+            continue
+        attributions.append({
+            'conversation_id': record['conversation_id'],
+            'csn_folder': record['csn_folder'],
+            'title': record['title'],
+            'create_time': record['create_time'],
+            'slot_start': slot.start,
+            'participant_ids': slot.participant_ids,
+            'confidence': confidence(slot, record['create_time'], session_minutes)
+        })
+        metrics.count('attributed')
+    metrics.checkpoint('attribute')
+
+    method2_count = len(unique_ids) + len(unidentified)
+    participant_count = len(unique_ids) + len(unattributed)
+    confident = sum(1 for a in attributions if a['confidence'] >= 0.5)
+
+    print(f"\n{'='*80}")
+    print(f"RESULTS")
+    print(f"{'='*80}")
+    print(f"Conversations without an ID: {len(unidentified)}")
+    print(f"Attributed to a session slot: {len(attributions)} ({confident} with confidence >= 0.5)")
+    print(f"Not in any session: {len(unattributed)}")
+
+    print(f"\nAttributions by CSN folder:")
+    by_csn = defaultdict(list)
+    for a in attributions:
+        by_csn[a['csn_folder']].append(a)
+    for csn in sorted(by_csn.keys(), key=lambda c: (len(c), c)):
+        for a in by_csn[csn]:
+            when = datetime.fromtimestamp(a['create_time'], STUDY_TZ).strftime('%d/%m %H:%M')
+            print(f"  {csn:6s} {when}  {', '.join(a['participant_ids']):25s} "
+                  f"{a['confidence']:.2f}  {a['title']}")
+
+    print(f"\n{'='*80}")
+    print(f"PARTICIPANT COUNT")
+    print(f"{'='*80}")
+    print(f"Unique IDs + unidentified conversations (METHOD 2): {method2_count}")
+    print(f"Unique IDs + conversations outside any session slot: {participant_count}")
+    metrics.checkpoint('report')
+
+    output = {
+        'analysis_date': datetime.now().isoformat(),
+        'input_file': input_path,
+        'session_minutes': session_minutes,
+        'early_minutes': EARLY_MINUTES,
+        'session_slots': sum(len(s) for s in slots.values()),
+        'mistyped_ids': sorted(mistyped, key=participant_key.sort_key),
+        'unidentified_conversations': len(unidentified),
+        'method2_count': method2_count,
+        'participant_count': participant_count,
+        'attributions': attributions,
+        'unattributed': [r['conversation_id'] for r in unattributed]
+    }
+    output_file = 'session_attribution.json'
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(output, f, indent=2, ensure_ascii=False)
+    metrics.checkpoint('write')
+
+    print(f"\nAttributions saved to: {output_file}")
+    return output
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Attribute conversations without an ID to session slots')
+    parser.add_argument('--input', help='exhaustive extraction file to read (default: the newest '
+                                        'exhaustive_participant_analysis.* result file)')
+    parser.add_argument('--session-minutes', type=int, default=SESSION_MINUTES,
+                        help=f'how long after its slot a conversation can start (default: {SESSION_MINUTES})')
+    metrics.add_argument(parser, 'session_slots')
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable(args.metrics)
+
+    main(input_path=args.input, session_minutes=args.session_minutes)
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Session timeline: concurrency, idle gaps and overlaps per CSN computer
+
+Each conversation is the interval from its create_time to its last
+message; update_time is not used as the end because it moves whenever a
+conversation is reopened, often days later. The intervals become start and
+end events, and one sweep over all events in time order keeps the number
+of open conversations per CSN folder (one lab computer) and for the whole
+lab. The sweep yields the peak concurrency, the idle gaps between sessions
+and the pairs of conversations that overlap on the same computer - a
+computer running two sessions at once usually means a duplicated or
+re-opened session. Sorting the events dominates, so the run is
+O(n log n) plus one step per overlap pair found.
+
+Usage:
+    python session_timeline.py [--csv session_timeline.csv] [--no-cache]
+"""
+import argparse
+import csv
+import json
+from collections import defaultdict
+from datetime import datetime
+
+import metrics
+from chatgpt_export import iter_message_parts
+from extraction_cache import ExtractionCache
+from ingest import ConversationIngest
+
+# Bump when summarize_conversation changes, so cached per-source results
+# are recomputed
+EXTRACTOR_VERSION = 1
+
+# Events at the same instant: ends before starts, so back-to-back
+# conversations do not count as overlapping
+END, START = 0, 1
+
+# Longest idle gaps listed per folder in the report
+MAX_LISTED_GAPS = 3
+
+
+def summarize_conversation(conv):
+    """Reduce a conversation to its active interval"""
+    start = conv.get('create_time') or 0
+    times = [part.create_time for part in iter_message_parts(conv) if part.create_time]
+    end = max(times) if times else conv.get('update_time') or start
+    return {'start': start, 'end': max(end, start)}
+
+
+def new_timeline():
+    return {'conversations': 0, 'active': 0, 'peak': 0, 'peak_time': None,
+            'busy_seconds': 0.0, 'busy_since': None, 'last_end': None,
+            'idle_gaps': [], 'overlaps': []}
+
+
+def sweep(intervals):
+    """Sweep (csn_folder, conversation_id, start, end) intervals in time order
+
+    Returns ({csn_folder: timeline}, lab timeline, {conversation_id:
+    (folder concurrency, lab concurrency)} at each conversation's start).
+    Overlap pairs are only collected within a folder.
+    """
+    events = []
+    for i, (_, _, start, end) in enumerate(intervals):
+        events.append((start, START, i))
+        if end > start:
+            events.append((end, END, i))
+    events.sort()
+
+    folders = defaultdict(new_timeline)
+    lab = new_timeline()
+    open_by_folder = defaultdict(dict)     # csn_folder -> {interval index: end}
+    concurrency = {}
+
+    for time, kind, i in events:
+        csn_folder, conv_id, _, end = intervals[i]
+        timeline = folders[csn_folder]
+        open_now = open_by_folder[csn_folder]
+
+        if kind == END:
+            del open_now[i]
+            _close(timeline, time)
+            _close(lab, time)
+            continue
+
+        for j, other_end in open_now.items():
+            timeline['overlaps'].append((intervals[j][1], conv_id, min(other_end, end) - time))
+        _open(timeline, time)
+        _open(lab, time)
+        concurrency[conv_id] = (timeline['active'], lab['active'])
+        if end > time:
+            open_now[i] = end
+        else:
+            # A single-message conversation closes as it opens
+            _close(timeline, time)
+            _close(lab, time)
+
+    return dict(folders), lab, concurrency
+
+
+def _open(timeline, time):
+    timeline['conversations'] += 1
+    timeline['active'] += 1
+    if timeline['active'] == 1:
+        if timeline['last_end'] is not None and time > timeline['last_end']:
+            timeline['idle_gaps'].append((timeline['last_end'], time))
+        timeline['busy_since'] = time
+    if timeline['active'] > timeline['peak']:
+        timeline['peak'] = timeline['active']
+        timeline['peak_time'] = time
+
+
+def _close(timeline, time):
+    timeline['active'] -= 1
+    if timeline['active'] == 0:
+        timeline['busy_seconds'] += time - timeline['busy_since']
+        timeline['last_end'] = time
+
+
+def describe(timeline):
+    """Report fields of a finished timeline"""
+    return {
+        'conversations': timeline['conversations'],
+        'peak_concurrency': timeline['peak'],
+        'peak_time': timeline['peak_time'],
+        'busy_seconds': round(timeline['busy_seconds'], 1),
+        'idle_gaps': len(timeline['idle_gaps']),
+        'longest_idle_gaps': [[start, end] for start, end in
+                              sorted(timeline['idle_gaps'], key=lambda g: g[0] - g[1])[:MAX_LISTED_GAPS]],
+        'overlaps': [{'conversation_ids': [a, b], 'overlap_seconds': round(seconds, 1)}
+                     for a, b, seconds in timeline['overlaps']]
+    }
+
+
+def _format_time(epoch):
+    return datetime.fromtimestamp(epoch).strftime('%Y-%m-%d %H:%M') if epoch is not None else '-'
+
+
+def _format_duration(seconds):
+    hours, rest = divmod(int(seconds), 3600)
+    return f"{hours}h{rest // 60:02d}m"
+
+
+def main(use_cache=True, corpus=None, csv_path=None):
+    print("="*80)
+    print("SESSION TIMELINE")
+    print("="*80)
+
+    data_dir = 'data'
+
+    # Reuse the shared corpus when running inside the pipeline
+    ingest = corpus if corpus is not None else ConversationIngest(data_dir)
+    cache = ExtractionCache('session_timeline', EXTRACTOR_VERSION) if use_cache and corpus is None else None
+
+    intervals = []
+    untimed = 0
+    for item in ingest.iter_summaries(summarize_conversation, cache=cache):
+        if not item.conversation['start']:
+            untimed += 1
+            continue
+        intervals.append((item.csn_folder, item.key, item.conversation['start'], item.conversation['end']))
+    if cache:
+        print(cache.summary())
+    metrics.checkpoint('extract')
+
+    folders, lab, concurrency = sweep(intervals)
+    metrics.checkpoint('sweep')
+
+    print(f"\nConversations on the timeline: {len(intervals)} ({untimed} without create_time)")
+
+    print(f"\nBy CSN folder:")
+    for csn in sorted(folders.keys(), key=lambda c: (len(c), c)):
+        timeline = folders[csn]
+        print(f"  {csn:6s} {timeline['conversations']:3d} conversations, busy "
+              f"{_format_duration(timeline['busy_seconds'])}, peak {timeline['peak']} at "
+              f"{_format_time(timeline['peak_time'])}, {len(timeline['idle_gaps'])} idle gaps, "
+              f"{len(timeline['overlaps'])} overlapping pairs")
+
+    overlapping = {csn: t['overlaps'] for csn, t in folders.items() if t['overlaps']}
+    if overlapping:
+        print(f"\nOverlapping conversations on the same computer:")
+        for csn in sorted(overlapping.keys(), key=lambda c: (len(c), c)):
+            for a, b, seconds in overlapping[csn]:
+                print(f"  {csn:6s} {a} / {b}  {_format_duration(seconds)}")
+
+    print(f"\n{'='*80}")
+    print(f"WHOLE LAB")
+    print(f"{'='*80}")
+    print(f"Peak concurrency: {lab['peak']} conversations at {_format_time(lab['peak_time'])}")
+    print(f"Busy: {_format_duration(lab['busy_seconds'])}, {len(lab['idle_gaps'])} idle gaps")
+    for start, end in describe(lab)['longest_idle_gaps']:
+        print(f"  idle {_format_time(start)} - {_format_time(end)} ({_format_duration(end - start)})")
+    metrics.checkpoint('report')
+
+    # Overlaps are only meaningful on one computer
+    lab_report = describe(lab)
+    del lab_report['overlaps']
+    output = {
+        'analysis_date': datetime.now().isoformat(),
+        'total_conversations': len(intervals),
+        'without_create_time': untimed,
+        'lab': lab_report,
+        'by_csn': {csn: describe(folders[csn]) for csn in sorted(folders.keys(), key=lambda c: (len(c), c))}
+    }
+    with open('session_timeline.json', 'w', encoding='utf-8') as f:
+        json.dump(output, f, indent=2, ensure_ascii=False)
+
+    if csv_path:
+        # One row per conversation in start order; times are epoch seconds
+        with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['csn_folder', 'conversation_id', 'start', 'end', 'csn_concurrency', 'lab_concurrency'])
+            for csn_folder, conv_id, start, end in sorted(intervals, key=lambda r: (r[2], r[3], r[1])):
+                writer.writerow([csn_folder, conv_id, int(start), int(end), *concurrency[conv_id]])
+        print(f"\nTimeline CSV saved to: {csv_path}")
+    metrics.checkpoint('write')
+
+    print(f"\nTimeline report saved to: session_timeline.json")
+    return output
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Session concurrency and idle gaps per CSN computer')
+    parser.add_argument('--csv', nargs='?', const='session_timeline.csv', metavar='FILE',
+                        help='also write one row per conversation (default file: session_timeline.csv)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='re-parse every source instead of reusing .cache/ results')
+    metrics.add_argument(parser, 'session_timeline')
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable(args.metrics)
+
+    main(use_cache=not args.no_cache, csv_path=args.csv)
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Generate synthetic ChatGPT exports shaped like data/ for benchmarking
+
+Writes CSN1..CSNn folders, each with conversations.json (mapping trees with
+occasional regenerated branches), chat.html embedding the same conversations
+as `var jsonData = [...]` (HTML-escaped, so it is not byte-identical to the
+JSON), model_comparisons.json, message_feedback.json and user.json.
+Conversations are streamed to disk, so memory stays flat at any size.
+
+A session is one participant at one study time slot; --id-rate is the share
+of sessions that state their participant ID (DDMMYYYY_HHMM_N), in the same
+mix of forms found in the real export.
+
+Usage:
+    python synthetic_export.py OUT_DIR --conversations 100000 [--folders 22]
+                               [--id-rate 0.6] [--seed 0]
+"""
+import argparse
+import json
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+FIRST_STUDY_DAY = datetime(2024, 11, 28)
+SESSION_TIMES = ['0930', '1000', '1115', '1200', '1230', '1345', '1500', '1615']
+
+PROMPTS = [
+    "what is to like in esperanto?",
+    "how do you say good morning in esperanto",
+    "tell me about esperanto",
+    "what is the accusative in esperanto",
+    "translate 'the boy is reading a book' into esperanto",
+    "la knabo legas libron - is this correct?",
+    "what is the infinitive in language",
+    "explain the -ej suffix",
+]
+WORDS = ("la estas kaj de en al por kun sed ne mi vi li ŝi ni ili esperanto vorto "
+         "lingvo frazo verbo substantivo akuzativo finaĵo lerni paroli legi skribi").split()
+REPLIES = ["Got it! How can I assist you with this ID?", "Noted! How can I assist you further?"]
+
+HTML_HEAD = """<html>
+  <head>
+    <title>ChatGPT Data Export</title>
+    <script>
+      var jsonData = """
+HTML_TAIL = """;
+    </script>
+  </head>
+  <body>
+    <div id="root"></div>
+  </body>
+</html>
+"""
+
+
+def _uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def participant_id_text(rng, pid, time_slot):
+    """Render a participant ID the way participants typed them"""
+    roll = rng.random()
+    if roll < 0.6:
+        return f"My ID is {pid}"
+    if roll < 0.8:
+        return pid
+    if roll < 0.9:
+        return f"ID is {pid}"
+    if roll < 0.95 and time_slot.startswith('0'):
+        return f"my id is {pid.replace('_' + time_slot, '_' + time_slot[1:])}"
+    return f"My ID is {pid}{rng.randint(1000000, 9999999)}"
+
+
+def make_conversation(rng, created, first_text, turns, words):
+    """Build one conversation dict with a ChatGPT-style mapping tree"""
+    mapping = {}
+
+    def add(parent, role, text, at):
+        node_id = _uuid(rng)
+        message = None
+        if role:
+            message = {
+                'id': node_id,
+                'author': {'role': role, 'name': None, 'metadata': {}},
+                'create_time': at,
+                'update_time': None,
+                'content': {'content_type': 'text', 'parts': [text]},
+                'status': 'finished_successfully',
+                'end_turn': True if role == 'assistant' else None,
+                'weight': 1.0,
+                'metadata': {},
+                'recipient': 'all',
+                'channel': None
+            }
+        mapping[node_id] = {'id': node_id, 'message': message, 'parent': parent, 'children': []}
+        if parent:
+            mapping[parent]['children'].append(node_id)
+        return node_id
+
+    node = add(None, None, None, None)
+    node = add(node, 'system', '', None)
+    at = created
+    for turn in range(turns):
+        text = first_text if turn == 0 and first_text else rng.choice(PROMPTS)
+        node = add(node, 'user', text, at)
+        at += rng.uniform(1, 5)
+        reply = rng.choice(REPLIES) if turn == 0 and first_text else _sentence(rng, words)
+        if rng.random() < 0.1:
+            # A regenerated answer leaves the first reply as a side branch
+            add(node, 'assistant', _sentence(rng, words), at)
+            at += rng.uniform(1, 5)
+        node = add(node, 'assistant', reply, at)
+        at += rng.uniform(20, 120)
+
+    conv_id = _uuid(rng)
+    return {
+        'title': first_text if first_text and len(first_text) < 40 else rng.choice(PROMPTS)[:40],
+        'create_time': created,
+        'update_time': at,
+        'mapping': mapping,
+        'moderation_results': [],
+        'current_node': node,
+        'plugin_ids': None,
+        'conversation_id': conv_id,
+        'conversation_template_id': None,
+        'gizmo_id': None,
+        'gizmo_type': None,
+        'is_archived': rng.random() < 0.5,
+        'is_starred': None,
+        'safe_urls': [],
+        'default_model_slug': 'gpt-4o',
+        'conversation_origin': None,
+        'voice': None,
+        'async_status': None,
+        'disabled_tool_ids': [],
+        'id': conv_id
+    }
+
+
+def _comparison(rng, conv, user_id):
+    messages = [n['message'] for n in conv['mapping'].values() if n['message']]
+    turn = messages[-1]
+    return {
+        'id': _uuid(rng),
+        'conversation_id': conv['conversation_id'],
+        'user_id': user_id,
+        'create_time': _isoformat(conv['update_time']),
+        'workspace_id': None,
+        'content': {
+            'input': {'prompt_convo': {'id': conv['conversation_id'], 'messages': messages[:-1]}},
+            'output': {'feedback_step_2': {
+                'original_turn': [turn],
+                'new_turn': [dict(turn, id=_uuid(rng))],
+                'completion_comparison_rating': rng.choice(['new', 'original', 'skip']),
+                'new_completion_placement': rng.choice(['left', 'right']),
+                'frontend_submission_time': int(conv['update_time'] * 1000)
+            }}
+        }
+    }
+
+
+def _feedback(rng, conv, user_id):
+    return {
+        'id': _uuid(rng),
+        'conversation_id': conv['conversation_id'],
+        'user_id': user_id,
+        'rating': rng.choice(['thumbsUp', 'thumbsDown']),
+        'create_time': _isoformat(conv['update_time']),
+        'workspace_id': None,
+        'content': '{}',
+        'storage_protocol': None,
+        'evaluation_name': None,
+        'evaluation_treatment': None
+    }
+
+
+def _isoformat(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def _html_escape(payload):
+    return payload.replace('&', '\\u0026').replace('<', '\\u003c').replace('>', '\\u003e')
+
+
+def generate_folder(folder_dir, folder_no, conversations, rng, id_rate=0.6,
+                    turns=(1, 4), words=40, comparison_rate=0.01, feedback_rate=0.01):
+    """Write one CSN folder holding the given number of conversations"""
+    os.makedirs(folder_dir, exist_ok=True)
+    user_id = 'user-' + uuid.UUID(int=rng.getrandbits(128)).hex[:24]
+    comparisons = []
+    feedback = []
+    session = -1
+
+    with open(os.path.join(folder_dir, 'conversations.json'), 'w', encoding='utf-8') as json_file, \
+            open(os.path.join(folder_dir, 'chat.html'), 'w', encoding='utf-8') as html_file:
+        json_file.write('[')
+        html_file.write(HTML_HEAD + '[')
+
+        for i in range(conversations):
+            first_text = None
+            if i == 0 or rng.random() < 0.4:
+                # A new participant sits down at the next session slot
+                session += 1
+                day = FIRST_STUDY_DAY + timedelta(days=session // len(SESSION_TIMES))
+                time_slot = SESSION_TIMES[session % len(SESSION_TIMES)]
+                start = day + timedelta(hours=int(time_slot[:2]), minutes=int(time_slot[2:]))
+                created = start.timestamp()
+                if rng.random() < id_rate:
+                    pid = f"{day:%d%m%Y}_{time_slot}_{folder_no}"
+                    first_text = participant_id_text(rng, pid, time_slot)
+            created += rng.uniform(30, 600)
+
+            conv = make_conversation(rng, created, first_text, rng.randint(*turns), words)
+            payload = json.dumps(conv)
+            separator = ', ' if i else ''
+            json_file.write(separator + payload)
+            html_file.write(separator + _html_escape(payload))
+
+            if rng.random() < comparison_rate:
+                comparisons.append(_comparison(rng, conv, user_id))
+            if rng.random() < feedback_rate:
+                feedback.append(_feedback(rng, conv, user_id))
+
+        json_file.write(']')
+        html_file.write(']' + HTML_TAIL)
+
+    with open(os.path.join(folder_dir, 'model_comparisons.json'), 'w', encoding='utf-8') as f:
+        json.dump(comparisons, f)
+    with open(os.path.join(folder_dir, 'message_feedback.json'), 'w', encoding='utf-8') as f:
+        json.dump(feedback, f)
+    with open(os.path.join(folder_dir, 'user.json'), 'w', encoding='utf-8') as f:
+        json.dump({'id': user_id, 'email': f"uksurveycsn{folder_no:02d}@gmail.com",
+                   'chatgpt_plus_user': True, 'birth_year': rng.randint(1995, 2006)}, f)
+
+
+def generate_export(out_dir, conversations, folders=22, id_rate=0.6, seed=0, **options):
+    """Write a synthetic export of `conversations` conversations spread over CSN folders"""
+    rng = random.Random(seed)
+    for folder_no in range(1, folders + 1):
+        count = conversations // folders + (1 if folder_no <= conversations % folders else 0)
+        generate_folder(os.path.join(out_dir, f"CSN{folder_no}"), folder_no, count, rng, id_rate, **options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic ChatGPT export for benchmarks')
+    parser.add_argument('out_dir')
+    parser.add_argument('--conversations', type=int, default=1000)
+    parser.add_argument('--folders', type=int, default=22)
+    parser.add_argument('--id-rate', type=float, default=0.6,
+                        help='share of sessions that state a participant ID (default: 0.6)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    generate_export(args.out_dir, args.conversations, args.folders, args.id_rate, args.seed)
+    print(f"Wrote {args.conversations} conversations in {args.folders} folders to {args.out_dir} "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Tests for the streaming JSON array reader
+
+Usage:
+    python -m pytest test_chatgpt_export.py
+"""
+import io
+import json
+import unittest
+
+from chatgpt_export import iter_json_array
+
+MIXED = [12.5, 1.25, 2, -3e-7, 1E+21, 0, -0.5, True, False, None, "a, b]", "", [1, [2.75]],
+         {"x": 10.125, "y": [None, "\\u00e9"]}, 123456789012345678901234567890, 6.02e23]
+
+
+class IterJsonArrayTest(unittest.TestCase):
+
+    def read(self, text, chunk_size):
+        return list(iter_json_array(io.StringIO(text), chunk_size))
+
+    def test_numbers_split_across_chunks(self):
+        for text, expected in [('[12.5]', [12.5]), ('[1.25, 2]', [1.25, 2])]:
+            for chunk_size in range(1, len(text) + 2):
+                with self.subTest(text=text, chunk_size=chunk_size):
+                    self.assertEqual(self.read(text, chunk_size), expected)
+
+    def test_mixed_array_at_every_small_chunk_size(self):
+        for separator in (',', ', ', ' ,\n  '):
+            text = '[' + separator.join(json.dumps(value) for value in MIXED) + ']'
+            for chunk_size in range(1, 17):
+                with self.subTest(separator=separator, chunk_size=chunk_size):
+                    self.assertEqual(self.read(text, chunk_size), MIXED)
+
+    def test_empty_inputs(self):
+        for text in ('', '  \n', '[]', ' [ ] '):
+            for chunk_size in (1, 2, 64):
+                self.assertEqual(self.read(text, chunk_size), [])
+
+    def test_malformed_arrays_raise(self):
+        for text in ('[1 2]', '[1,', '{"a": 1}', '[12.]', '[1e]'):
+            for chunk_size in (1, 3, 64):
+                with self.subTest(text=text, chunk_size=chunk_size):
+                    with self.assertRaises(json.JSONDecodeError):
+                        self.read(text, chunk_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared participant ID scanner
+
+Usage:
+    python -m pytest test_participant_id_scanner.py
+"""
+import unittest
+
+from participant_id_scanner import (EMAIL, EMBEDDED_ID, EXPLICIT_ID, MENTIONED_ID, STATED_ID,
+                                    first_participant_id, participant_ids, scan)
+
+
+class ScanTest(unittest.TestCase):
+
+    def kinds(self, text):
+        return [(m.kind, m.value) for m in scan(text)]
+
+    def test_stated_ids_in_any_case(self):
+        for text, kind in [('My ID is 01122024_1000_17', EXPLICIT_ID),
+                           ('MY ID IS 01122024_1000_17', EXPLICIT_ID),
+                           ('my id is 01122024_1000_17', EXPLICIT_ID),
+                           ('Id Is 01122024_1000_17', STATED_ID),
+                           ('ID is 01122024_1000_17', STATED_ID)]:
+            with self.subTest(text=text):
+                self.assertEqual(self.kinds(text), [(kind, '01122024_1000_17')])
+
+    def test_mentioned_and_embedded_ids(self):
+        self.assertEqual(self.kinds('see 01122024_1000_17, then 20679508_03122024_1757_11'),
+                         [(MENTIONED_ID, '01122024_1000_17'),
+                          (EMBEDDED_ID, '03122024_1757_11')])
+
+    def test_offsets_point_at_the_id(self):
+        text = 'My ID is 01122024_1000_17.'
+        [match] = scan(text)
+        self.assertEqual(text[match.start:match.end], '01122024_1000_17')
+
+    def test_malformed_time(self):
+        [short] = scan('01122024_930_4')
+        [full] = scan('01122024_0930_4')
+        self.assertTrue(short.malformed)
+        self.assertFalse(full.malformed)
+
+    def test_email(self):
+        self.assertEqual(self.kinds('mail uksurveycsn12@gmail.com'), [(EMAIL, 'uksurveycsn12@gmail.com')])
+
+
+class ParticipantIdsTest(unittest.TestCase):
+
+    def test_malformed_only_when_stated(self):
+        self.assertEqual(participant_ids('ID is 01122024_930_4 and 02122024_930_5'), {'01122024_930_4'})
+
+    def test_skips_embedded_ids_and_emails(self):
+        self.assertEqual(participant_ids('x01122024_1000_17 uksurveycsn1@gmail.com'), set())
+
+    def test_first_participant_id_prefers_my_id_is(self):
+        text = 'ref 03122024_1100_2, ID is 02122024_1000_1, MY ID IS 01122024_0900_3'
+        self.assertEqual(first_participant_id(text), '01122024_0900_3')
+        self.assertEqual(first_participant_id('ref 03122024_1100_2, id is 02122024_1000_1'),
+                         '02122024_1000_1')
+        self.assertEqual(first_participant_id('ref 03122024_1100_2'), '03122024_1100_2')
+        self.assertIsNone(first_participant_id('no id here'))
+
+
+if __name__ == '__main__':
+    unittest.main()